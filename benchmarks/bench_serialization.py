@@ -0,0 +1,66 @@
+"""
+Compare the default and fast-path serialization of item list pages.
+
+The default path loads ORM objects, validates them into ``schemas.Item`` and
+JSON-encodes the result via ``jsonable_encoder``; the fast path selects
+column tuples and dumps them with the precompiled ``item_list_adapter``.
+
+Usage:
+    python -m benchmarks.bench_serialization [--repeat 200]
+"""
+
+import argparse
+import json
+import timeit
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from py_api_framework import schemas
+from py_api_framework.database import Base
+from py_api_framework.models import Item
+from py_api_framework.serialization import ITEM_COLUMNS, item_list_adapter, item_records
+
+PAGE_SIZES = (10, 100, 1000)
+
+item_schema_adapter = TypeAdapter(List[schemas.Item])
+
+def seed(session: Session, count: int) -> None:
+    session.add_all(
+        Item(title=f"Item {i}", description=f"Description for item {i}", owner_id=1)
+        for i in range(count)
+    )
+    session.commit()
+
+def default_path(session: Session, limit: int) -> bytes:
+    items = session.scalars(select(Item).order_by(Item.id).limit(limit)).all()
+    validated = item_schema_adapter.validate_python(items, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+def fast_path(session: Session, limit: int) -> bytes:
+    rows = session.execute(select(*ITEM_COLUMNS).order_by(Item.id).limit(limit)).all()
+    return item_list_adapter.dump_json(item_records(rows))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        seed(session, max(PAGE_SIZES))
+        print(f"{'page':>6} {'default ms':>12} {'fast ms':>10} {'speedup':>8}")
+        for limit in PAGE_SIZES:
+            assert json.loads(default_path(session, limit)) == json.loads(fast_path(session, limit))
+            default = timeit.timeit(lambda: default_path(session, limit), number=args.repeat)
+            fast = timeit.timeit(lambda: fast_path(session, limit), number=args.repeat)
+            print(
+                f"{limit:>6} {default / args.repeat * 1000:>12.3f} "
+                f"{fast / args.repeat * 1000:>10.3f} {default / fast:>7.1f}x"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Load-test the API and compare the results against a stored baseline.
+
+Seeds a fresh SQLite database with ``--users`` users and ``--items`` items,
+then drives each scenario (register, token, ``/auth/me``, item CRUD and list
+pages at several offsets) with ``--concurrency`` concurrent clients, either
+in-process through the ASGI ``app`` or against a real uvicorn server started
+on a free port. Reports requests per second and p50/p95/p99 latency.
+
+Usage:
+    python -m benchmarks.load_test [--mode inprocess|server] [--output results.json]
+    python -m benchmarks.load_test --baseline baseline.json --threshold 0.2
+
+With ``--baseline``, exits non-zero if any scenario's p95 latency rose, or its
+throughput fell, by more than ``--threshold`` (a fraction) versus the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+PASSWORD = "benchpassword"
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+def configure_environment(db_path: str) -> None:
+    """Point the application at a scratch database before it is imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("ENVIRONMENT", "benchmark")
+    os.environ.setdefault("DEBUG", "false")
+    # Measure the handlers, not the limiter turning the load away
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+def seed(users: int, items: int) -> None:
+    """Create tables, ``users`` users sharing one password hash and ``items`` items."""
+    from sqlalchemy import insert
+    from py_api_framework import models
+    from py_api_framework.auth import get_password_hash
+    from py_api_framework.database import engine, init_db
+
+    init_db()
+    hashed = get_password_hash(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": hashed}
+            for i in range(users)
+        ])
+        conn.execute(insert(models.Item), [
+            {"title": f"Item {i}", "description": f"Seeded item {i}", "owner_id": 1 + i % users}
+            for i in range(items)
+        ])
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    requests: int,
+    concurrency: int,
+    make_request: Callable[[int], Request],
+    on_response: Optional[Callable[[httpx.Response], None]] = None
+) -> Dict[str, Any]:
+    """Send ``requests`` requests from ``concurrency`` workers and summarize latency."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for index in counter:
+            method, url, kwargs = make_request(index)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            elif on_response is not None:
+                on_response(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+async def run_all(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """Run every scenario in order and return results keyed by scenario name."""
+    api = "/api/v1"
+    results: Dict[str, Dict[str, Any]] = {}
+    run_id = int(time.time())
+
+    response = await client.post(
+        f"{api}/auth/token", data={"username": "user0", "password": PASSWORD}
+    )
+    response.raise_for_status()
+    auth = {"headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+    created: List[int] = []
+
+    scenarios: List[Tuple[str, int, Callable[[int], Request], Optional[Callable[[httpx.Response], None]]]] = [
+        ("register", args.auth_requests, lambda i: ("POST", f"{api}/auth/register", {"json": {
+            "username": f"bench{run_id}_{i}", "email": f"bench{run_id}_{i}@example.com",
+            "password": PASSWORD,
+        }}), None),
+        ("token", args.auth_requests, lambda i: ("POST", f"{api}/auth/token", {
+            "data": {"username": f"user{i % args.users}", "password": PASSWORD},
+        }), None),
+        ("me", args.requests, lambda i: ("GET", f"{api}/auth/me", auth), None),
+        ("item_create", args.requests, lambda i: ("POST", f"{api}/items/", {
+            "json": {"title": f"Bench {i}", "description": "load test"}, **auth,
+        }), lambda r: created.append(r.json()["id"])),
+        ("item_read", args.requests, lambda i: (
+            "GET", f"{api}/items/{created[i % len(created)]}", auth
+        ), None),
+        ("item_update", args.requests, lambda i: ("PUT", f"{api}/items/{created[i % len(created)]}", {
+            "json": {"title": f"Updated {i}"}, **auth,
+        }), None),
+    ]
+    for offset in sorted({0, args.items // 2, max(args.items - args.page_size, 0)}):
+        scenarios.append((f"list_offset_{offset}", args.requests, lambda i, offset=offset: (
+            "GET", f"{api}/items/", {"params": {"skip": offset, "limit": args.page_size}, **auth}
+        ), None))
+    scenarios.append(("list_cursor_first_page", args.requests, lambda i: (
+        "GET", f"{api}/items/", {"params": {"cursor": "", "limit": args.page_size}, **auth}
+    ), None))
+    scenarios.append(("item_delete", args.requests, lambda i: (
+        "DELETE", f"{api}/items/{created[i]}", auth
+    ), None))
+
+    for name, count, make_request, on_response in scenarios:
+        if name == "item_delete":
+            count = min(count, len(created))
+        result = await run_scenario(client, count, args.concurrency, make_request, on_response)
+        results[name] = result
+        print(
+            f"{name:<24} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+            f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}"
+        )
+    return results
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int) -> subprocess.Popen:
+    """Start uvicorn on ``port`` and wait until ``/health`` answers."""
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "py_api_framework.main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ])
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy within 30s")
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    print(f"{'scenario':<24} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.mode == "server":
+        process = start_server(free_port())
+        try:
+            base_url = f"http://127.0.0.1:{process.args[process.args.index('--port') + 1]}"
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                return await run_all(client, args)
+        finally:
+            process.terminate()
+            process.wait()
+    from py_api_framework.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", limits=limits, timeout=60
+    ) as client:
+        return await run_all(client, args)
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float
+) -> List[str]:
+    """Return a description of every scenario that regressed beyond ``threshold``."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+        if result["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']:.1f} -> {result['rps']:.1f}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=("inprocess", "server"), default="inprocess")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument(
+        "--auth-requests", type=int, default=50,
+        help="requests for the bcrypt-bound register and token scenarios"
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(os.path.join(tmp, "bench.db"))
+        seed(args.users, args.items)
+        results = asyncio.run(benchmark(args))
+
+    report = {
+        "meta": {
+            "mode": args.mode,
+            "users": args.users,
+            "items": args.items,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [name for name, result in results.items() if result["errors"]]
+    if failed:
+        print(f"Scenarios with errors: {', '.join(failed)}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
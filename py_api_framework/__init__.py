@@ -5,6 +5,11 @@ A lightweight FastAPI-inspired REST API framework with automatic validation,
 built-in security, and OpenAPI documentation.
 """
 
+import time
+
+# Taken before any submodule is imported; main.py reports app import time from it
+_import_started = time.perf_counter()
+
 __version__ = "0.1.0"
 __author__ = "KM Fazle Rabbi"
 __email__ = "contact@kmfazle.dev"
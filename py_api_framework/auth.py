@@ -1,28 +1,104 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .config import settings
-from .database import get_db
+from .database import get_read_db
+from .cache import TTLCache
+from .hashing import hash_pool, pwd_context
+from .metrics import AUTH_LATENCY, observe_duration
 from .models import User
-from .schemas import TokenData
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .schemas import TokenData, User as UserSchema
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token")
 
+class UserCache:
+    """Cache of authenticated users keyed by token subject (username).
+
+    Entries live in a local TTL/LRU cache and, when ``shared`` is given, in a
+    shared store (any object with ``get``/``set``/``delete``, e.g. another
+    ``TTLCache`` or a Redis wrapper) so other workers can skip the lookup too.
+    Only the public ``schemas.User`` fields are cached, never the hash.
+
+    ``invalidate`` reaches this process and the shared store, not the local
+    caches of other workers, which keep serving an evicted user until their
+    entry expires after ``USER_CACHE_TTL_SECONDS``.
+    """
+
+    def __init__(self, local: TTLCache, shared: Optional[Any] = None):
+        self.local = local
+        self.shared = shared
+
+    @staticmethod
+    def _shared_key(username: str) -> str:
+        return f"user:{username}"
+
+    def get(self, username: str) -> Optional[UserSchema]:
+        """Return the cached user, consulting the shared store on a local miss."""
+        user = self.local.get(username)
+        if user is None and self.shared is not None:
+            raw = self.shared.get(self._shared_key(username))
+            if raw is not None:
+                user = UserSchema.model_validate_json(raw)
+                self.local.set(username, user)
+        return user
+
+    def set(self, user: UserSchema) -> None:
+        """Cache ``user`` locally and in the shared store."""
+        self.local.set(user.username, user)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(user.username), user.model_dump_json(), self.local.ttl)
+
+    def invalidate(self, username: str) -> None:
+        """Drop ``username`` so the next request reloads it from the database."""
+        self.local.delete(username)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(username))
+
+    def clear(self) -> None:
+        """Drop every locally cached user."""
+        self.local.clear()
+
+# Authenticated-user and decoded-token caches
+user_cache = UserCache(
+    TTLCache(max_size=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+)
+token_cache = TTLCache(max_size=settings.TOKEN_CACHE_MAX_SIZE)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper: Any, connection: Any, target: User) -> None:
+    """Evict a user from the cache whenever the ORM updates or deletes it."""
+    user_cache.invalidate(target.username)
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        user_cache.invalidate(old_username)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    with observe_duration(AUTH_LATENCY, "verify_password"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    return pwd_context.hash(password)
+    with observe_duration(AUTH_LATENCY, "hash_password"):
+        return pwd_context.hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and, if its hash is off the current policy, rehash it."""
+    with observe_duration(AUTH_LATENCY, "verify_password"):
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the hashing pool, off the event loop."""
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing pool, off the event loop."""
+    return await hash_pool.run(get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
@@ -37,21 +113,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[str]:
-    """Verify and decode a JWT token."""
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    """Verify and decode a JWT token.
+
+    Successfully decoded tokens are cached until their ``exp`` so repeated
+    requests with the same token skip signature verification.
+    """
+    with observe_duration(AUTH_LATENCY, "verify_token"):
+        username = token_cache.get(token)
+        if username is not None:
+            return username
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            username = payload.get("sub")
+            if username is None:
+                return None
+            expires_at = payload.get("exp")
+            if expires_at is not None:
+                ttl = expires_at - datetime.now(timezone.utc).timestamp()
+                token_cache.set(token, username, ttl=ttl)
+            return username
+        except JWTError:
             return None
-        return username
-    except JWTError:
-        return None
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user."""
+    db: AsyncSession = Depends(get_read_db)
+) -> UserSchema:
+    """Get the current authenticated user, served from the user cache when possible."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -61,24 +149,61 @@ async def get_current_user(
     username = verify_token(token)
     if username is None:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+
+    cached_user = user_cache.get(username)
+    if cached_user is not None:
+        return cached_user
+
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
-    
-    return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+    current_user = UserSchema.model_validate(user)
+    user_cache.set(current_user)
+    return current_user
+
+async def get_current_active_user(current_user: UserSchema = Depends(get_current_user)) -> UserSchema:
     """Get the current active user."""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate a user with username and password."""
-    user = db.query(User).filter(User.username == username).first()
+async def get_websocket_user(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+) -> UserSchema:
+    """Authenticate a WebSocket through ``get_current_active_user``.
+
+    Browsers cannot set headers on WebSockets, so the bearer token may also
+    come from the ``token`` query parameter. Failures close the handshake
+    with a policy-violation code instead of an HTTP error.
+    """
+    scheme, _, header_token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and header_token:
+        token = header_token
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    try:
+        return await get_current_active_user(await get_current_user(token, db))
+    except HTTPException as exc:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=exc.detail) from exc
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """Authenticate a user with username and password.
+
+    A hash made under an older cost policy is replaced on the returned user;
+    the caller's commit persists it.
+    """
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await hash_pool.run(verify_and_update_password, password, user.hashed_password)
+    if not verified:
         return None
+    if new_hash is not None:
+        # Flushed with the caller's next commit, not as a round-trip of its own
+        user.hashed_password = new_hash
     return user 
\ No newline at end of file
@@ -0,0 +1,292 @@
+"""
+Item change feed.
+
+Item writes publish ``created``/``updated``/``deleted`` events to ``broker``.
+The items router streams each owner's events over Server-Sent Events
+(``GET /items/changes``) and WebSockets (``/items/changes/ws``), so
+dashboards can follow changes instead of polling ``/items/my-items``.
+
+* Every event carries a feed-wide sequence number. The last
+  ``CHANGE_FEED_HISTORY`` events are retained, so a reconnecting client
+  passes ``Last-Event-ID`` (SSE) or ``since`` and first receives what it
+  missed.
+* Each connection buffers at most ``CHANGE_FEED_BUFFER`` events. Publishers
+  never wait for slow consumers: when a buffer fills up it is emptied and
+  the client gets a single ``reset`` event, meaning "refetch, then continue
+  from this sequence number". Resuming from further back than the retained
+  history also yields ``reset``.
+* ``LocalChangeBackend`` numbers and fans out events in-process (one feed
+  per worker). With ``CHANGE_FEED_REDIS_URL`` set, ``RedisChangeBackend``
+  numbers and publishes them through Redis, so every worker's subscribers
+  see every worker's writes.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+from starlette.websockets import WebSocket
+from .config import settings
+from .schemas import Item as ItemSchema
+
+RESET = "reset"
+
+class Subscription:
+    """One connection's bounded event queue for a single owner.
+
+    Owned by the event loop that created it; ``offer_threadsafe`` hands over
+    events published from other threads or loops.
+    """
+
+    def __init__(self, owner_id: int, buffer: int):
+        self.owner_id = owner_id
+        self.loop = asyncio.get_running_loop()
+        self._queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=buffer + 1)
+        self._buffer = buffer
+        self._reset_seq: Optional[int] = None
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        """Queue ``event``, or turn the backlog into a reset once the buffer is full."""
+        if self._reset_seq is not None:
+            self._reset_seq = max(self._reset_seq, event["seq"])
+        elif self._queue.qsize() >= self._buffer:
+            self.reset(event["seq"])
+        else:
+            self._queue.put_nowait(event)
+
+    def offer_threadsafe(self, event: Dict[str, Any]) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.offer(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.offer, event)
+        except RuntimeError:
+            # The subscriber's loop has closed; it is about to unsubscribe
+            pass
+
+    def reset(self, seq: int) -> None:
+        """Drop everything queued and tell the consumer to resynchronize at ``seq``."""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._reset_seq = seq
+        self._queue.put_nowait(None)
+
+    async def get(self) -> Dict[str, Any]:
+        """Wait for the next event (or ``reset``)."""
+        event = await self._queue.get()
+        if event is None:
+            seq, self._reset_seq = self._reset_seq, None
+            return {"seq": seq, "type": RESET}
+        return event
+
+class LocalChangeBackend:
+    """Numbers events in-process and delivers them straight to the broker."""
+
+    def __init__(self):
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    async def start(self, broker: "ChangeBroker") -> None:
+        """Nothing to start; events never leave the process."""
+
+    async def publish(self, broker: "ChangeBroker", events: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for event in events:
+                self._seq += 1
+                broker.deliver({"seq": self._seq, **event})
+
+    async def close(self) -> None:
+        """Nothing to release."""
+
+# INCR and PUBLISH in one script, so every worker receives events in sequence order
+PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', KEYS[2], seq .. ' ' .. ARGV[1])
+return seq
+"""
+
+class RedisChangeBackend:
+    """Numbers events with a Redis counter and fans them out over pub/sub.
+
+    ``client`` is a ``redis.asyncio.Redis`` (or any object with the same
+    ``pipeline``/``pubsub`` API). Each worker subscribes on its first feed
+    connection and delivers what it receives to its local broker.
+    """
+
+    def __init__(self, client: Any, prefix: str = "changes:"):
+        self.client = client
+        self.seq_key = prefix + "seq"
+        self.channel = prefix + "events"
+        self._pubsub: Optional[Any] = None
+        self._listener: Optional["asyncio.Task[None]"] = None
+
+    async def start(self, broker: "ChangeBroker") -> None:
+        if self._pubsub is not None:
+            return
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(broker))
+
+    async def _listen(self, broker: "ChangeBroker") -> None:
+        assert self._pubsub is not None
+        async for message in self._pubsub.listen():
+            if message["type"] != "message":
+                continue
+            data = message["data"]
+            if isinstance(data, bytes):
+                data = data.decode()
+            seq, _, payload = data.partition(" ")
+            broker.deliver({"seq": int(seq), **json.loads(payload)})
+
+    async def publish(self, broker: "ChangeBroker", events: List[Dict[str, Any]]) -> None:
+        pipe = self.client.pipeline()
+        for event in events:
+            pipe.eval(PUBLISH_SCRIPT, 2, self.seq_key, self.channel, json.dumps(event))
+        await pipe.execute()
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            self._pubsub = None
+
+class ChangeBroker:
+    """Retains recent events and fans them out to per-owner subscriptions."""
+
+    def __init__(self, backend: Any, history: int = 1000, buffer: int = 256):
+        self.backend = backend
+        self.buffer = buffer
+        self.last_seq = 0
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    async def publish(self, owner_id: int, change_type: str, items: List[Dict[str, Any]]) -> None:
+        """Publish one ``change_type`` event per item payload."""
+        if items:
+            await self.backend.publish(self, [
+                {"type": change_type, "owner_id": owner_id, "item": item} for item in items
+            ])
+
+    async def publish_items(self, change_type: str, db_items: List[Any]) -> None:
+        """Publish ``created``/``updated`` events carrying the full items."""
+        by_owner: Dict[int, List[Dict[str, Any]]] = {}
+        for db_item in db_items:
+            payload = ItemSchema.model_validate(db_item).model_dump(mode="json")
+            by_owner.setdefault(db_item.owner_id, []).append(payload)
+        for owner_id, items in by_owner.items():
+            await self.publish(owner_id, change_type, items)
+
+    async def publish_deleted(self, owner_id: int, item_ids: List[int]) -> None:
+        await self.publish(owner_id, "deleted", [{"id": item_id} for item_id in item_ids])
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        """Record a numbered event and hand it to its owner's subscriptions."""
+        with self._lock:
+            self.last_seq = max(self.last_seq, event["seq"])
+            self._history.append(event)
+            subscriptions = list(self._subscribers.get(event["owner_id"], ()))
+        for subscription in subscriptions:
+            subscription.offer_threadsafe(event)
+
+    async def subscribe(self, owner_id: int, since: Optional[int] = None) -> Subscription:
+        """Subscribe to ``owner_id``'s events, first replaying those after ``since``."""
+        await self.backend.start(self)
+        subscription = Subscription(owner_id, self.buffer)
+        with self._lock:
+            self._subscribers.setdefault(owner_id, set()).add(subscription)
+            if since is not None:
+                oldest = self._history[0]["seq"] if self._history else self.last_seq + 1
+                if since > self.last_seq or since < oldest - 1:
+                    subscription.reset(self.last_seq)
+                else:
+                    for event in self._history:
+                        if event["seq"] > since and event["owner_id"] == owner_id:
+                            subscription.offer(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.owner_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.owner_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+def build_backend() -> Any:
+    """Create the backend selected by ``CHANGE_FEED_REDIS_URL``."""
+    if settings.CHANGE_FEED_REDIS_URL:
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise RuntimeError(
+                "CHANGE_FEED_REDIS_URL requires the redis package: pip install 'km-pyapi[redis]'"
+            ) from exc
+        return RedisChangeBackend(redis.from_url(settings.CHANGE_FEED_REDIS_URL))
+    return LocalChangeBackend()
+
+broker = ChangeBroker(build_backend(), settings.CHANGE_FEED_HISTORY, settings.CHANGE_FEED_BUFFER)
+
+def format_sse(event: Dict[str, Any]) -> bytes:
+    data = json.dumps(event, separators=(",", ":"))
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+
+async def sse_events(
+    owner_id: int,
+    since: Optional[int],
+    heartbeat: float
+) -> AsyncIterator[bytes]:
+    """Server-Sent Events for ``owner_id``, with a comment line every ``heartbeat`` seconds."""
+    # Subscribing inside the generator ties the subscription to the response's lifetime
+    subscription = await broker.subscribe(owner_id, since)
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    # Client messages carry no meaning here; reading them is how a close is noticed
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+async def serve_websocket(
+    websocket: WebSocket,
+    owner_id: int,
+    since: Optional[int]
+) -> None:
+    """Send ``owner_id``'s events as JSON messages until the client disconnects."""
+    subscription = await broker.subscribe(owner_id, since)
+    disconnected = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        while not disconnected.done():
+            next_event = asyncio.create_task(subscription.get())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                await websocket.send_json(next_event.result())
+            else:
+                next_event.cancel()
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(subscription)
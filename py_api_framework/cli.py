@@ -1,20 +1,254 @@
 #!/usr/bin/env python3
 """
 Command-line interface for KM PyAPI Framework.
+
+    km-pyapi [dev]     Run the auto-reloading development server
+    km-pyapi serve     Run the multi-worker production server
+    km-pyapi init-db   Create the database tables and search index
+    km-pyapi calibrate-hash
+                       Choose password hash costs for this host
+    km-pyapi rebalance-shards
+                       Move items onto the shards their owners hash to
+
+The application is imported by the server (or its workers), not by this
+module, so ``km-pyapi --help`` stays fast.
 """
 
+import argparse
+import math
+import os
 import sys
-import uvicorn
-from .main import app
+from typing import Any, Dict, List, Optional
 
-def main():
-    """Run the FastAPI application."""
+def _cgroup_cpu_quota(root: str) -> Optional[float]:
+    """CPUs allowed by the cgroup v2 ``cpu.max`` or v1 CFS quota, if limited."""
+    candidates = [
+        (os.path.join(root, "cpu.max"), None),
+        (os.path.join(root, "cpu", "cpu.cfs_quota_us"), os.path.join(root, "cpu", "cpu.cfs_period_us")),
+    ]
+    for quota_path, period_path in candidates:
+        try:
+            with open(quota_path) as quota_file:
+                fields = quota_file.read().split()
+            if period_path is not None:
+                with open(period_path) as period_file:
+                    fields.append(period_file.read().strip())
+        except (OSError, ValueError):
+            continue
+        if len(fields) < 2 or fields[0] in ("max", "-1"):
+            return None
+        return int(fields[0]) / int(fields[1])
+    return None
+
+def available_cpus(cgroup_root: str = "/sys/fs/cgroup") -> int:
+    """CPUs this process may use: its affinity mask, capped by a container CPU quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota(cgroup_root)
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+def default_workers() -> int:
+    """Worker count from ``WEB_CONCURRENCY``, else the CPUs available to this process."""
+    return int(os.environ.get("WEB_CONCURRENCY", 0)) or available_cpus()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="km-pyapi", description="KM PyAPI Framework server")
+    # Accepted for compatibility: the bare command always reloads
+    parser.add_argument("--reload", action="store_true", help=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest="command")
+
+    dev = commands.add_parser("dev", help="run the auto-reloading development server")
+    dev.add_argument("--host", default="127.0.0.1")
+    dev.add_argument("--port", type=int, default=8000)
+
+    commands.add_parser("init-db", help="create the database tables and search index")
+
+    calibrate = commands.add_parser(
+        "calibrate-hash", help="choose password hash costs that fit a latency budget on this host"
+    )
+    calibrate.add_argument(
+        "--target-ms", type=float, default=None,
+        help="hash time budget (default: $PASSWORD_HASH_TARGET_MS)"
+    )
+    calibrate.add_argument(
+        "--scheme", choices=("bcrypt", "argon2"), default=None,
+        help="hash scheme (default: $PASSWORD_HASH_SCHEME)"
+    )
+    calibrate.add_argument("--samples", type=int, default=3, help="timings per measured cost")
+    calibrate.add_argument(
+        "--env-file", default=None,
+        help="write the chosen settings into this env file instead of only printing them"
+    )
+
+    rebalance = commands.add_parser(
+        "rebalance-shards", help="move items onto the shards their owners hash to",
+        description=(
+            "Move items onto the shards their owners hash to. Run `init-db` first. "
+            "Owners move in batches; each owner's writes and own-item reads are refused "
+            "with 503 while their batch moves, and global listings may miss or repeat "
+            "them until the move finishes, so run it in a maintenance window. When "
+            "draining a database with --source that an unsharded app still writes to "
+            "(e.g. the old primary), stop the app's writes for the whole run. An "
+            "interrupted run leaves owners fenced until it is run again."
+        )
+    )
+    rebalance.add_argument(
+        "--source", action="append", default=[],
+        help="another database to drain into the shards (repeatable), e.g. the old primary"
+    )
+    rebalance.add_argument("--batch-size", type=int, default=500, help="items moved per transaction")
+    rebalance.add_argument(
+        "--fence-seconds", type=float, default=5.0,
+        help="wait after fencing a batch of owners for in-flight requests to finish"
+    )
+    rebalance.add_argument(
+        "--owner-batch-size", type=int, default=100,
+        help="owners fenced and moved together (one fence wait per batch)"
+    )
+    rebalance.add_argument(
+        "--dry-run", action="store_true", help="only report which owners would move"
+    )
+
+    serve = commands.add_parser("serve", help="run the multi-worker production server")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument(
+        "--workers", type=int, default=default_workers(),
+        help="worker processes (default: $WEB_CONCURRENCY or the CPUs available to the container)"
+    )
+    serve.add_argument("--loop", choices=("auto", "uvloop", "asyncio"), default="auto")
+    serve.add_argument("--http", choices=("auto", "httptools", "h11"), default="auto")
+    serve.add_argument("--backlog", type=int, default=2048, help="listen socket backlog")
+    serve.add_argument("--keep-alive", type=int, default=5, help="keep-alive timeout in seconds")
+    serve.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="seconds to drain in-flight requests on shutdown"
+    )
+    serve.add_argument(
+        "--max-requests", type=int, default=None,
+        help="recycle a worker after this many requests"
+    )
+    serve.add_argument(
+        "--max-requests-jitter", type=int, default=0,
+        help="random extra requests per worker so they do not recycle together"
+    )
+    serve.add_argument(
+        "--preload", action="store_true",
+        help="import the app once in the parent and fork workers from it"
+    )
+    serve.add_argument(
+        "--forwarded-allow-ips", default=None,
+        help="proxies trusted for X-Forwarded-For (default: FORWARDED_ALLOW_IPS, 127.0.0.1)"
+    )
+    serve.add_argument("--log-level", default="info")
+    serve.add_argument("--no-access-log", dest="access_log", action="store_false")
+    return parser
+
+def dev(host: str = "127.0.0.1", port: int = 8000) -> None:
+    """Run the auto-reloading development server."""
+    import uvicorn
     uvicorn.run(
         "py_api_framework.main:app",
-        host="127.0.0.1",
-        port=8000,
+        host=host,
+        port=port,
         reload=True
     )
 
+def serve(args: argparse.Namespace) -> None:
+    """Run the production server described by the ``serve`` arguments."""
+    from . import server
+    from .config import settings
+    config = server.build_config(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        keep_alive=args.keep_alive,
+        graceful_timeout=args.graceful_timeout,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        log_level=args.log_level,
+        access_log=args.access_log,
+        forwarded_allow_ips=args.forwarded_allow_ips or settings.FORWARDED_ALLOW_IPS,
+    )
+    server.run(config, preload=args.preload)
+
+def init_db() -> None:
+    """Create the schema; run once per database before serving."""
+    from .database import init_db as create_schema
+    create_schema()
+    print("Database initialized")
+
+def update_env_file(path: str, values: Dict[str, Any]) -> None:
+    """Set ``values`` in the env file at ``path``, replacing existing keys in place."""
+    lines = []
+    if os.path.exists(path):
+        with open(path) as env_file:
+            lines = env_file.read().splitlines()
+    remaining = dict(values)
+    for index, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in remaining:
+            lines[index] = f"{key}={remaining.pop(key)}"
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    with open(path, "w") as env_file:
+        env_file.write("\n".join(lines) + "\n")
+
+def calibrate_hash(args: argparse.Namespace) -> None:
+    """Measure hash times and print (or write) the policy that fits the budget."""
+    from . import hashing
+    from .config import settings
+    target_ms = args.target_ms or settings.PASSWORD_HASH_TARGET_MS
+    scheme = args.scheme or settings.PASSWORD_HASH_SCHEME
+    if scheme == "argon2":
+        policy = hashing.calibrate_argon2(
+            target_ms / 1000, settings.ARGON2_MEMORY_COST, settings.ARGON2_PARALLELISM, args.samples
+        )
+    else:
+        policy = hashing.calibrate_bcrypt(target_ms / 1000, args.samples)
+    seconds = policy.pop("seconds")
+    print(f"# {scheme} hash takes {seconds * 1000:.1f} ms on this host (budget {target_ms:g} ms)")
+    for key, value in policy.items():
+        print(f"{key}={value}")
+    if args.env_file:
+        update_env_file(args.env_file, policy)
+        print(f"# written to {args.env_file}")
+
+def rebalance_shards(args: argparse.Namespace) -> None:
+    """Move owners whose items are not on the shard ``ITEM_SHARD_URLS`` assigns them."""
+    from . import sharding
+    from .config import settings
+    if not settings.ITEM_SHARD_URLS:
+        sys.exit("ITEM_SHARD_URLS is not set")
+    totals = sharding.rebalance(
+        settings.ITEM_SHARD_URLS, args.source, batch_size=args.batch_size,
+        dry_run=args.dry_run, fence_seconds=args.fence_seconds,
+        owner_batch_size=args.owner_batch_size
+    )
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {totals['items']} items of {totals['owners']} owners")
+
+def main(argv: Optional[List[str]] = None):
+    """Run the FastAPI application."""
+    args = build_parser().parse_args(argv)
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "init-db":
+        init_db()
+    elif args.command == "calibrate-hash":
+        calibrate_hash(args)
+    elif args.command == "rebalance-shards":
+        rebalance_shards(args)
+    elif args.command == "dev":
+        dev(args.host, args.port)
+    else:
+        dev()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(sys.argv[1:])
@@ -0,0 +1,237 @@
+"""
+Negotiated response compression.
+
+``CompressionMiddleware`` picks an encoding from the request's
+``Accept-Encoding`` (client q-values first, then the server preference order
+in ``COMPRESSION_ENCODINGS``). It compresses responses whose content type is
+listed in ``COMPRESSION_CONTENT_TYPES`` (exact types, so the
+``text/event-stream`` change feed is never compressed and buffered):
+
+* Complete bodies are compressed only when at least ``COMPRESSION_MIN_SIZE``
+  bytes. Bodies of 1 MiB or more are compressed on a worker thread.
+* Streamed bodies (the export endpoints) are compressed chunk by chunk with
+  a sync flush after each chunk, so clients can decode the stream as it
+  arrives.
+
+gzip is always available. brotli (``br``) and ``zstd`` are used when the
+``brotli`` / ``zstandard`` packages are installed
+(``pip install "km-pyapi[compression]"``). Responses that already carry a
+``Content-Encoding`` pass through untouched. When an encoding is negotiated,
+the ETag of every eligible response is made weak, since compressed bytes
+differ from the identity representation; 304s get the same weak form so
+the validator a client revalidates with matches the one it received.
+Compressed bytes and CPU time per encoding are exported as metrics.
+"""
+
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from .config import settings
+from .metrics import Counter, registry
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Complete bodies at least this large are compressed off the event loop
+OFFLOAD_BYTES = 1 << 20
+
+COMPRESSION_BYTES_IN = registry.register(Counter(
+    "http_compression_input_bytes_total", "Response bytes before compression.", ("encoding",)
+))
+COMPRESSION_BYTES_OUT = registry.register(Counter(
+    "http_compression_output_bytes_total", "Response bytes after compression.", ("encoding",)
+))
+COMPRESSION_CPU = registry.register(Counter(
+    "http_compression_cpu_seconds_total", "CPU time spent compressing responses.", ("encoding",)
+))
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+def available_encoders() -> Dict[str, Callable[[], Any]]:
+    """Encoder factories for every encoding whose library is installed."""
+    encoders: Dict[str, Callable[[], Any]] = {
+        "gzip": lambda: GzipEncoder(settings.COMPRESSION_GZIP_LEVEL),
+    }
+    if brotli is not None:
+        encoders["br"] = lambda: BrotliEncoder(settings.COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        encoders["zstd"] = lambda: ZstdEncoder(settings.COMPRESSION_ZSTD_LEVEL)
+    return encoders
+
+def negotiate(accept_encoding: str, preference: Sequence[str]) -> Optional[str]:
+    """Choose the encoding from ``preference`` the client weights highest."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding] = quality
+    best, best_quality = None, 0.0
+    for coding in preference:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def _timed(encoding: str, operation: Callable[[bytes], bytes], data: bytes) -> bytes:
+    start = time.thread_time()
+    result = operation(data)
+    COMPRESSION_CPU.inc(encoding, amount=time.thread_time() - start)
+    COMPRESSION_BYTES_IN.inc(encoding, amount=len(data))
+    COMPRESSION_BYTES_OUT.inc(encoding, amount=len(result))
+    return result
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses with a negotiated encoding."""
+
+    def __init__(
+        self,
+        app: Any,
+        minimum_size: int = 1024,
+        encodings: Sequence[str] = ("zstd", "br", "gzip"),
+        content_types: Sequence[str] = ("application/json",)
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+        self.preference = [coding for coding in encodings if coding in self.encoders]
+        self.content_types = frozenset(content_type.lower() for content_type in content_types)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.preference)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def eligible(self, headers: Headers, status_code: int) -> bool:
+        if status_code < 200 or status_code in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return content_type in self.content_types
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+class _CompressingResponder:
+    """Per-response state: buffers the start message until the body shape is known."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Any):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start: Optional[Dict[str, Any]] = None
+        self.encoder: Optional[Any] = None
+        self.passthrough = False
+
+    def _headers(self, content_length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        assert self.start is not None
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        _weaken_etag(headers)
+        return headers.raw
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if not self.middleware.eligible(headers, message["status"]):
+                self.passthrough = True
+                if message["status"] == 304:
+                    headers = MutableHeaders(raw=list(message["headers"]))
+                    headers.add_vary_header("Accept-Encoding")
+                    _weaken_etag(headers)
+                    message = {**message, "headers": headers.raw}
+                await self.downstream(message)
+                return
+            self.start = message
+            return
+        if self.passthrough or message["type"] != "http.response.body" or self.start is None:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None and not more_body:
+            await self._send_complete(body)
+            return
+        if self.encoder is None:
+            self.encoder = self.middleware.encoders[self.encoding]()
+            await self.downstream({**self.start, "headers": self._headers(None)})
+        operation = self.encoder.compress if more_body else self.encoder.finish
+        chunk = _timed(self.encoding, operation, body)
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_complete(self, body: bytes) -> None:
+        assert self.start is not None
+        if len(body) < self.middleware.minimum_size:
+            headers = MutableHeaders(raw=list(self.start["headers"]))
+            headers.add_vary_header("Accept-Encoding")
+            _weaken_etag(headers)
+            await self.downstream({**self.start, "headers": headers.raw})
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+        encoder = self.middleware.encoders[self.encoding]()
+        if len(body) >= OFFLOAD_BYTES:
+            compressed = await run_in_threadpool(_timed, self.encoding, encoder.finish, body)
+        else:
+            compressed = _timed(self.encoding, encoder.finish, body)
+        await self.downstream({**self.start, "headers": self._headers(len(compressed))})
+        await self.downstream({"type": "http.response.body", "body": compressed})
@@ -1,24 +1,126 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     """Application settings with environment variable support."""
     
     # Database settings
     DATABASE_URL: str = "sqlite:///./test.db"
+    DB_ECHO: bool = False
+
+    # Read replicas: read-only endpoints are spread across these round-robin,
+    # except for clients that wrote within READ_YOUR_WRITES_SECONDS
+    DATABASE_REPLICA_URLS: list = []
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # Item sharding: items live on these databases, placed by a hash of
+    # owner_id; users stay on DATABASE_URL. Ids are reserved in blocks.
+    ITEM_SHARD_URLS: list = []
+    ITEM_ID_BLOCK_SIZE: int = 1000
+
+    # Connection pool (file-backed SQLite and server databases)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_WARM_CONNECTIONS: int = 2
+
+    # Startup: schema creation is an explicit step (km-pyapi init-db) unless enabled here
+    AUTO_CREATE_SCHEMA: bool = False
+    STARTUP_WARMUP: bool = True
+
+    # SQLite tuning for file-backed databases
+    SQLITE_WAL: bool = True
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     # JWT settings
     SECRET_KEY: str = "YOUR_SECRET_KEY_HERE_CHANGE_IN_PRODUCTION"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Rotating refresh tokens; expired rows are purged in batches every interval
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: int = 3600
+    REFRESH_TOKEN_PURGE_BATCH_SIZE: int = 1000
+
+    # Password hashing pool (0 workers = one per CPU core)
+    PASSWORD_HASH_WORKERS: int = 0
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Password hash policy ("bcrypt" or "argon2"); pick the cost for the host
+    # with `km-pyapi calibrate-hash`. Stored hashes are upgraded on login.
+    PASSWORD_HASH_SCHEME: str = "bcrypt"
+    PASSWORD_HASH_TARGET_MS: float = 250.0
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+
+    # Authenticated-user and decoded-token caches. Changes to a user evict it
+    # only in the worker that made them; other workers may keep authenticating
+    # a deactivated or deleted user for up to USER_CACHE_TTL_SECONDS (0 disables)
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 10000
+    TOKEN_CACHE_MAX_SIZE: int = 10000
     
     # API settings
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Python API Framework"
+    BULK_MAX_ITEMS: int = 5000
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Serve list endpoints from column tuples via precompiled serializers
+    FAST_JSON_RESPONSES: bool = False
+
+    # HTTP caching: ETag/Cache-Control on item reads, optional server-side
+    # cache of serialized response bodies
+    HTTP_CACHE_MAX_AGE: int = 0
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_SIZE: int = 1024
+    RESPONSE_CACHE_TTL_SECONDS: int = 60
     
     # CORS settings
     BACKEND_CORS_ORIGINS: list = ["*"]
     
+    # Response compression (br/zstd need the "compression" extra)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_ENCODINGS: list = ["zstd", "br", "gzip"]
+    COMPRESSION_CONTENT_TYPES: list = ["application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"]
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # Rate limiting ("<count>/<second|minute|hour|day>"; empty disables a limit)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_IP: str = "600/minute"
+    RATE_LIMIT_PER_USER: str = "1200/minute"
+    RATE_LIMIT_ROUTES: Dict[str, str] = {"register": "10/hour", "token": "30/minute"}
+    RATE_LIMIT_REDIS_URL: str = ""
+    LOGIN_LOCKOUT_ATTEMPTS: int = 5
+    LOGIN_LOCKOUT_SECONDS: int = 900
+    # Proxies whose X-Forwarded-For is trusted for the client address that
+    # limits and lockouts key on; set to the load balancer's addresses (or
+    # "*") behind one, or every client shares the proxy's bucket
+    FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+
+    # Item change feed (SSE/WebSocket); Redis fans events out across workers
+    CHANGE_FEED_HISTORY: int = 1000
+    CHANGE_FEED_BUFFER: int = 256
+    CHANGE_FEED_HEARTBEAT_SECONDS: float = 15.0
+    CHANGE_FEED_REDIS_URL: str = ""
+
+    # Observability
+    METRICS_ENABLED: bool = True
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_DEBUG_TOKEN: str = ""
+    PROFILING_INTERVAL_MS: float = 1.0
+    PROFILING_MAX_PROFILES: int = 50
+    PROFILING_OUTPUT_DIR: str = ""
+
     # Environment
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -0,0 +1,139 @@
+"""
+Maintained item counters.
+
+``item_counts`` holds the number of items per owner. ``item_daily_counts``
+holds the items created per owner per UTC day. Both are kept up to date by
+triggers on ``items``, so every write path updates them in the same
+transaction as the row change: single, bulk and core statements alike.
+Counting then reads a handful of counter rows instead of scanning
+``items``:
+
+* SQLite: ``AFTER INSERT/DELETE/UPDATE OF owner_id`` triggers with upserts.
+* PostgreSQL: a PL/pgSQL trigger function doing the same.
+* Other dialects have no triggers, and counts fall back to ``COUNT(*)``.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import DDL, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import Base
+from .models import Item, ItemCount, ItemDailyCount
+
+TRIGGER_DIALECTS = ("sqlite", "postgresql")
+
+SQLITE_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS item_counts_ai AFTER INSERT ON items BEGIN "
+    "INSERT INTO item_counts(owner_id, item_count) VALUES (new.owner_id, 1) "
+    "ON CONFLICT(owner_id) DO UPDATE SET item_count = item_count + 1; "
+    "INSERT INTO item_daily_counts(owner_id, day, created) "
+    "VALUES (new.owner_id, date(coalesce(new.created_at, CURRENT_TIMESTAMP)), 1) "
+    "ON CONFLICT(owner_id, day) DO UPDATE SET created = created + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS item_counts_ad AFTER DELETE ON items BEGIN "
+    "UPDATE item_counts SET item_count = item_count - 1 WHERE owner_id = old.owner_id; END",
+    "CREATE TRIGGER IF NOT EXISTS item_counts_au AFTER UPDATE OF owner_id ON items "
+    "WHEN old.owner_id <> new.owner_id BEGIN "
+    "UPDATE item_counts SET item_count = item_count - 1 WHERE owner_id = old.owner_id; "
+    "INSERT INTO item_counts(owner_id, item_count) VALUES (new.owner_id, 1) "
+    "ON CONFLICT(owner_id) DO UPDATE SET item_count = item_count + 1; END",
+)
+
+POSTGRES_DDL = (
+    """CREATE OR REPLACE FUNCTION item_counts_maintain() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE item_counts SET item_count = item_count - 1 WHERE owner_id = OLD.owner_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO item_counts (owner_id, item_count) VALUES (NEW.owner_id, 1)
+        ON CONFLICT (owner_id) DO UPDATE SET item_count = item_counts.item_count + 1;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO item_daily_counts (owner_id, day, created)
+        VALUES (NEW.owner_id, (coalesce(NEW.created_at, now()) AT TIME ZONE 'UTC')::date, 1)
+        ON CONFLICT (owner_id, day) DO UPDATE SET created = item_daily_counts.created + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS item_counts_insert_delete ON items",
+    "CREATE TRIGGER item_counts_insert_delete AFTER INSERT OR DELETE ON items "
+    "FOR EACH ROW EXECUTE FUNCTION item_counts_maintain()",
+    "DROP TRIGGER IF EXISTS item_counts_owner_change ON items",
+    "CREATE TRIGGER item_counts_owner_change AFTER UPDATE OF owner_id ON items "
+    "FOR EACH ROW WHEN (OLD.owner_id IS DISTINCT FROM NEW.owner_id) "
+    "EXECUTE FUNCTION item_counts_maintain()",
+)
+
+BACKFILL = {
+    "sqlite": (
+        "INSERT INTO item_counts (owner_id, item_count) "
+        "SELECT owner_id, count(*) FROM items GROUP BY owner_id",
+        "INSERT INTO item_daily_counts (owner_id, day, created) "
+        "SELECT owner_id, date(created_at), count(*) FROM items GROUP BY owner_id, date(created_at)",
+    ),
+    "postgresql": (
+        "INSERT INTO item_counts (owner_id, item_count) "
+        "SELECT owner_id, count(*) FROM items GROUP BY owner_id",
+        "INSERT INTO item_daily_counts (owner_id, day, created) "
+        "SELECT owner_id, (created_at AT TIME ZONE 'UTC')::date, count(*) FROM items "
+        "GROUP BY 1, 2",
+    ),
+}
+
+# Triggers reference the counter tables, so they are created once every table exists
+for statement in SQLITE_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+def _maintained(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name in TRIGGER_DIALECTS
+
+async def count_items(db: AsyncSession, owner_id: Optional[int] = None) -> int:
+    """Number of items owned by ``owner_id``, or of all items."""
+    if not _maintained(db):
+        stmt = select(func.count()).select_from(Item)
+        if owner_id is not None:
+            stmt = stmt.where(Item.owner_id == owner_id)
+        return (await db.execute(stmt)).scalar_one()
+    if owner_id is not None:
+        count = await db.scalar(select(ItemCount.item_count).where(ItemCount.owner_id == owner_id))
+        return count or 0
+    return (await db.execute(select(func.coalesce(func.sum(ItemCount.item_count), 0)))).scalar_one()
+
+async def owner_counts(db: AsyncSession, limit: int) -> List[Tuple[int, int]]:
+    """``(owner_id, item_count)`` for the ``limit`` owners with the most items."""
+    if _maintained(db):
+        count = ItemCount.item_count
+        stmt = select(ItemCount.owner_id, count).where(count > 0)
+    else:
+        count = func.count().label("item_count")
+        stmt = select(Item.owner_id, count).group_by(Item.owner_id)
+    result = await db.execute(stmt.order_by(count.desc(), "owner_id").limit(limit))
+    return [(owner_id, item_count) for owner_id, item_count in result.all()]
+
+async def created_per_day(
+    db: AsyncSession,
+    days: int,
+    owner_id: Optional[int] = None
+) -> List[Tuple[date, int]]:
+    """Items created per UTC day over the last ``days`` days, oldest first."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    if _maintained(db):
+        day, created = ItemDailyCount.day, func.sum(ItemDailyCount.created)
+        stmt = select(day, created).where(day >= since)
+        if owner_id is not None:
+            stmt = stmt.where(ItemDailyCount.owner_id == owner_id)
+    else:
+        day, created = func.date(Item.created_at), func.count()
+        stmt = select(day, created).where(Item.created_at >= since)
+        if owner_id is not None:
+            stmt = stmt.where(Item.owner_id == owner_id)
+    result = await db.execute(stmt.group_by(day).order_by(day))
+    totals: Dict[date, int] = {}
+    for row_day, row_created in result.all():
+        if isinstance(row_day, str):
+            row_day = date.fromisoformat(row_day)
+        totals[row_day] = int(row_created)
+    return sorted(totals.items())
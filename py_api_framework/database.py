@@ -1,39 +1,338 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
+from starlette.requests import HTTPConnection
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from typing import Any, Callable, Dict, List, Optional, Union
+from .cache import TTLCache
 from .config import settings
-import os
-
-# Create database engine
-if settings.DATABASE_URL.startswith("sqlite"):
-    # SQLite specific configuration
-    engine = create_engine(
-        settings.DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-        echo=settings.DEBUG
-    )
-else:
-    # PostgreSQL/MySQL configuration
-    engine = create_engine(
-        settings.DATABASE_URL,
-        echo=settings.DEBUG
+from .metrics import Gauge, instrument_engine, registry
+import itertools
+import threading
+import time
+
+# Async drivers used for request handling, keyed by the sync backend name
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def get_async_url(url: str) -> str:
+    """Return the async-driver variant of a database URL."""
+    db_url = make_url(url)
+    backend = db_url.get_backend_name()
+    if backend in ASYNC_DRIVERS and db_url.drivername != ASYNC_DRIVERS[backend]:
+        db_url = db_url.set(drivername=ASYNC_DRIVERS[backend])
+    return db_url.render_as_string(hide_password=False)
+
+def get_sync_url(url: str) -> str:
+    """Return the sync-driver variant of a database URL."""
+    db_url = make_url(url)
+    if db_url.drivername in ASYNC_DRIVERS.values():
+        db_url = db_url.set(drivername=db_url.get_backend_name())
+    return db_url.render_as_string(hide_password=False)
+
+class PoolWaitStatsMixin:
+    """Pool mixin recording how long each checkout waited for a connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.checkout_count = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkout_count += 1
+            self.checkout_wait_seconds += elapsed
+            self.checkout_wait_max = max(self.checkout_wait_max, elapsed)
+
+class TimedQueuePool(PoolWaitStatsMixin, QueuePool):
+    """QueuePool with checkout wait statistics."""
+
+class TimedAsyncAdaptedQueuePool(PoolWaitStatsMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool with checkout wait statistics."""
+
+def is_sqlite_memory(url: str) -> bool:
+    """Return True for in-memory SQLite URLs, which must share one connection."""
+    db_url = make_url(url)
+    return db_url.database in (None, "", ":memory:") or db_url.query.get("mode") == "memory"
+
+def _set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    """Apply WAL journaling and tuning pragmas to each new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+def _engine_options(url: str, is_async: bool) -> Dict[str, Any]:
+    """Build pool and connect options for ``url`` from the pool settings."""
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    if url.startswith("sqlite") and is_sqlite_memory(url):
+        # In-memory SQLite only exists inside a single shared connection
+        options["connect_args"] = {"check_same_thread": False}
+        options["poolclass"] = StaticPool
+        return options
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
     )
+    return options
+
+def _attach_sqlite_pragmas(url: str, sync_engine: Engine) -> None:
+    if url.startswith("sqlite") and not is_sqlite_memory(url) and settings.SQLITE_WAL:
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+def build_engine(url: str) -> Engine:
+    """Create the sync engine for ``url`` (schema management and scripts)."""
+    new_engine = create_engine(get_sync_url(url), **_engine_options(url, is_async=False))
+    _attach_sqlite_pragmas(url, new_engine)
+    return new_engine
+
+def build_async_engine(url: str) -> AsyncEngine:
+    """Create the async engine for ``url`` used to serve requests."""
+    new_engine = create_async_engine(get_async_url(url), **_engine_options(url, is_async=True))
+    _attach_sqlite_pragmas(url, new_engine.sync_engine)
+    return new_engine
+
+def pool_stats(db_engine: Union[Engine, AsyncEngine]) -> Dict[str, Any]:
+    """Return checked-out, overflow and checkout wait statistics for an engine's pool."""
+    pool = db_engine.pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__}
+    for name, attr in (
+        ("size", "size"),
+        ("checked_in", "checkedin"),
+        ("checked_out", "checkedout"),
+        ("overflow", "overflow"),
+    ):
+        if hasattr(pool, attr):
+            stats[name] = getattr(pool, attr)()
+    if isinstance(pool, PoolWaitStatsMixin):
+        stats["checkouts"] = pool.checkout_count
+        stats["wait_avg_ms"] = (
+            pool.checkout_wait_seconds / pool.checkout_count * 1000 if pool.checkout_count else 0.0
+        )
+        stats["wait_max_ms"] = pool.checkout_wait_max * 1000
+    return stats
+
+class ReplicaRouter:
+    """Routes read-only sessions to replicas round-robin and writes to the primary.
+
+    A client that committed a write within the last ``sticky_seconds`` keeps
+    reading from the primary so it always sees its own writes despite
+    replication lag. Stickiness is tracked per worker process.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker,
+        replicas: List[async_sessionmaker],
+        sticky_seconds: float
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self._cycle = itertools.cycle(replicas) if replicas else None
+        self._recent_writes = TTLCache(max_size=100000, ttl=sticky_seconds)
+
+    def mark_write(self, client_key: Optional[str]) -> None:
+        """Pin ``client_key`` to the primary for the stickiness window."""
+        if client_key and self.replicas:
+            self._recent_writes.set(client_key, True)
+
+    def for_read(self, client_key: Optional[str] = None) -> async_sessionmaker:
+        """Return the session factory a read for ``client_key`` should use."""
+        if self._cycle is None or (client_key and self._recent_writes.get(client_key)):
+            return self.primary
+        return next(self._cycle)
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def user_client_key(username: str) -> str:
+    """Stickiness key for an authenticated user."""
+    return f"user:{username}"
+
+def request_client_key(request: HTTPConnection) -> Optional[str]:
+    """Identify the client behind ``request`` for read-your-writes routing.
+
+    The bearer token's subject is read without verification; it only picks a
+    database, authentication still happens in ``auth.get_current_user``.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            username = jwt.get_unverified_claims(token).get("sub")
+        except JWTError:
+            username = None
+        if username:
+            return user_client_key(username)
+    return f"addr:{request.client.host}" if request.client else None
+
+class Engines:
+    """The application's engines, session factories and replica router.
+
+    Built on first use by ``get_engines`` rather than at import, so importing
+    the app opens no pools and workers create their own after forking.
+    """
+
+    def __init__(self):
+        # The sync engine is used for schema management and scripts, the
+        # async engine serves requests without blocking the event loop.
+        self.engine = build_engine(settings.DATABASE_URL)
+        self.async_engine = build_async_engine(settings.DATABASE_URL)
+        self.replica_engines = [build_async_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+        # Item shards (empty unless ITEM_SHARD_URLS is set; see sharding.py)
+        self.shard_engines = [build_async_engine(url) for url in settings.ITEM_SHARD_URLS]
+        for hook in _engine_hooks:
+            for db_engine in self.sync_engines():
+                hook(db_engine)
+
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.AsyncSessionLocal = async_sessionmaker(
+            bind=self.async_engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False
+        )
+        self.replica_router = ReplicaRouter(
+            self.AsyncSessionLocal,
+            [
+                async_sessionmaker(
+                    bind=replica, class_=AsyncSession, autoflush=False, expire_on_commit=False
+                )
+                for replica in self.replica_engines
+            ],
+            sticky_seconds=settings.READ_YOUR_WRITES_SECONDS
+        )
+        self.shard_sessions = [
+            async_sessionmaker(bind=shard, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+            for shard in self.shard_engines
+        ]
+
+    def sync_engines(self) -> List[Engine]:
+        """Every engine, as the sync ``Engine`` that carries events."""
+        return [self.engine, self.async_engine.sync_engine] + [
+            db_engine.sync_engine for db_engine in self.replica_engines + self.shard_engines
+        ]
+
+    def named_async_engines(self) -> Dict[str, AsyncEngine]:
+        engines = {"primary": self.async_engine}
+        engines.update(
+            (f"replica{index}", replica) for index, replica in enumerate(self.replica_engines)
+        )
+        engines.update(
+            (f"shard{index}", shard) for index, shard in enumerate(self.shard_engines)
+        )
+        return engines
+
+_engines: Optional[Engines] = None
+_engines_lock = threading.Lock()
+_engine_hooks: List[Callable[[Engine], None]] = []
+
+def get_engines() -> Engines:
+    """Return the process's engines, creating them on first call."""
+    global _engines
+    if _engines is None:
+        with _engines_lock:
+            if _engines is None:
+                _engines = Engines()
+    return _engines
+
+def register_engine_hook(hook: Callable[[Engine], None]) -> None:
+    """Call ``hook`` on every application engine, now and when they are created."""
+    _engine_hooks.append(hook)
+    if _engines is not None:
+        for db_engine in _engines.sync_engines():
+            hook(db_engine)
+
+async def dispose_engines() -> None:
+    """Close every pool; the next ``get_engines`` call builds fresh engines."""
+    global _engines
+    engines, _engines = _engines, None
+    if engines is not None:
+        for db_engine in engines.named_async_engines().values():
+            await db_engine.dispose()
+        engines.engine.dispose()
+
+def dispose_after_fork() -> None:
+    """Forget pooled connections inherited by a forked worker without closing them."""
+    if _engines is not None:
+        for db_engine in _engines.sync_engines():
+            db_engine.dispose(close=False)
+
+_LAZY_ATTRIBUTES = {
+    "engine", "async_engine", "replica_engines", "SessionLocal", "AsyncSessionLocal", "replica_router",
+    "shard_engines", "shard_sessions",
+}
+
+def __getattr__(name: str) -> Any:
+    # Keeps ``database.engine`` and friends working while building them lazily
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(get_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if settings.METRICS_ENABLED:
+    register_engine_hook(instrument_engine)
+    for stat in ("checked_out", "overflow", "wait_avg_ms"):
+        registry.register(Gauge(
+            f"db_pool_{stat}", f"Connection pool {stat.replace('_', ' ')}.", ("pool",),
+            callback=lambda stat=stat: {
+                (name,): pool_stats(db_engine).get(stat, 0)
+                for name, db_engine in (
+                    _engines.named_async_engines().items() if _engines is not None else ()
+                )
+            }
+        ))
+
+@event.listens_for(Session, "after_commit")
+def _mark_client_write(session: Session) -> None:
+    """Make the committing client read from the primary for a while."""
+    if _engines is not None:
+        _engines.replica_router.mark_write(session.info.get("client_key"))
 
 # Create declarative base
 Base = declarative_base()
 
-def get_db():
-    """Dependency to get database session."""
-    db = SessionLocal()
-    try:
+async def get_db(request: HTTPConnection):
+    """Dependency to get an async session on the primary database (writes)."""
+    async with get_engines().AsyncSessionLocal() as db:
+        db.info["client_key"] = request_client_key(request)
+        yield db
+
+async def get_read_db(request: HTTPConnection):
+    """Dependency to get an async session for read-only work, replica-routed."""
+    async with get_engines().replica_router.for_read(request_client_key(request))() as db:
         yield db
-    finally:
-        db.close()
 
 def init_db():
-    """Initialize database tables."""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    """Create missing tables, then migrate the schema to the latest revision.
+
+    New tables come with their search index and counter triggers; the
+    migrations in ``migrations/versions`` upgrade tables created by earlier
+    releases. With ``ITEM_SHARD_URLS`` set, the same happens on every shard
+    for the item tables, and the item id allocator is initialized on the
+    primary.
+    """
+    # search and counters register their DDL with create_all; they and
+    # sharding import models, which import this module
+    from . import counters, search  # noqa: F401
+    from .migrations import upgrade
+    from .sharding import init_shards
+    db_engine = get_engines().engine
+    Base.metadata.create_all(bind=db_engine)
+    with db_engine.begin() as connection:
+        upgrade(connection)
+    if settings.ITEM_SHARD_URLS:
+        init_shards(db_engine, settings.ITEM_SHARD_URLS)
@@ -0,0 +1,62 @@
+"""
+Streaming serializers for bulk data export.
+
+Rows arrive as plain column tuples in partitions from a server-side cursor
+and are encoded straight to bytes, one chunk per partition, so memory use is
+bounded by the partition size rather than the number of exported rows.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Sequence
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+async def ndjson_chunks(
+    fields: Sequence[str],
+    partitions: AsyncIterator[Sequence[Sequence[Any]]]
+) -> AsyncIterator[bytes]:
+    """Encode each partition of row tuples as newline-delimited JSON."""
+    async for rows in partitions:
+        yield "".join(
+            json.dumps(dict(zip(fields, row)), default=_json_default) + "\n"
+            for row in rows
+        ).encode()
+
+async def csv_chunks(
+    fields: Sequence[str],
+    partitions: AsyncIterator[Sequence[Sequence[Any]]]
+) -> AsyncIterator[bytes]:
+    """Encode each partition of row tuples as CSV, preceded by a header row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue().encode()
+    async for rows in partitions:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip a byte stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,114 @@
+"""
+Sparse fieldsets.
+
+``fields=id,title`` on the item and user read endpoints narrows a response
+to those fields of ``schemas.Item``/``schemas.User``:
+
+* the SELECT lists only those columns, plus the ones ETags and cursors are
+  computed from: column tuples on the fast JSON path, ``load_only`` on the
+  ORM path;
+* the body is serialized with a response model built for that field set.
+  Field sets are normalized to schema order, and their models and
+  ``TypeAdapter``s are built once and cached.
+
+Unknown field names are rejected with 400.
+"""
+
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple, Type
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import load_only
+from typing_extensions import TypedDict
+
+FieldSet = Tuple[str, ...]
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[FieldSet]:
+    """Validate a comma-separated ``fields`` value; None means every field."""
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        return None
+    unknown = requested - set(schema.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return tuple(name for name in schema.model_fields if name in requested)
+
+def _with(fields: FieldSet, always: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys([*always, *fields]))
+
+def columns(entity: Any, fields: FieldSet, always: Sequence[str] = ("id",)) -> List[Any]:
+    """Columns of ``entity`` to select for ``fields``."""
+    return [getattr(entity, name) for name in _with(fields, always)]
+
+def load_only_fields(entity: Any, fields: FieldSet, always: Sequence[str] = ("id",)) -> Any:
+    """Loader option restricting ``entity`` to the columns for ``fields``."""
+    return load_only(*columns(entity, fields, always))
+
+@lru_cache(maxsize=256)
+def response_model(schema: Type[BaseModel], fields: FieldSet) -> Type[BaseModel]:
+    """``schema`` cut down to ``fields``, validated from ORM attributes."""
+    return create_model(
+        f"{schema.__name__}[{','.join(fields)}]",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fields}
+    )
+
+@lru_cache(maxsize=256)
+def _record(schema: Type[BaseModel], fields: FieldSet) -> type:
+    # Dumped straight from column dicts, like ``serialization.ItemRecord``
+    return TypedDict(
+        f"{schema.__name__}Record[{','.join(fields)}]",
+        {name: schema.model_fields[name].annotation for name in fields}
+    )
+
+def _element(schema: Type[BaseModel], fields: FieldSet, fast: bool) -> type:
+    return _record(schema, fields) if fast else response_model(schema, fields)
+
+@lru_cache(maxsize=256)
+def item_adapter(schema: Type[BaseModel], fields: FieldSet) -> TypeAdapter:
+    return TypeAdapter(response_model(schema, fields))
+
+@lru_cache(maxsize=256)
+def list_adapter(schema: Type[BaseModel], fields: FieldSet, fast: bool) -> TypeAdapter:
+    return TypeAdapter(List[_element(schema, fields, fast)])
+
+@lru_cache(maxsize=256)
+def page_adapter(schema: Type[BaseModel], fields: FieldSet, fast: bool) -> TypeAdapter:
+    return TypeAdapter(TypedDict(
+        f"{schema.__name__}PageRecord[{','.join(fields)}]",
+        {"items": List[_element(schema, fields, fast)], "next_cursor": Optional[str]}
+    ))
+
+def _records(rows: Any, fields: FieldSet) -> List[dict]:
+    # Rows may carry extra columns (ids and timestamps for ETags and cursors)
+    return [{name: getattr(row, name) for name in fields} for row in rows]
+
+def dump_one(schema: Type[BaseModel], fields: FieldSet, obj: Any) -> bytes:
+    """Serialize one ORM object or row as ``fields`` of ``schema``."""
+    adapter = item_adapter(schema, fields)
+    return adapter.dump_json(adapter.validate_python(obj))
+
+def dump_list(schema: Type[BaseModel], fields: FieldSet, rows: Any, fast: bool) -> bytes:
+    """Serialize column tuples (fast) or ORM objects as a list of ``fields``."""
+    adapter = list_adapter(schema, fields, fast)
+    if fast:
+        return adapter.dump_json(_records(rows, fields))
+    return adapter.dump_json(adapter.validate_python(rows))
+
+def dump_page(
+    schema: Type[BaseModel],
+    fields: FieldSet,
+    rows: Any,
+    next_cursor: Optional[str],
+    fast: bool
+) -> bytes:
+    """Serialize a page envelope of ``fields`` from column tuples (fast) or ORM objects."""
+    adapter = page_adapter(schema, fields, fast)
+    if fast:
+        return adapter.dump_json({"items": _records(rows, fields), "next_cursor": next_cursor})
+    return adapter.dump_json(adapter.validate_python({"items": rows, "next_cursor": next_cursor}))
@@ -0,0 +1,226 @@
+"""
+Password hashing policy and bounded worker pool.
+
+The hash scheme and its cost come from settings (``PASSWORD_HASH_SCHEME``,
+``BCRYPT_ROUNDS``, ``ARGON2_*``), and ``km-pyapi calibrate-hash`` picks
+them for the host. ``build_crypt_context`` marks any hash that does not
+match the current policy as needing an update, so logins rehash stored
+passwords when the policy changes, in either direction.
+
+bcrypt and argon2 are deliberately slow and release the GIL while they
+work, so hashing and verification run on a dedicated thread pool instead of
+the event loop. Admission is capped at ``workers + PASSWORD_HASH_MAX_QUEUE``
+jobs; anything beyond that is rejected immediately with a 503 rather than
+queueing behind a login storm.
+"""
+
+import asyncio
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from .config import settings
+from .metrics import Gauge, registry
+
+SCHEMES = ("bcrypt", "argon2")
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+CALIBRATION_PASSWORD = "calibration-password"
+
+def _require_argon2() -> None:
+    try:
+        import argon2  # noqa: F401
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "PASSWORD_HASH_SCHEME=argon2 requires argon2-cffi: pip install 'km-pyapi[argon2]'"
+        ) from exc
+
+def build_crypt_context(
+    scheme: str = "bcrypt",
+    bcrypt_rounds: int = 12,
+    argon2_time_cost: int = 3,
+    argon2_memory_cost: int = 65536,
+    argon2_parallelism: int = 4
+) -> CryptContext:
+    """Hash with ``scheme`` at the given cost; any other scheme or cost needs an update.
+
+    bcrypt stays verifiable under argon2, so existing users migrate on login.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown password hash scheme {scheme!r}; expected one of {SCHEMES}")
+    options: Dict[str, Any] = {
+        "bcrypt__default_rounds": bcrypt_rounds,
+        "bcrypt__min_desired_rounds": bcrypt_rounds,
+        "bcrypt__max_desired_rounds": bcrypt_rounds,
+    }
+    if scheme == "argon2":
+        _require_argon2()
+        options.update({
+            "argon2__type": "ID",
+            "argon2__time_cost": argon2_time_cost,
+            "argon2__memory_cost": argon2_memory_cost,
+            "argon2__parallelism": argon2_parallelism,
+        })
+        return CryptContext(schemes=["argon2", "bcrypt"], deprecated=["bcrypt"], **options)
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", **options)
+
+def time_hash(context: CryptContext, samples: int = 3) -> float:
+    """Median seconds ``context`` takes to hash a password."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash(CALIBRATION_PASSWORD)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def calibrate_bcrypt(target_seconds: float, samples: int = 3) -> Dict[str, Any]:
+    """Pick the highest bcrypt rounds whose hash time stays within ``target_seconds``.
+
+    Each extra round doubles the work, so one measurement at a low cost is
+    extrapolated and then checked, stepping down while over budget.
+    """
+    base_rounds = 8
+    base = time_hash(build_crypt_context("bcrypt", base_rounds), samples)
+    rounds = base_rounds + math.floor(math.log2(max(target_seconds / base, 1e-9)))
+    rounds = min(max(rounds, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+    seconds = time_hash(build_crypt_context("bcrypt", rounds), samples)
+    while seconds > target_seconds and rounds > BCRYPT_MIN_ROUNDS:
+        rounds -= 1
+        seconds = time_hash(build_crypt_context("bcrypt", rounds), samples)
+    return {"PASSWORD_HASH_SCHEME": "bcrypt", "BCRYPT_ROUNDS": rounds, "seconds": seconds}
+
+def calibrate_argon2(
+    target_seconds: float,
+    memory_cost: int,
+    parallelism: int,
+    samples: int = 3
+) -> Dict[str, Any]:
+    """Pick the highest argon2id time cost within ``target_seconds`` at fixed memory.
+
+    Time grows linearly with the time cost; memory is left as configured
+    because it is what makes argon2id expensive to attack on GPUs.
+    """
+    def measure(time_cost: int) -> float:
+        return time_hash(
+            build_crypt_context("argon2", argon2_time_cost=time_cost,
+                                argon2_memory_cost=memory_cost, argon2_parallelism=parallelism),
+            samples,
+        )
+
+    single = measure(1)
+    time_cost = max(1, math.floor(target_seconds / single))
+    seconds = measure(time_cost) if time_cost > 1 else single
+    while seconds > target_seconds and time_cost > 1:
+        time_cost -= 1
+        seconds = measure(time_cost)
+    return {
+        "PASSWORD_HASH_SCHEME": "argon2",
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": parallelism,
+        "seconds": seconds,
+    }
+
+pwd_context = build_crypt_context(
+    settings.PASSWORD_HASH_SCHEME,
+    settings.BCRYPT_ROUNDS,
+    settings.ARGON2_TIME_COST,
+    settings.ARGON2_MEMORY_COST,
+    settings.ARGON2_PARALLELISM,
+)
+
+class PasswordHashPool:
+    """Thread pool with a queue-depth limit and latency statistics."""
+
+    def __init__(self, workers: int = 0, max_queue: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of running plus queued jobs."""
+        return self.workers + self.max_queue
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    def _timed(self, func: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._completed += 1
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run ``func(*args)`` on the pool, or raise 503 when saturated."""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service busy, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), self._timed, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of queue length and hash latency."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "pending": self._pending,
+                "queued": max(self._pending - self.workers, 0),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_seconds": self._total_seconds / self._completed if self._completed else 0.0,
+                "max_seconds": self._max_seconds,
+            }
+
+    def shutdown(self) -> None:
+        """Stop the worker threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+hash_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+for stat, description in (
+    ("queued", "Password hash jobs waiting for a worker."),
+    ("pending", "Password hash jobs running or queued."),
+    ("rejected", "Password hash jobs rejected because the pool was full."),
+):
+    registry.register(Gauge(
+        f"password_hash_{stat}", description,
+        callback=lambda stat=stat: {(): hash_pool.stats()[stat]}
+    ))
@@ -0,0 +1,98 @@
+"""
+HTTP response caching for item endpoints.
+
+Strong ETags are derived from each item's ``id``, ``created_at`` and
+``version``, a counter bumped by every UPDATE, and for collections from the
+versions of every row on the page plus the next cursor. ``created_at``
+tells apart rows that reuse the id of a deleted item (SQLite hands out the
+largest rowid again on tables created without AUTOINCREMENT). A matching ``If-None-Match`` yields a 304
+before anything is serialized. Because ETags are computed from freshly read
+row versions they stay correct across workers; the optional server-side
+cache of serialized bytes is keyed by URL and ETag, so a stale entry can
+never be served, and writes additionally evict entries containing the
+touched items.
+"""
+
+import hashlib
+from typing import Any, Iterable, Optional
+from fastapi import Request, Response
+from .cache import TTLCache
+from .config import settings
+
+def _version(row: Any) -> str:
+    return f"{row.id}:{row.created_at}:{row.version}"
+
+def item_etag(row: Any) -> str:
+    """Strong ETag for a single item row (ORM object or column tuple)."""
+    return '"' + hashlib.sha1(_version(row).encode()).hexdigest() + '"'
+
+def collection_etag(rows: Iterable[Any], next_cursor: Optional[str] = None) -> str:
+    """Strong ETag for a page of item rows."""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(_version(row).encode())
+        digest.update(b";")
+    digest.update(f"next={next_cursor or ''}".encode())
+    return '"' + digest.hexdigest() + '"'
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """Return True if the request's ``If-None-Match`` matches ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    if "*" in candidates:
+        return True
+    # If-None-Match uses weak comparison
+    return etag in {tag[2:] if tag.startswith("W/") else tag for tag in candidates}
+
+def cache_headers(etag: str) -> dict:
+    """Validator and freshness headers sent with cacheable item responses."""
+    return {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.HTTP_CACHE_MAX_AGE}, must-revalidate",
+    }
+
+def not_modified(etag: str) -> Response:
+    """Bodyless 304 response for a matching validator."""
+    return Response(status_code=304, headers=cache_headers(etag))
+
+def json_etag_response(body: bytes, etag: str) -> Response:
+    """JSON response carrying ``etag`` and cache headers."""
+    return Response(content=body, media_type="application/json", headers=cache_headers(etag))
+
+class ResponseCache:
+    """LRU cache of serialized response bodies keyed by URL and ETag."""
+
+    def __init__(self, max_size: int, ttl: float, enabled: bool = True):
+        self.enabled = enabled
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, url: str, etag: str) -> Optional[bytes]:
+        """Return the cached body for ``url`` at version ``etag``, if any."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get((url, etag))
+        return entry[0] if entry is not None else None
+
+    def set(self, url: str, etag: str, body: bytes, item_ids: Iterable[int]) -> None:
+        """Cache ``body`` along with the ids of the items it contains."""
+        if self.enabled:
+            self._entries.set((url, etag), (body, frozenset(item_ids)))
+
+    def invalidate_items(self, item_ids: Iterable[int]) -> None:
+        """Evict every cached body that contains one of ``item_ids``."""
+        if not self.enabled:
+            return
+        touched = set(item_ids)
+        self._entries.discard_if(lambda key, value: not touched.isdisjoint(value[1]))
+
+    def clear(self) -> None:
+        """Drop every cached body."""
+        self._entries.clear()
+
+response_cache = ResponseCache(
+    max_size=settings.RESPONSE_CACHE_MAX_SIZE,
+    ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+    enabled=settings.RESPONSE_CACHE_ENABLED
+)
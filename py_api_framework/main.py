@@ -1,14 +1,19 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from datetime import datetime, timezone
-from .database import init_db
+from . import _import_started
+from .database import get_engines, pool_stats, register_engine_hook
 from .routers import auth, items
+from . import profiling
+from .compression import CompressionMiddleware
 from .config import settings
+from .metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, registry
+from .ratelimit import RateLimitMiddleware, limiter
 from .schemas import HealthCheck
-
-# Initialize database
-init_db()
+from .serialization import ORJSONResponse
+from .startup import create_lifespan
 
 # Create FastAPI app
 app = FastAPI(
@@ -17,9 +22,15 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=create_lifespan(_import_started),
+    **({"default_response_class": ORJSONResponse} if settings.FAST_JSON_RESPONSES else {})
 )
 
+# Add rate limiting before CORS so rejected responses still carry CORS headers
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, rate_limiter=limiter)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -36,9 +47,30 @@ if settings.ENVIRONMENT == "production":
         allowed_hosts=["*"]  # Configure with your domain in production
     )
 
+# Add response compression
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        encodings=settings.COMPRESSION_ENCODINGS,
+        content_types=settings.COMPRESSION_CONTENT_TYPES,
+    )
+
+# Add profiling middleware only when enabled, so it costs nothing otherwise
+if settings.PROFILING_ENABLED:
+    register_engine_hook(profiling.instrument_engine)
+    app.add_middleware(profiling.ProfilingMiddleware, profiler=profiling.profiler)
+
+# Add metrics middleware last so it wraps every other middleware; request
+# latency then includes compression and profiling
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(items.router, prefix=settings.API_V1_STR)
+if settings.PROFILING_ENABLED:
+    app.include_router(profiling.router)
 
 @app.get("/", tags=["root"])
 async def root():
@@ -59,6 +91,28 @@ async def health_check():
         version="0.1.0"
     )
 
+@app.get("/health/pool", tags=["health"])
+async def pool_health():
+    """Connection pool statistics: checked-out, overflow and checkout wait time."""
+    engines = get_engines()
+    return {
+        "primary": pool_stats(engines.async_engine),
+        "replicas": [pool_stats(replica) for replica in engines.replica_engines],
+        "shards": [pool_stats(shard) for shard in engines.shard_engines],
+    }
+
+@app.get("/health/startup", tags=["health"])
+async def startup_health(request: Request):
+    """Startup timings of this worker: imports, schema creation and warm-up."""
+    report = getattr(request.app.state, "startup_report", None)
+    return report.as_dict() if report is not None else {}
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", tags=["health"], include_in_schema=False)
+    async def metrics():
+        """Prometheus metrics in text exposition format."""
+        return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/api/v1/health", response_model=HealthCheck, tags=["health"])
 async def api_health_check():
     """API health check endpoint."""
@@ -0,0 +1,36 @@
+"""
+Schema migrations (Alembic).
+
+``Base.metadata.create_all`` builds a new database at the current schema,
+search index and counter triggers included. The revisions in ``versions/``
+bring databases created by earlier releases up to date:
+
+* ``0001`` adds ``items.version``, which item ETags are derived from.
+* ``0002`` adds the full-text search index and backfills it.
+* ``0003`` installs the item counter triggers and backfills the counters.
+
+Each revision checks what is already there, so upgrading a database that
+``create_all`` has just built only records the revision. ``init_db``
+(``km-pyapi init-db``) creates missing tables and then upgrades; nothing
+migrates at startup unless ``AUTO_CREATE_SCHEMA`` is set. New revisions
+are written with ``alembic revision -m "..."`` from the repository root.
+"""
+
+import os
+from typing import Optional
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Connection
+
+SCRIPT_LOCATION = os.path.dirname(os.path.abspath(__file__))
+
+def alembic_config(connection: Optional[Connection] = None) -> Config:
+    """Alembic configuration migrating ``connection`` (default: ``DATABASE_URL``)."""
+    config = Config()
+    config.set_main_option("script_location", SCRIPT_LOCATION)
+    config.attributes["connection"] = connection
+    return config
+
+def upgrade(connection: Connection, revision: str = "head") -> None:
+    """Apply the migrations up to ``revision`` in ``connection``'s transaction."""
+    command.upgrade(alembic_config(connection), revision)
@@ -0,0 +1,26 @@
+"""Alembic environment: migrates the connection handed over by ``upgrade``, else ``DATABASE_URL``."""
+
+from alembic import context
+from py_api_framework import models  # noqa: F401 - registers the tables on Base.metadata
+from py_api_framework.config import settings
+from py_api_framework.database import Base, build_engine
+
+def run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=Base.metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    # Revisions inspect the database to skip work already done
+    raise SystemExit("Offline (--sql) migrations are not supported")
+
+connection = context.config.attributes.get("connection")
+if connection is not None:
+    run_migrations(connection)
+else:
+    db_engine = build_engine(settings.DATABASE_URL)
+    try:
+        with db_engine.begin() as connection:
+            run_migrations(connection)
+    finally:
+        db_engine.dispose()
@@ -0,0 +1,24 @@
+"""Add items.version, bumped by every update, for ETags
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("items")}
+    if "version" not in columns:
+        op.add_column(
+            "items", sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1"))
+        )
+
+def downgrade() -> None:
+    op.drop_column("items", "version")
@@ -0,0 +1,39 @@
+"""Add the full-text search index over item titles and descriptions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:01
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from py_api_framework.search import POSTGRES_DDL, SQLITE_DDL
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.execute(
+            sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'")
+        ).first()
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        if not exists:
+            op.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            op.execute(statement)
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in ("items_fts_ai", "items_fts_ad", "items_fts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS items_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_items_search")
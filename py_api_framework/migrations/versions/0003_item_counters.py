@@ -0,0 +1,39 @@
+"""Install the item counter triggers and backfill the counters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:02
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from py_api_framework.counters import BACKFILL, POSTGRES_DDL, SQLITE_DDL, TRIGGER_DIALECTS
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    if dialect not in TRIGGER_DIALECTS:
+        return
+    for statement in SQLITE_DDL if dialect == "sqlite" else POSTGRES_DDL:
+        op.execute(statement)
+    # Counters are empty when the triggers are new; a database built by
+    # create_all has had them all along
+    counted = connection.execute(sa.text("SELECT 1 FROM item_counts LIMIT 1")).first()
+    if not counted and connection.execute(sa.text("SELECT 1 FROM items LIMIT 1")).first():
+        for statement in BACKFILL[dialect]:
+            op.execute(statement)
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in ("item_counts_ai", "item_counts_ad", "item_counts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    elif dialect == "postgresql":
+        op.execute("DROP TRIGGER IF EXISTS item_counts_insert_delete ON items")
+        op.execute("DROP TRIGGER IF EXISTS item_counts_owner_change ON items")
+        op.execute("DROP FUNCTION IF EXISTS item_counts_maintain()")
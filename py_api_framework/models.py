@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Index, literal_column, text
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -17,10 +17,68 @@ class User(Base):
 class Item(Base):
     """Item model for the API."""
     __tablename__ = "items"
+    __table_args__ = (
+        # Serves owner-scoped keyset pages as a single index range scan
+        Index("ix_items_owner_id_id", "owner_id", "id"),
+        # Never reuse the id of a deleted item, so its ETag cannot come back
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True, nullable=False)
     description = Column(String, index=True)
     owner_id = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped by every UPDATE; ETags use it because updated_at has one-second
+    # resolution on SQLite
+    version = Column(
+        Integer, nullable=False, default=1, server_default=text("1"),
+        onupdate=literal_column("version") + 1
+    )
+
+class ItemCount(Base):
+    """Number of items per owner, maintained by triggers on ``items``."""
+    __tablename__ = "item_counts"
+
+    owner_id = Column(Integer, primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0)
+
+class ItemDailyCount(Base):
+    """Items created per owner per UTC day, maintained by triggers on ``items``."""
+    __tablename__ = "item_daily_counts"
+
+    owner_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    created = Column(Integer, nullable=False, default=0)
+
+class RefreshToken(Base):
+    """A single-use refresh token, stored as its SHA-256 digest.
+
+    Tokens issued by rotating one another share a ``family_id``, so reuse of
+    a spent token can revoke the whole chain.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, index=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    used_at = Column(DateTime(timezone=True))
+    revoked_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IdBlock(Base):
+    """Next unreserved id of a sequence whose ids are handed out in blocks."""
+    __tablename__ = "id_blocks"
+
+    name = Column(String(64), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+class ShardMove(Base):
+    """An owner whose items are being moved between shards; their writes are refused."""
+    __tablename__ = "shard_moves"
+
+    owner_id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
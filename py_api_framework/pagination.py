@@ -0,0 +1,70 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Cursors are opaque URL-safe tokens wrapping the primary key of the last row
+on the previous page, so each page is a range scan starting after that key
+instead of an ``OFFSET`` that grows with page depth.
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def encode_cursor_payload(payload: Dict[str, Any]) -> str:
+    """Encode the sort key of the last returned row as an opaque cursor."""
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor_payload(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Decode a cursor back to its sort key; empty means the first page."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, dict) or not isinstance(payload.get("id"), int):
+            raise ValueError(payload)
+        return payload
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the id of the last returned row as an opaque cursor."""
+    return encode_cursor_payload({"id": last_id})
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Decode an id cursor back to the last seen id; empty means the first page."""
+    payload = decode_cursor_payload(cursor)
+    return payload["id"] if payload is not None else None
+
+async def paginate_keyset(
+    db: AsyncSession,
+    stmt: Select,
+    key_column: Any,
+    cursor: Optional[str],
+    limit: int,
+    scalars: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """Return one page of ``stmt`` ordered by ``key_column`` and the next cursor.
+
+    One extra row is fetched to learn whether another page exists, so the
+    last page reports ``next_cursor=None`` without a separate count query.
+    Pass ``scalars=False`` when ``stmt`` selects columns rather than an entity.
+    """
+    last_id = decode_cursor(cursor)
+    if last_id is not None:
+        stmt = stmt.where(key_column > last_id)
+    limit = max(limit, 0)
+    result = await db.execute(stmt.order_by(key_column).limit(limit + 1))
+    rows = result.scalars().all() if scalars else result.all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+    return list(rows), next_cursor
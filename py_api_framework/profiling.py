@@ -0,0 +1,317 @@
+"""
+Opt-in request profiling.
+
+With ``PROFILING_ENABLED`` set, ``ProfilingMiddleware`` profiles a random
+``PROFILING_SAMPLE_RATE`` fraction of requests plus any request whose
+``X-Debug-Profile`` header matches ``PROFILING_DEBUG_TOKEN``. A profiled
+request gets:
+
+* a sampling stack profile of the event loop thread, taken every
+  ``PROFILING_INTERVAL_MS`` by a helper thread (wall-clock, so time spent
+  awaiting I/O shows up under the event loop's selector frames);
+* every SQL statement it ran, with its duration, from cursor hooks on the
+  application engines.
+
+Profiles are kept in a bounded in-memory ring served by the
+``/debug/profiles`` endpoints (collapsed stacks for ``flamegraph.pl`` or a
+speedscope JSON document) and, if ``PROFILING_OUTPUT_DIR`` is set, written
+there as files. Only one request is profiled at a time per worker; overlapping
+candidates are served unprofiled.
+
+When profiling is disabled none of this is installed: no middleware, no
+engine hooks and no endpoints.
+"""
+
+import hmac
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+PROFILE_HEADER = "x-debug-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+PROFILES_PATH = "/debug/profiles"
+
+Stack = Tuple[str, ...]
+
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profile:
+    """Stack samples and SQL statements captured for one request."""
+
+    def __init__(self, profile_id: int, method: str, path: str, interval: float):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = 0.0
+        self.status_code: Optional[int] = None
+        self.samples: "Counter[Stack]" = Counter()
+        self.statements: List[Dict[str, Any]] = []
+
+    def summary(self) -> Dict[str, Any]:
+        """Return request metadata and SQL totals, without the stacks."""
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.samples.values()),
+            "sql_count": len(self.statements),
+            "sql_ms": round(sum(s["duration_ms"] for s in self.statements), 3),
+        }
+
+    def collapsed(self) -> str:
+        """Render samples in collapsed-stack format (``a;b;c count`` per line)."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items())
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Render samples as a speedscope "sampled" profile document."""
+        frame_index: Dict[str, int] = {}
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        interval_ms = self.interval * 1000
+        for stack, count in self.samples.items():
+            samples.append([frame_index.setdefault(name, len(frame_index)) for name in stack])
+            weights.append(count * interval_ms)
+        name = f"{self.method} {self.path}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "py_api_framework",
+            "shared": {"frames": [{"name": frame} for frame in frame_index]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary plus the captured SQL statements."""
+        return {**self.summary(), "sql": self.statements}
+
+class StackSampler(threading.Thread):
+    """Samples the stack of ``thread_id`` every ``interval`` seconds into ``profile``."""
+
+    def __init__(self, thread_id: int, profile: Profile):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.profile = profile
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.profile.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.profile.samples[tuple(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+_current_profile: ContextVar[Optional[Profile]] = ContextVar("current_profile", default=None)
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    if _current_profile.get() is not None:
+        conn.info["profiling_query_start"] = time.perf_counter()
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    profile = _current_profile.get()
+    start = conn.info.pop("profiling_query_start", None)
+    if profile is not None and start is not None:
+        profile.statements.append({
+            "statement": statement,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+        })
+
+def instrument_engine(db_engine: Engine) -> None:
+    """Record SQL statements run on ``db_engine`` into the active profile."""
+    if not event.contains(db_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the most recent profiles."""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        token: str = "",
+        interval_ms: float = 1.0,
+        max_profiles: int = 50,
+        output_dir: str = ""
+    ):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.profiles: Deque[Profile] = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+        self._running = threading.Lock()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """True when ``token`` matches the configured debug token."""
+        return bool(self.token and token) and hmac.compare_digest(
+            token.encode(), self.token.encode()
+        )
+
+    def wants(self, headers: Dict[bytes, bytes]) -> bool:
+        """Whether a request with ``headers`` should be profiled."""
+        requested = headers.get(PROFILE_HEADER.encode())
+        if requested is not None and self.authorized(requested.decode("latin-1")):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method: str, path: str) -> Optional[Tuple[Profile, StackSampler]]:
+        """Begin profiling on the calling thread, or return None if one is running."""
+        if not self._running.acquire(blocking=False):
+            return None
+        profile = Profile(next(self._ids), method, path, self.interval)
+        sampler = StackSampler(threading.get_ident(), profile)
+        sampler.start()
+        return profile, sampler
+
+    async def finish(self, profile: Profile, sampler: StackSampler) -> None:
+        """Stop sampling, store the profile and write it out if configured."""
+        try:
+            await run_in_threadpool(sampler.stop)
+        finally:
+            self._running.release()
+        self.profiles.append(profile)
+        if self.output_dir:
+            await run_in_threadpool(self.write, profile)
+
+    def write(self, profile: Profile) -> None:
+        """Write collapsed stacks, speedscope JSON and SQL for ``profile`` to disk."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{os.getpid()}-{profile.id}")
+        with open(f"{base}.collapsed", "w") as f:
+            f.write(profile.collapsed())
+        with open(f"{base}.speedscope.json", "w") as f:
+            json.dump(profile.speedscope(), f)
+        with open(f"{base}.json", "w") as f:
+            json.dump(profile.to_dict(), f, indent=2)
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling sampled or explicitly requested HTTP requests."""
+
+    def __init__(self, app: Any, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(PROFILES_PATH)
+            or not self.profiler.wants(dict(scope["headers"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+        started = self.profiler.start(scope["method"], scope["path"])
+        if started is None:
+            await self.app(scope, receive, send)
+            return
+        profile, sampler = started
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.encode(), str(profile.id).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - start
+            _current_profile.reset(token)
+            await self.profiler.finish(profile, sampler)
+
+profiler = RequestProfiler(
+    sample_rate=settings.PROFILING_SAMPLE_RATE,
+    token=settings.PROFILING_DEBUG_TOKEN,
+    interval_ms=settings.PROFILING_INTERVAL_MS,
+    max_profiles=settings.PROFILING_MAX_PROFILES,
+    output_dir=settings.PROFILING_OUTPUT_DIR
+)
+
+def get_profiler() -> RequestProfiler:
+    """Dependency returning the process-wide profiler."""
+    return profiler
+
+def require_debug_token(
+    x_debug_profile: Optional[str] = Header(None),
+    current: RequestProfiler = Depends(get_profiler)
+) -> RequestProfiler:
+    """Allow access only with the configured ``X-Debug-Profile`` token."""
+    if not current.authorized(x_debug_profile):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    return current
+
+router = APIRouter(prefix=PROFILES_PATH, tags=["debug"], include_in_schema=False)
+
+def _get_profile(current: RequestProfiler, profile_id: int) -> Profile:
+    profile = current.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
+
+@router.get("")
+async def list_profiles(current: RequestProfiler = Depends(require_debug_token)):
+    """Summaries of the retained profiles, newest first."""
+    return [profile.summary() for profile in reversed(current.profiles)]
+
+@router.get("/{profile_id}")
+async def read_profile(profile_id: int, current: RequestProfiler = Depends(require_debug_token)):
+    """Summary and SQL statements of one profile."""
+    return _get_profile(current, profile_id).to_dict()
+
+@router.get("/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def read_profile_collapsed(
+    profile_id: int,
+    current: RequestProfiler = Depends(require_debug_token)
+):
+    """Collapsed stacks, for flamegraph.pl, inferno or speedscope."""
+    return _get_profile(current, profile_id).collapsed()
+
+@router.get("/{profile_id}/speedscope")
+async def read_profile_speedscope(
+    profile_id: int,
+    current: RequestProfiler = Depends(require_debug_token)
+):
+    """Speedscope JSON document (open at https://www.speedscope.app)."""
+    return _get_profile(current, profile_id).speedscope()
@@ -0,0 +1,247 @@
+"""
+Rate limiting and failed-login lockout.
+
+Limits use a sliding-window counter: the count in the current fixed window
+plus the previous window's count weighted by how much of it still overlaps
+the sliding window. That takes one ``incr`` and one ``get`` per check, with
+any backend that supports those two operations.
+
+* ``RateLimitMiddleware`` applies ``RATE_LIMIT_PER_IP`` to every request
+  and ``RATE_LIMIT_PER_USER`` to requests with a valid bearer token, before
+  routing.
+* ``route_limit(name)`` is a dependency applying the per-IP limit
+  configured for ``name`` in ``RATE_LIMIT_ROUTES`` (e.g. ``register``).
+* ``LoginGuard`` counts failed logins per (username, client address) and,
+  once ``LOGIN_LOCKOUT_ATTEMPTS`` is reached, rejects further attempts before
+  any database query or bcrypt work.
+
+Counters live in an in-process ``MemoryCounterStore`` (one per worker), or
+in Redis when ``RATE_LIMIT_REDIS_URL`` is set, so that all workers share
+the limits.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from .auth import verify_token
+from .config import settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_limit(spec: str) -> Optional[Tuple[int, int]]:
+    """Parse ``"<count>/<period>"`` (e.g. ``"5/minute"``) into (count, seconds)."""
+    if not spec:
+        return None
+    count, _, period = spec.partition("/")
+    period = period.strip().rstrip("s")
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate limit {spec!r}; expected e.g. '10/minute'")
+    return int(count), PERIODS[period]
+
+class MemoryCounterStore:
+    """In-process counters with expiry, bounded to ``max_keys`` entries."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> int:
+        entry = self._data.get(key)
+        if entry is None:
+            return 0
+        if entry[0] <= now:
+            del self._data[key]
+            return 0
+        return entry[1]
+
+    async def incr(self, key: str, ttl: int) -> int:
+        """Increment ``key``, starting a ``ttl``-second expiry when it is new."""
+        now = time.monotonic()
+        with self._lock:
+            value = self._live(key, now) + 1
+            expires_at = self._data[key][0] if value > 1 else now + ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+            return value
+
+    async def get(self, key: str) -> int:
+        with self._lock:
+            return self._live(key, time.monotonic())
+
+    async def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+class RedisCounterStore:
+    """Counters in Redis, shared by every worker.
+
+    ``client`` is a ``redis.asyncio.Redis`` (or any object with the same
+    ``pipeline``/``get``/``delete`` coroutine API).
+    """
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def incr(self, key: str, ttl: int) -> int:
+        # SET NX creates the key with its TTL only once; unlike EXPIRE NX it
+        # works on Redis servers before 7.0
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, 0, ex=ttl, nx=True)
+        pipe.incr(self.prefix + key)
+        _, value = await pipe.execute()
+        return int(value)
+
+    async def get(self, key: str) -> int:
+        value = await self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        """Shared counters are left to expire on their own."""
+
+def build_store() -> Any:
+    """Create the counter store selected by ``RATE_LIMIT_REDIS_URL``."""
+    if settings.RATE_LIMIT_REDIS_URL:
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise RuntimeError(
+                "RATE_LIMIT_REDIS_URL requires the redis package: pip install 'km-pyapi[redis]'"
+            ) from exc
+        return RedisCounterStore(redis.from_url(settings.RATE_LIMIT_REDIS_URL))
+    return MemoryCounterStore()
+
+def too_many_requests(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+class RateLimiter:
+    """Sliding-window limits on top of a counter store."""
+
+    def __init__(self, store: Any, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.clock = clock
+
+    async def hit(self, key: str, limit: Tuple[int, int]) -> Optional[int]:
+        """Count a request against ``key``; return seconds to wait if over ``limit``."""
+        count, period = limit
+        now = self.clock()
+        window = int(now // period)
+        elapsed = now - window * period
+        current = await self.store.incr(f"{key}:{window}", ttl=2 * period)
+        previous = await self.store.get(f"{key}:{window - 1}")
+        if previous * (period - elapsed) / period + current <= count:
+            return None
+        if current > count:
+            return max(1, math.ceil(period - elapsed))
+        # Over only because of the previous window's weight, which decays linearly
+        return max(1, math.ceil(period - elapsed - period * (count - current) / previous))
+
+class LoginGuard:
+    """Locks a (username, client) pair out after repeated failed logins.
+
+    Keying on the pair means an attacker guessing one account's password is
+    stopped without letting anyone lock the real user out from elsewhere.
+    """
+
+    def __init__(self, store: Any, attempts: int, lockout_seconds: int):
+        self.store = store
+        self.attempts = attempts
+        self.lockout_seconds = lockout_seconds
+
+    @staticmethod
+    def _key(username: str, client: str) -> str:
+        return f"login-failures:{client}:{username.lower()}"
+
+    async def check(self, username: str, client: str) -> None:
+        """Raise 429 if the pair is locked out."""
+        if self.attempts and await self.store.get(self._key(username, client)) >= self.attempts:
+            raise too_many_requests(self.lockout_seconds)
+
+    async def record_failure(self, username: str, client: str) -> None:
+        if self.attempts:
+            await self.store.incr(self._key(username, client), ttl=self.lockout_seconds)
+
+    async def reset(self, username: str, client: str) -> None:
+        await self.store.delete(self._key(username, client))
+
+def client_address(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+store = build_store()
+limiter = RateLimiter(store)
+login_guard = LoginGuard(store, settings.LOGIN_LOCKOUT_ATTEMPTS, settings.LOGIN_LOCKOUT_SECONDS)
+ROUTE_LIMITS: Dict[str, Optional[Tuple[int, int]]] = {
+    name: parse_limit(spec) for name, spec in settings.RATE_LIMIT_ROUTES.items()
+}
+
+def route_limit(name: str) -> Callable[[Request], Any]:
+    """Dependency enforcing the ``RATE_LIMIT_ROUTES[name]`` limit per client address."""
+
+    async def check_route_limit(request: Request) -> None:
+        limit = ROUTE_LIMITS.get(name)
+        if not settings.RATE_LIMIT_ENABLED or limit is None:
+            return
+        retry_after = await limiter.hit(f"route:{name}:{client_address(request)}", limit)
+        if retry_after is not None:
+            raise too_many_requests(retry_after)
+
+    return check_route_limit
+
+class RateLimitMiddleware:
+    """ASGI middleware applying the global per-IP and per-user limits."""
+
+    def __init__(self, app: Any, rate_limiter: RateLimiter):
+        self.app = app
+        self.limiter = rate_limiter
+        self.per_ip = parse_limit(settings.RATE_LIMIT_PER_IP)
+        self.per_user = parse_limit(settings.RATE_LIMIT_PER_USER)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        retry_after = None
+        if self.per_ip is not None:
+            client = scope["client"][0] if scope.get("client") else "unknown"
+            retry_after = await self.limiter.hit(f"ip:{client}", self.per_ip)
+        if retry_after is None and self.per_user is not None:
+            username = self._username(scope)
+            if username is not None:
+                retry_after = await self.limiter.hit(f"user:{username}", self.per_user)
+        if retry_after is not None:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _username(scope: Dict[str, Any]) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    # Verified (and cached) so a forged subject cannot spend another user's budget
+                    return verify_token(token)
+        return None
@@ -0,0 +1,142 @@
+"""
+Rotating refresh tokens.
+
+``/auth/token`` returns a refresh token next to the short-lived access
+token. ``/auth/refresh`` exchanges it for a new pair without the password,
+so clients stay signed in without paying for a bcrypt verify every
+``ACCESS_TOKEN_EXPIRE_MINUTES``.
+
+* Tokens are random, and only their SHA-256 digest is stored. A digest
+  lookup on a unique index is all a refresh needs; a slow hash buys nothing
+  for 256 random bits.
+* Each token is single use. It is spent by one conditional
+  ``UPDATE ... RETURNING``, so two concurrent refreshes cannot both succeed.
+* Tokens descending from one login share a family. Presenting an already
+  spent token means it leaked, so the whole family is revoked.
+* Expired rows are deleted ``REFRESH_TOKEN_PURGE_BATCH_SIZE`` at a time by
+  ``purge_expired``, which the app runs every
+  ``REFRESH_TOKEN_PURGE_INTERVAL_SECONDS``.
+"""
+
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database
+from .config import settings
+from .models import RefreshToken, User
+
+logger = logging.getLogger("uvicorn.error")
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue(db: AsyncSession, user_id: int, family_id: Optional[str] = None) -> str:
+    """Add a new refresh token for ``user_id`` to the session and return it."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=hash_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+async def rotate(db: AsyncSession, token: str) -> Optional[Tuple[User, str]]:
+    """Spend ``token`` and issue its successor.
+
+    Returns the token's active user and the new refresh token, or None if
+    ``token`` is unknown, expired, revoked or already spent. Reuse of a
+    spent token revokes its family. Commits either way.
+    """
+    now = datetime.now(timezone.utc)
+    token_hash = hash_token(token)
+    spent = (await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(used_at=now)
+        .returning(RefreshToken.user_id, RefreshToken.family_id)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if spent is None:
+        # Only the failure path pays for telling reuse apart from garbage
+        reused = await db.scalar(
+            select(RefreshToken.family_id)
+            .where(RefreshToken.token_hash == token_hash, RefreshToken.used_at.is_not(None))
+        )
+        if reused is not None:
+            await revoke_family(db, reused)
+        return None
+
+    user_id, family_id = spent
+    user = await db.get(User, user_id)
+    if user is None or not user.is_active:
+        await revoke_family(db, family_id)
+        return None
+    new_token = issue(db, user_id, family_id)
+    await db.commit()
+    return user, new_token
+
+async def revoke_family(db: AsyncSession, family_id: str) -> None:
+    """Revoke every live token in ``family_id`` and commit."""
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+async def revoke(db: AsyncSession, token: str) -> None:
+    """Revoke the family ``token`` belongs to (logout)."""
+    family_id = await db.scalar(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_token(token))
+    )
+    if family_id is not None:
+        await revoke_family(db, family_id)
+
+async def purge_expired(db: AsyncSession, batch_size: int) -> int:
+    """Delete expired tokens in batches of ``batch_size``, committing after each.
+
+    Ids are selected first rather than deleted through a ``LIMIT`` subquery,
+    which MySQL does not support.
+    """
+    now = datetime.now(timezone.utc)
+    purged = 0
+    while True:
+        ids = (await db.scalars(
+            select(RefreshToken.id).where(RefreshToken.expires_at <= now).limit(batch_size)
+        )).all()
+        if not ids:
+            return purged
+        await db.execute(
+            delete(RefreshToken)
+            .where(RefreshToken.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        purged += len(ids)
+        if len(ids) < batch_size:
+            return purged
+
+async def purge_periodically(interval: float) -> None:
+    """Run ``purge_expired`` every ``interval`` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with database.get_engines().AsyncSessionLocal() as db:
+                purged = await purge_expired(db, settings.REFRESH_TOKEN_PURGE_BATCH_SIZE)
+        except Exception as exc:  # retried on the next interval
+            logger.warning("Refresh token purge failed: %r", exc)
+            continue
+        if purged:
+            logger.info("Purged %d expired refresh tokens", purged)
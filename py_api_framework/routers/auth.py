@@ -1,75 +1,157 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database, auth
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from .. import models, schemas, database, auth, fieldsets, refresh_tokens
 from ..auth import get_current_active_user
+from ..pagination import paginate_keyset
+from ..ratelimit import client_address, login_guard, route_limit
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-@router.post("/register", response_model=schemas.User)
+def _duplicate_user_detail(exc: IntegrityError) -> str:
+    """Name the unique column a failed user INSERT collided with.
+
+    SQLite reports the column (``users.email``) and PostgreSQL the index
+    (``ix_users_email``) on the first line of the error; later lines may
+    echo the submitted values, so they are ignored.
+    """
+    message = str(exc.orig).splitlines()[0] if str(exc.orig) else ""
+    if "users.email" in message or "users_email" in message:
+        return "Email already registered"
+    return "Username already registered"
+
+@router.post("/register", response_model=schemas.User, dependencies=[Depends(route_limit("register"))])
 async def register_user(
     user: schemas.UserCreate,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
-    """Register a new user."""
-    # Check if username already exists
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if db_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
+    """Register a new user.
+
+    Known duplicates are rejected by one indexed lookup before the password
+    is hashed, so they cost no slot in the hash pool. The user is then
+    created with a single INSERT ... RETURNING; the unique indexes on
+    ``username`` and ``email`` still catch concurrent registrations.
+    """
+    taken = (await db.execute(
+        select(models.User.username, models.User.email)
+        .where(or_(models.User.username == user.username, models.User.email == user.email))
+        .limit(2)
+    )).all()
+    if taken:
+        detail = "Username already registered"
+        if all(username != user.username for username, _ in taken):
+            detail = "Email already registered"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    hashed_password = await auth.get_password_hash_async(user.password)
+    try:
+        db_user = await db.scalar(
+            insert(models.User)
+            .values(username=user.username, email=user.email, hashed_password=hashed_password)
+            .returning(models.User)
         )
-    
-    # Check if email already exists
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if db_user:
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Create new user
-    hashed_password = auth.get_password_hash(user.password)
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+            detail=_duplicate_user_detail(exc)
+        ) from exc
+    # The new user's first authenticated reads must see this row
+    database.replica_router.mark_write(database.user_client_key(db_user.username))
     return db_user
 
-@router.post("/token", response_model=schemas.Token)
+@router.post("/token", response_model=schemas.Token, dependencies=[Depends(route_limit("token"))])
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
     """Login to get access token."""
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    # Locked-out clients are turned away before any query or bcrypt work
+    client = client_address(request)
+    await login_guard.check(form_data.username, client)
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        await login_guard.record_failure(form_data.username, client)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
+    await login_guard.reset(form_data.username, client)
+    access_token = auth.create_access_token(data={"sub": user.username})
+    refresh_token = refresh_tokens.issue(db, user.id)
+    await db.commit()
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    body: schemas.RefreshRequest,
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Exchange a refresh token for a new access token and refresh token.
+
+    No password check: the refresh token is spent in one indexed UPDATE.
+    Reusing a spent refresh token revokes every token from that login.
+    """
+    rotated = await refresh_tokens.rotate(db, body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
     access_token = auth.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/logout")
+async def logout(
+    body: schemas.RefreshRequest,
+    db: AsyncSession = Depends(database.get_db)
+):
+    """Revoke a refresh token and every token rotated from the same login."""
+    await refresh_tokens.revoke(db, body.refresh_token)
+    return {"message": "Logged out"}
 
 @router.get("/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_active_user)):
+async def read_users_me(current_user: schemas.User = Depends(get_current_active_user)):
     """Get current user information."""
     return current_user
 
-@router.get("/users", response_model=List[schemas.User])
+@router.get("/users", response_model=Union[List[schemas.User], schemas.UserPage])
 async def read_users(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Get list of users (admin only)."""
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users 
\ No newline at end of file
+    """Get list of users (admin only), optionally keyset-paginated via ``cursor``.
+
+    ``fields=id,username`` loads and returns only those fields of each user.
+    """
+    field_set = fieldsets.parse_fields(fields, schemas.User)
+    stmt = select(models.User)
+    if field_set is not None:
+        stmt = stmt.options(fieldsets.load_only_fields(models.User, field_set))
+    next_cursor = None
+    if cursor is not None:
+        users, next_cursor = await paginate_keyset(db, stmt, models.User.id, cursor, limit)
+    else:
+        result = await db.execute(stmt.order_by(models.User.id).offset(skip).limit(limit))
+        users = result.scalars().all()
+    if field_set is not None:
+        if cursor is not None:
+            body = fieldsets.dump_page(schemas.User, field_set, users, next_cursor, fast=False)
+        else:
+            body = fieldsets.dump_list(schemas.User, field_set, users, fast=False)
+        return Response(content=body, media_type="application/json")
+    if cursor is not None:
+        return schemas.UserPage(items=users, next_cursor=next_cursor)
+    return users
@@ -1,115 +1,500 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database, auth
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import Select, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Union
+from .. import models, schemas, database, auth, changefeed, counters, fieldsets, search, sharding
 from ..auth import get_current_active_user
+from ..config import settings
+from ..export import EXPORT_MEDIA_TYPES, csv_chunks, gzip_chunks, ndjson_chunks
+from ..http_cache import (
+    collection_etag,
+    if_none_match,
+    item_etag,
+    json_etag_response,
+    not_modified,
+    response_cache,
+)
+from ..pagination import paginate_keyset
+from ..serialization import ITEM_COLUMNS, ITEM_VERSION_FIELDS, dump_item, dump_item_list, dump_item_page
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+def _item_select(fast: bool, fields: Optional[fieldsets.FieldSet]) -> Select:
+    """SELECT for item rows: column tuples (fast) or ORM objects, narrowed to ``fields``."""
+    if fields is None:
+        return select(*ITEM_COLUMNS, models.Item.version) if fast else select(models.Item)
+    if fast:
+        return select(*fieldsets.columns(models.Item, fields, ITEM_VERSION_FIELDS))
+    return select(models.Item).options(
+        fieldsets.load_only_fields(models.Item, fields, ITEM_VERSION_FIELDS)
+    )
+
+async def _item_list_response(
+    request: Request,
+    db: AsyncSession,
+    owner_id: Optional[int],
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    include_total: bool = False,
+    fields: Optional[fieldsets.FieldSet] = None
+) -> Response:
+    """Serve an item list or keyset page with ETag validation.
+
+    With ``FAST_JSON_RESPONSES`` the rows are column tuples serialized
+    through the precompiled adapters; otherwise ORM objects are validated
+    into ``schemas.Item``. Either way serialization is skipped entirely for
+    a matching ``If-None-Match`` or a server-side cache hit.
+    ``include_total`` adds an ``X-Total-Count`` header read from the
+    maintained item counters. With sharding, the global list (no
+    ``owner_id``) is gathered from every shard. ``fields`` narrows both
+    the SELECT and the body to a sparse fieldset.
+    """
+    fast = settings.FAST_JSON_RESPONSES
+    stmt = _item_select(fast, fields)
+    if owner_id is not None:
+        stmt = stmt.where(models.Item.owner_id == owner_id)
+    scatter = owner_id is None and sharding.enabled()
+    next_cursor = None
+    if scatter:
+        rows, next_cursor = await sharding.list_items(stmt, skip, limit, cursor, scalars=not fast)
+    elif cursor is not None:
+        rows, next_cursor = await paginate_keyset(
+            db, stmt, models.Item.id, cursor, limit, scalars=not fast
+        )
+    else:
+        result = await db.execute(stmt.order_by(models.Item.id).offset(skip).limit(limit))
+        rows = result.all() if fast else result.scalars().all()
+
+    etag = collection_etag(rows, next_cursor)
+    if if_none_match(request, etag):
+        response = not_modified(etag)
+    else:
+        url = str(request.url)
+        body = response_cache.get(url, etag)
+        if body is None:
+            if cursor is not None:
+                body = dump_item_page(rows, next_cursor, fast, fields)
+            else:
+                body = dump_item_list(rows, fast, fields)
+            response_cache.set(url, etag, body, (row.id for row in rows))
+        response = json_etag_response(body, etag)
+    if include_total:
+        total = await (sharding.count_items() if scatter else counters.count_items(db, owner_id))
+        response.headers["X-Total-Count"] = str(total)
+    return response
+
 @router.post("/", response_model=schemas.Item)
 async def create_item(
     item: schemas.ItemCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
     """Create a new item."""
-    db_item = models.Item(
-        **item.model_dump(),
-        owner_id=current_user.id
-    )
+    row, = await sharding.with_item_ids([{**item.model_dump(), "owner_id": current_user.id}])
+    db_item = models.Item(**row)
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
+    await changefeed.broker.publish_items("created", [db_item])
     return db_item
 
-@router.get("/", response_model=List[schemas.Item])
+@router.get("/", response_model=Union[List[schemas.Item], schemas.ItemPage])
 async def read_items(
+    request: Request,
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Get list of items."""
-    items = db.query(models.Item).offset(skip).limit(limit).all()
-    return items
+    """Get list of items.
+
+    Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination and returns an ``ItemPage`` envelope with ``next_cursor``.
+    ``include_total=true`` adds the total item count as ``X-Total-Count``.
+    ``fields=id,title`` returns only those fields of each item.
+    """
+    return await _item_list_response(
+        request, db, None, skip, limit, cursor, include_total,
+        fieldsets.parse_fields(fields, schemas.Item)
+    )
 
-@router.get("/my-items", response_model=List[schemas.Item])
+@router.get("/my-items", response_model=Union[List[schemas.Item], schemas.ItemPage])
 async def read_my_items(
+    request: Request,
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(sharding.get_item_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Get current user's items, optionally keyset-paginated via ``cursor``
+    and narrowed to a sparse fieldset via ``fields``."""
+    return await _item_list_response(
+        request, db, current_user.id, skip, limit, cursor, include_total,
+        fieldsets.parse_fields(fields, schemas.Item)
+    )
+
+@router.get("/count", response_model=schemas.ItemCount)
+async def count_items(
+    mine: bool = True,
+    db: AsyncSession = Depends(sharding.get_item_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Count the current user's items, or all items with ``mine=false``.
+
+    Reads the maintained per-owner counters rather than scanning ``items``.
+    """
+    if not mine and sharding.enabled():
+        return schemas.ItemCount(count=await sharding.count_items())
+    owner_id = current_user.id if mine else None
+    return schemas.ItemCount(count=await counters.count_items(db, owner_id))
+
+@router.get("/stats", response_model=schemas.ItemStats)
+async def item_stats(
+    owners: int = Query(10, ge=1, le=1000),
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(database.get_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Aggregate item counts: the total, the ``owners`` largest owners, and
+    items created per UTC day over the last ``days`` days."""
+    if sharding.enabled():
+        total = await sharding.count_items()
+        top = await sharding.owner_counts(owners)
+        per_day = await sharding.created_per_day(days)
+    else:
+        total = await counters.count_items(db)
+        top = await counters.owner_counts(db, owners)
+        per_day = await counters.created_per_day(db, days)
+    return schemas.ItemStats(
+        total=total,
+        owners=[
+            schemas.OwnerItemCount(owner_id=owner_id, item_count=item_count)
+            for owner_id, item_count in top
+        ],
+        created_per_day=[
+            schemas.DailyItemCount(day=day, created=created) for day, created in per_day
+        ],
+    )
+
+@router.get("/search", response_model=schemas.ItemPage)
+async def search_items(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    mine: bool = False,
+    db: AsyncSession = Depends(sharding.get_item_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Full-text search over item titles and descriptions.
+
+    Every term is prefix-matched; results are ranked by relevance and
+    paginated with ``next_cursor``. ``mine=true`` restricts to the
+    current user's items.
+    """
+    if not mine and sharding.enabled():
+        items, next_cursor = await sharding.search_items(q, limit, cursor)
+    else:
+        items, next_cursor = await search.search_items(
+            db, q, limit, cursor, owner_id=current_user.id if mine else None
+        )
+    return schemas.ItemPage(items=items, next_cursor=next_cursor)
+
+@router.get("/export")
+async def export_my_items(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    db: AsyncSession = Depends(sharding.get_item_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Get current user's items."""
-    items = db.query(models.Item).filter(
-        models.Item.owner_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return items
+    """Stream all of the current user's items as NDJSON or CSV.
+
+    Rows are read through a server-side cursor in ``EXPORT_BATCH_SIZE``
+    partitions and serialized from column tuples without ORM hydration.
+    """
+    stmt = (
+        select(*ITEM_COLUMNS)
+        .where(models.Item.owner_id == current_user.id)
+        .order_by(models.Item.id)
+        .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    )
+
+    async def partitions():
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+
+    fields = [column.key for column in ITEM_COLUMNS]
+    encode = csv_chunks if export_format == "csv" else ndjson_chunks
+    body = encode(fields, partitions())
+    headers = {
+        "Content-Disposition": f'attachment; filename="items.{export_format}"'
+    }
+    if gzip:
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[export_format], headers=headers)
+
+@router.get("/changes")
+async def stream_changes(
+    since: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Stream the current user's item changes as Server-Sent Events.
+
+    Each event's ``id`` is its sequence number; reconnecting with
+    ``Last-Event-ID`` (or ``since``) replays the events missed in between.
+    A ``reset`` event means the client must refetch its items.
+    """
+    resume_from = last_event_id if last_event_id is not None else since
+    return StreamingResponse(
+        changefeed.sse_events(current_user.id, resume_from, settings.CHANGE_FEED_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/changes/ws")
+async def websocket_changes(
+    websocket: WebSocket,
+    since: Optional[int] = None,
+    current_user: schemas.User = Depends(auth.get_websocket_user)
+):
+    """Stream the current user's item changes as JSON WebSocket messages."""
+    await websocket.accept()
+    await changefeed.serve_websocket(websocket, current_user.id, since)
+
+def _check_bulk_size(count: int) -> None:
+    """Reject batches larger than ``BULK_MAX_ITEMS``."""
+    if count > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many records in batch (max {settings.BULK_MAX_ITEMS})"
+        )
+
+def _ownership_error(
+    index: int,
+    item_id: int,
+    owners: Dict[int, int],
+    user_id: int
+) -> Optional[schemas.BulkItemResult]:
+    """Return the per-record 404/403 result for ``item_id``, or None if owned."""
+    if item_id not in owners:
+        return schemas.BulkItemResult(
+            index=index, id=item_id,
+            status=status.HTTP_404_NOT_FOUND, detail="Item not found"
+        )
+    if owners[item_id] != user_id:
+        return schemas.BulkItemResult(
+            index=index, id=item_id,
+            status=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
+        )
+    return None
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def create_items_bulk(
+    batch: schemas.ItemBulkCreate,
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Create many items in a single INSERT ... RETURNING transaction."""
+    _check_bulk_size(len(batch.items))
+    if not batch.items:
+        return schemas.BulkResult(results=[])
+    rows = await sharding.with_item_ids(
+        [{**item.model_dump(), "owner_id": current_user.id} for item in batch.items]
+    )
+    result = await db.scalars(
+        insert(models.Item).returning(models.Item, sort_by_parameter_order=True),
+        rows
+    )
+    created = result.all()
+    await db.commit()
+    await changefeed.broker.publish_items("created", created)
+    return schemas.BulkResult(results=[
+        schemas.BulkItemResult(
+            index=index, id=db_item.id, status=status.HTTP_201_CREATED, item=db_item
+        )
+        for index, db_item in enumerate(created)
+    ])
+
+@router.patch("/bulk", response_model=schemas.BulkResult)
+async def update_items_bulk(
+    batch: schemas.ItemBulkUpdate,
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Update many items, checking ownership for the whole batch in one query."""
+    _check_bulk_size(len(batch.items))
+    owners = await sharding.owners_by_id(db, [entry.id for entry in batch.items])
+
+    results: List[Optional[schemas.BulkItemResult]] = []
+    params = []
+    for index, entry in enumerate(batch.items):
+        error = _ownership_error(index, entry.id, owners, current_user.id)
+        results.append(error)
+        if error is None:
+            values = entry.model_dump(exclude_unset=True, exclude={"id"})
+            if values:
+                params.append({"id": entry.id, **values})
+
+    if params:
+        await db.execute(update(models.Item), params)
+        await db.commit()
+        response_cache.invalidate_items(param["id"] for param in params)
+
+    updated_ids = {entry.id for index, entry in enumerate(batch.items) if results[index] is None}
+    updated = {}
+    if updated_ids:
+        result = await db.execute(
+            select(models.Item)
+            .where(models.Item.id.in_(updated_ids))
+            .execution_options(populate_existing=True)
+        )
+        updated = {db_item.id: db_item for db_item in result.scalars()}
+        changed = {param["id"] for param in params}
+        await changefeed.broker.publish_items(
+            "updated", [db_item for item_id, db_item in updated.items() if item_id in changed]
+        )
+
+    return schemas.BulkResult(results=[
+        result or schemas.BulkItemResult(
+            index=index, id=entry.id, status=status.HTTP_200_OK, item=updated[entry.id]
+        )
+        for index, (entry, result) in enumerate(zip(batch.items, results))
+    ])
+
+@router.delete("/bulk", response_model=schemas.BulkResult)
+async def delete_items_bulk(
+    batch: schemas.ItemBulkDelete,
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
+):
+    """Delete many items, checking ownership for the whole batch in one query."""
+    _check_bulk_size(len(batch.ids))
+    owners = await sharding.owners_by_id(db, batch.ids)
+
+    results = [
+        _ownership_error(index, item_id, owners, current_user.id)
+        for index, item_id in enumerate(batch.ids)
+    ]
+    deletable = {item_id for item_id, result in zip(batch.ids, results) if result is None}
+    if deletable:
+        await db.execute(
+            delete(models.Item)
+            .where(models.Item.id.in_(deletable))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        response_cache.invalidate_items(deletable)
+        await changefeed.broker.publish_deleted(current_user.id, sorted(deletable))
+
+    return schemas.BulkResult(results=[
+        result or schemas.BulkItemResult(
+            index=index, id=item_id, status=status.HTTP_200_OK, detail="Item deleted successfully"
+        )
+        for index, (item_id, result) in enumerate(zip(batch.ids, results))
+    ])
 
 @router.get("/{item_id}", response_model=schemas.Item)
 async def read_item(
     item_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    request: Request,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_read_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Get a specific item by ID."""
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    """Get a specific item by ID, honouring ``If-None-Match``.
+
+    ``fields=id,title`` loads and returns only those fields.
+    """
+    field_set = fieldsets.parse_fields(fields, schemas.Item)
+    options = ()
+    if field_set is not None:
+        options = (fieldsets.load_only_fields(models.Item, field_set, ITEM_VERSION_FIELDS),)
+    if sharding.enabled():
+        item = await sharding.get_item(item_id, *options)
+    else:
+        item = await db.get(models.Item, item_id, options=options)
     if item is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Item not found"
         )
-    return item
+    etag = item_etag(item)
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    url = str(request.url)
+    body = response_cache.get(url, etag)
+    if body is None:
+        body = dump_item(item, field_set)
+        response_cache.set(url, etag, body, (item.id,))
+    return json_etag_response(body, etag)
+
+async def _missing_or_forbidden(db: AsyncSession, item_id: int) -> HTTPException:
+    """Explain why an owner-scoped write matched no row: 404 or 403."""
+    if item_id not in await sharding.owners_by_id(db, [item_id]):
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not found"
+        )
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not enough permissions"
+    )
 
 @router.put("/{item_id}", response_model=schemas.Item)
 async def update_item(
     item_id: int,
     item_update: schemas.ItemUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Update an item."""
-    db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if db_item is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item not found"
-        )
-    
-    if db_item.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
-    
+    """Update an item.
+
+    One ``UPDATE ... WHERE id AND owner_id RETURNING`` statement; only when
+    it matches nothing is the row looked up to choose between 404 and 403.
+    """
+    owned = (models.Item.id == item_id) & (models.Item.owner_id == current_user.id)
     update_data = item_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_item, field, value)
-    
-    db.commit()
-    db.refresh(db_item)
+    if update_data:
+        db_item = await db.scalar(
+            update(models.Item).where(owned).values(**update_data).returning(models.Item)
+        )
+    else:
+        db_item = await db.scalar(select(models.Item).where(owned))
+    if db_item is None:
+        raise await _missing_or_forbidden(db, item_id)
+
+    await db.commit()
+    response_cache.invalidate_items((item_id,))
+    if update_data:
+        await changefeed.broker.publish_items("updated", [db_item])
     return db_item
 
 @router.delete("/{item_id}")
 async def delete_item(
     item_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(sharding.get_item_db),
+    current_user: schemas.User = Depends(get_current_active_user)
 ):
-    """Delete an item."""
-    db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if db_item is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item not found"
-        )
-    
-    if db_item.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
-    
-    db.delete(db_item)
-    db.commit()
-    return {"message": "Item deleted successfully"} 
\ No newline at end of file
+    """Delete an item with one ``DELETE ... RETURNING`` statement."""
+    deleted = await db.scalar(
+        delete(models.Item)
+        .where(models.Item.id == item_id, models.Item.owner_id == current_user.id)
+        .returning(models.Item.id)
+    )
+    if deleted is None:
+        raise await _missing_or_forbidden(db, item_id)
+
+    await db.commit()
+    response_cache.invalidate_items((item_id,))
+    await changefeed.broker.publish_deleted(current_user.id, [item_id])
+    return {"message": "Item deleted successfully"}
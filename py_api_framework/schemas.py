@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 # User schemas
 class UserBase(BaseModel):
@@ -23,6 +23,10 @@ class User(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class UserPage(BaseModel):
+    items: List[User]
+    next_cursor: Optional[str] = None
+
 # Item schemas
 class ItemBase(BaseModel):
     title: str
@@ -43,10 +47,60 @@ class Item(ItemBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class ItemPage(BaseModel):
+    items: List[Item]
+    next_cursor: Optional[str] = None
+
+# Item count schemas
+class ItemCount(BaseModel):
+    count: int
+
+class OwnerItemCount(BaseModel):
+    owner_id: int
+    item_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class DailyItemCount(BaseModel):
+    day: date
+    created: int
+
+class ItemStats(BaseModel):
+    total: int
+    owners: List[OwnerItemCount]
+    created_per_day: List[DailyItemCount]
+
+# Bulk item schemas
+class ItemBulkCreate(BaseModel):
+    items: List[ItemCreate]
+
+class ItemBulkUpdateEntry(ItemUpdate):
+    id: int
+
+class ItemBulkUpdate(BaseModel):
+    items: List[ItemBulkUpdateEntry]
+
+class ItemBulkDelete(BaseModel):
+    ids: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[int] = None
+    item: Optional[Item] = None
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+
 # Token schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -0,0 +1,150 @@
+"""
+Full-text search over item titles and descriptions.
+
+The text index is chosen by dialect:
+
+* SQLite: an external-content FTS5 table ``items_fts`` kept in sync with
+  ``items`` by triggers, ranked with ``bm25``.
+* PostgreSQL: a GIN expression index over ``to_tsvector`` of title and
+  description, ranked with ``ts_rank``.
+* Anything else falls back to unranked ``LIKE`` matching.
+
+Every query term is prefix-matched and all terms must match. Results are
+ordered by ``(score, id)`` where lower scores rank higher, which gives a
+stable keyset for cursor pagination.
+"""
+
+import re
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import (
+    DDL,
+    Float,
+    and_,
+    cast,
+    column,
+    event,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    table,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Item
+from .pagination import decode_cursor_payload, encode_cursor_payload
+
+SEARCH_LANGUAGE = "english"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("
+    "title, description, content='items', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN "
+    "INSERT INTO items_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF title, description ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO items_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+)
+
+POSTGRES_VECTOR = (
+    f"to_tsvector('{SEARCH_LANGUAGE}', coalesce(title, '') || ' ' || coalesce(description, ''))"
+)
+
+POSTGRES_DDL = (
+    f"CREATE INDEX IF NOT EXISTS ix_items_search ON items USING GIN ({POSTGRES_VECTOR})",
+)
+
+for statement in SQLITE_DDL:
+    event.listen(Item.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Item.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(
+    Item.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS items_fts").execute_if(dialect="sqlite")
+)
+
+def search_terms(q: str) -> List[str]:
+    """Split a user query into word tokens, discarding query syntax."""
+    return _TOKEN_RE.findall(q)
+
+def _score_subquery(dialect: str, terms: List[str]) -> Any:
+    """Subquery of ``(id, score)`` for items matching every term as a prefix."""
+    if dialect == "sqlite":
+        fts = table("items_fts", column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        return (
+            select(fts.c.rowid.label("id"), func.bm25(literal_column("items_fts")).label("score"))
+            .select_from(fts)
+            .where(literal_column("items_fts").op("MATCH")(match))
+            .subquery()
+        )
+    if dialect == "postgresql":
+        query = func.to_tsquery(SEARCH_LANGUAGE, " & ".join(f"{term}:*" for term in terms))
+        vector = literal_column(POSTGRES_VECTOR)
+        rank = cast(func.ts_rank(vector, query), Float)
+        return (
+            select(Item.id.label("id"), (-rank).label("score"))
+            .where(vector.op("@@")(query))
+            .subquery()
+        )
+    conditions = [
+        or_(Item.title.ilike(f"%{term}%"), Item.description.ilike(f"%{term}%"))
+        for term in terms
+    ]
+    return (
+        select(Item.id.label("id"), literal(0.0).label("score"))
+        .where(and_(*conditions))
+        .subquery()
+    )
+
+async def search_ranked(
+    db: AsyncSession,
+    q: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    owner_id: Optional[int] = None
+) -> List[Tuple[Item, float]]:
+    """Up to ``limit + 1`` ``(item, score)`` rows matching ``q`` after ``cursor``, best first."""
+    terms = search_terms(q)
+    if not terms:
+        return []
+    scores = _score_subquery(db.get_bind().dialect.name, terms)
+    stmt = select(Item, scores.c.score).join(scores, scores.c.id == Item.id)
+    if owner_id is not None:
+        stmt = stmt.where(Item.owner_id == owner_id)
+    after = decode_cursor_payload(cursor)
+    if after is not None:
+        stmt = stmt.where(or_(
+            scores.c.score > after.get("score", 0.0),
+            and_(scores.c.score == after.get("score", 0.0), Item.id > after["id"])
+        ))
+    result = await db.execute(stmt.order_by(scores.c.score, Item.id).limit(max(limit, 0) + 1))
+    return [(item, score) for item, score in result.all()]
+
+def ranked_page(rows: List[Tuple[Item, float]], limit: int) -> Tuple[List[Item], Optional[str]]:
+    """Cut ranked rows to one page and build the cursor for the next one."""
+    next_cursor = None
+    if limit > 0 and len(rows) > limit:
+        rows = rows[:limit]
+        last_item, last_score = rows[-1]
+        next_cursor = encode_cursor_payload({"id": last_item.id, "score": last_score})
+    return [item for item, _ in rows[:max(limit, 0)]], next_cursor
+
+async def search_items(
+    db: AsyncSession,
+    q: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    owner_id: Optional[int] = None
+) -> Tuple[List[Item], Optional[str]]:
+    """Return one ranked page of items matching ``q`` and the next cursor."""
+    return ranked_page(await search_ranked(db, q, limit, cursor, owner_id), limit)
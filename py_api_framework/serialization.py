@@ -0,0 +1,97 @@
+"""
+Fast-path JSON serialization for list responses.
+
+The regular path loads ORM objects, validates each one into a
+``schemas.Item`` via ``from_attributes`` and then runs ``jsonable_encoder``.
+With ``FAST_JSON_RESPONSES`` enabled, list endpoints instead select plain
+column tuples and hand them to a precompiled ``TypeAdapter`` whose
+``dump_json`` writes bytes directly, skipping both validation passes.
+Sparse fieldsets (``fields=``) take the same two paths through the
+per-field-set models in ``fieldsets``.
+"""
+
+from datetime import datetime
+from typing import Any, List, Optional
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+from . import schemas
+from .fieldsets import FieldSet, dump_list, dump_one, dump_page
+from .models import Item
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Columns selected for item list responses, in ``schemas.Item`` field order
+ITEM_COLUMNS = (
+    Item.id,
+    Item.title,
+    Item.description,
+    Item.owner_id,
+    Item.created_at,
+    Item.updated_at,
+)
+
+# Selected with every sparse fieldset: the id for cursors and cache
+# eviction, and with created_at and the version for ETags
+ITEM_VERSION_FIELDS = ("id", "created_at", "version")
+
+class ItemRecord(TypedDict):
+    id: int
+    title: str
+    description: Optional[str]
+    owner_id: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+class ItemPageRecord(TypedDict):
+    items: List[ItemRecord]
+    next_cursor: Optional[str]
+
+item_list_adapter = TypeAdapter(List[ItemRecord])
+item_page_adapter = TypeAdapter(ItemPageRecord)
+
+# Adapters for the regular path, which validates ORM objects via from_attributes
+item_schema_adapter = TypeAdapter(schemas.Item)
+item_schema_list_adapter = TypeAdapter(List[schemas.Item])
+
+def item_records(rows: Any) -> List[dict]:
+    """Convert selected ``ITEM_COLUMNS`` rows into plain dicts."""
+    return [row._asdict() for row in rows]
+
+def dump_item(db_item: Any, fields: Optional[FieldSet] = None) -> bytes:
+    """Serialize one ORM item as ``schemas.Item`` JSON, or only ``fields`` of it."""
+    if fields is not None:
+        return dump_one(schemas.Item, fields, db_item)
+    return item_schema_adapter.dump_json(item_schema_adapter.validate_python(db_item))
+
+def dump_item_list(rows: Any, fast: bool, fields: Optional[FieldSet] = None) -> bytes:
+    """Serialize a list of items from column tuples (fast) or ORM objects."""
+    if fields is not None:
+        return dump_list(schemas.Item, fields, rows, fast)
+    if fast:
+        return item_list_adapter.dump_json(item_records(rows))
+    return item_schema_list_adapter.dump_json(item_schema_list_adapter.validate_python(rows))
+
+def dump_item_page(
+    rows: Any,
+    next_cursor: Optional[str],
+    fast: bool,
+    fields: Optional[FieldSet] = None
+) -> bytes:
+    """Serialize an ``ItemPage`` envelope from column tuples (fast) or ORM objects."""
+    if fields is not None:
+        return dump_page(schemas.Item, fields, rows, next_cursor, fast)
+    if fast:
+        return item_page_adapter.dump_json({"items": item_records(rows), "next_cursor": next_cursor})
+    return schemas.ItemPage(items=rows, next_cursor=next_cursor).model_dump_json().encode()
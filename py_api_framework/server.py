@@ -0,0 +1,166 @@
+"""
+Production server process management.
+
+``run`` serves the app with uvicorn across several worker processes. By
+default uvicorn's own supervisor spawns workers that each import the app.
+With ``preload`` the app is imported once here in the parent, which then
+forks the workers so they share its memory copy-on-write. Either way, dead
+workers are replaced. Workers that reach ``limit_max_requests`` exit after
+draining and are respawned, which contains slow memory growth. Preforked
+workers that keep dying within ``MIN_UPTIME_SECONDS`` of starting are
+respawned after an exponentially growing delay, up to
+``MAX_RESTART_DELAY_SECONDS``, instead of in a tight fork loop.
+"""
+
+import inspect
+import logging
+import os
+import signal
+import time
+from typing import Dict, Optional
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+APP = "py_api_framework.main:app"
+MIN_UPTIME_SECONDS = 5.0
+FIRST_RESTART_DELAY_SECONDS = 0.5
+MAX_RESTART_DELAY_SECONDS = 30.0
+
+logger = logging.getLogger("uvicorn.error")
+
+def build_config(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 1,
+    loop: str = "auto",
+    http: str = "auto",
+    backlog: int = 2048,
+    keep_alive: int = 5,
+    graceful_timeout: Optional[int] = 30,
+    max_requests: Optional[int] = None,
+    max_requests_jitter: int = 0,
+    log_level: str = "info",
+    access_log: bool = True,
+    proxy_headers: bool = True,
+    forwarded_allow_ips: Optional[str] = None,
+) -> uvicorn.Config:
+    """Build the uvicorn configuration for a production server.
+
+    ``forwarded_allow_ips`` lists the proxies whose ``X-Forwarded-For`` sets
+    the client address (uvicorn's default: localhost only).
+    ``max_requests_jitter`` needs uvicorn 0.41+; older releases serve
+    without it and log a warning.
+    """
+    extra = {}
+    if max_requests_jitter:
+        if "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+            extra["limit_max_requests_jitter"] = max_requests_jitter
+        else:
+            logger.warning("--max-requests-jitter needs uvicorn>=0.41; ignoring it")
+    return uvicorn.Config(
+        APP,
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        timeout_keep_alive=keep_alive,
+        timeout_graceful_shutdown=graceful_timeout,
+        limit_max_requests=max_requests,
+        log_level=log_level,
+        access_log=access_log,
+        proxy_headers=proxy_headers,
+        forwarded_allow_ips=forwarded_allow_ips,
+        **extra,
+    )
+
+
+def _after_fork() -> None:
+    """Drop connections inherited from the parent without closing them."""
+    from . import database
+    database.dispose_after_fork()
+
+class PreforkSupervisor:
+    """Forks ``workers`` uvicorn servers sharing one listening socket."""
+
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+        self.crashes = 0
+
+    def _spawn(self, sock: object) -> None:
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, signal.SIG_DFL)
+            code = 0
+            try:
+                _after_fork()
+                uvicorn.Server(self.config).run(sockets=[sock])
+            except BaseException:
+                logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logger.info("Started worker process [%s]", pid)
+
+    def _restart_delay(self, uptime: float) -> float:
+        """Seconds to wait before replacing a worker that ran for ``uptime``."""
+        if uptime >= MIN_UPTIME_SECONDS:
+            self.crashes = 0
+            return 0.0
+        self.crashes += 1
+        return min(FIRST_RESTART_DELAY_SECONDS * 2 ** (self.crashes - 1), MAX_RESTART_DELAY_SECONDS)
+
+    def _terminate(self, signum: int, frame: object) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """Import the app, fork the workers and keep them running until signalled."""
+        self.config.load()
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGINT, self._terminate)
+        signal.signal(signal.SIGTERM, self._terminate)
+        logger.info("Started parent process [%s] with %s preloaded workers", os.getpid(), self.workers)
+        for _ in range(self.workers):
+            self._spawn(sock)
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            uptime = time.monotonic() - started
+            delay = self._restart_delay(uptime)
+            if delay:
+                logger.warning("Worker process [%s] exited after %.1fs, replacing it in %.1fs", pid, uptime, delay)
+                time.sleep(delay)
+            else:
+                logger.info("Worker process [%s] exited, replacing it", pid)
+            if not self.stopping:
+                self._spawn(sock)
+        sock.close()
+        logger.info("Stopping parent process [%s]", os.getpid())
+
+def run(config: uvicorn.Config, preload: bool = False) -> None:
+    """Serve ``config`` with uvicorn, forking preloaded workers if requested."""
+    workers = config.workers or 1
+    if preload:
+        if not hasattr(os, "fork"):
+            raise SystemExit("--preload requires a platform with os.fork")
+        PreforkSupervisor(config, workers).run()
+    elif workers > 1:
+        Multiprocess(config, sockets=[config.bind_socket()]).run()
+    else:
+        uvicorn.Server(config).run()
@@ -0,0 +1,423 @@
+"""
+Horizontal sharding of items by owner.
+
+With ``ITEM_SHARD_URLS`` set, items live on those databases, together with
+their counters and search index. Users and refresh tokens stay on the
+primary (``DATABASE_URL``).
+
+* All of an owner's items live on one shard, chosen by a jump consistent
+  hash of ``owner_id``. Appending a shard to the list moves only about
+  1/N of the owners; removing or reordering shards moves far more.
+* Item ids are reserved on the primary in blocks of ``ITEM_ID_BLOCK_SIZE``
+  (``id_blocks``). They are unique across shards and survive moves.
+* Owner-scoped endpoints get a session on the owner's shard through
+  ``get_item_db``/``get_item_read_db``. Global listings, lookups by id,
+  global search and aggregate counts query every shard concurrently and
+  merge the results. Offset listings fetch ``skip + limit`` rows per shard,
+  so deep pages should use cursors.
+* ``km-pyapi rebalance-shards`` moves owners whose items sit on the wrong
+  shard. Run it after adding shards, or with ``--source`` to shard an
+  existing database. Owners are fenced in batches while they move: a
+  ``shard_moves`` row on the primary makes ``get_item_db`` and
+  ``get_item_read_db`` refuse their writes and owner-scoped reads with 503,
+  so nothing is written to a batch after it was copied and nobody sees a
+  half-moved item list. Global reads may see a moving owner's items twice
+  or not at all until the move finishes.
+
+Without ``ITEM_SHARD_URLS``, the dependencies hand out the usual primary
+and replica sessions and nothing else changes.
+"""
+
+import asyncio
+import heapq
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import Connection, Engine, Select, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from . import counters, search
+from .auth import get_current_active_user
+from .config import settings
+from .database import build_engine, get_db, get_engines, get_read_db
+from .models import IdBlock, Item, ItemCount, ItemDailyCount, ShardMove
+from .pagination import decode_cursor, encode_cursor
+from .schemas import User as UserSchema
+
+T = TypeVar("T")
+
+ITEM_ID_SEQUENCE = "items"
+MOVE_RETRY_AFTER_SECONDS = 5
+SHARDED_TABLES = [Item.__table__, ItemCount.__table__, ItemDailyCount.__table__]
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach) of ``key`` into ``buckets``."""
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+def shard_index(owner_id: int, shard_count: Optional[int] = None) -> int:
+    """Index in ``ITEM_SHARD_URLS`` of the shard holding ``owner_id``'s items."""
+    return jump_hash(owner_id, shard_count or len(settings.ITEM_SHARD_URLS))
+
+def enabled() -> bool:
+    return bool(settings.ITEM_SHARD_URLS)
+
+def sessions_for_owner(owner_id: int) -> async_sessionmaker:
+    return get_engines().shard_sessions[shard_index(owner_id)]
+
+async def _refuse_while_moving(db: AsyncSession, owner_id: int) -> None:
+    if await db.get(ShardMove, owner_id) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Items are being moved to another shard; retry shortly",
+            headers={"Retry-After": str(MOVE_RETRY_AFTER_SECONDS)}
+        )
+
+async def get_item_db(
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+) -> AsyncIterator[AsyncSession]:
+    """Dependency: a session holding the current user's items for writes.
+
+    Refuses with 503 while ``rebalance`` is moving the user's items.
+    """
+    if not enabled():
+        yield db
+        return
+    await _refuse_while_moving(db, current_user.id)
+    async with sessions_for_owner(current_user.id)() as shard_db:
+        yield shard_db
+
+async def get_item_read_db(
+    current_user: UserSchema = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+) -> AsyncIterator[AsyncSession]:
+    """Dependency: a session holding the current user's items for reads.
+
+    Refuses with 503 while ``rebalance`` is moving the user's items, which
+    would otherwise be split between two shards; that includes the
+    ``mine=false`` forms of count and search, which share this dependency.
+    The fence is read through ``db``; a replica lagging by less than the
+    fence wait still sees it before any item moves.
+    """
+    if not enabled():
+        yield db
+        return
+    await _refuse_while_moving(db, current_user.id)
+    async with sessions_for_owner(current_user.id)() as shard_db:
+        yield shard_db
+
+async def scatter(query: Callable[[AsyncSession], Awaitable[T]]) -> List[T]:
+    """Run ``query`` on every shard concurrently, each in its own session."""
+    async def run(factory: async_sessionmaker) -> T:
+        async with factory() as db:
+            return await query(db)
+
+    return list(await asyncio.gather(*(run(factory) for factory in get_engines().shard_sessions)))
+
+class IdAllocator:
+    """Hands out ids from blocks reserved on the primary with one UPDATE each."""
+
+    def __init__(self, sequence: str, block_size: int):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        # Created on first use in each event loop: before Python 3.10 a lock
+        # binds to the loop current at construction, which at import time is
+        # not the one serving requests
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def _reserve(self, count: int) -> None:
+        async with get_engines().AsyncSessionLocal() as db:
+            end = await db.scalar(
+                update(IdBlock)
+                .where(IdBlock.name == self.sequence)
+                .values(next_id=IdBlock.next_id + count)
+                .returning(IdBlock.next_id)
+            )
+            await db.commit()
+        if end is None:
+            raise RuntimeError(f"Id sequence {self.sequence!r} is missing; run `km-pyapi init-db`")
+        self._next, self._end = end - count, end
+
+    async def allocate(self, count: int) -> List[int]:
+        ids: List[int] = []
+        async with self._loop_lock():
+            while len(ids) < count:
+                if self._next >= self._end:
+                    await self._reserve(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+        return ids
+
+    def reset(self) -> None:
+        """Forget the current block (e.g. after switching databases)."""
+        self._next = self._end = 0
+
+item_ids = IdAllocator(ITEM_ID_SEQUENCE, settings.ITEM_ID_BLOCK_SIZE)
+
+async def with_item_ids(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Give new item rows cluster-wide ids when sharded; otherwise leave them to autoincrement."""
+    if enabled():
+        for row, item_id in zip(rows, await item_ids.allocate(len(rows))):
+            row["id"] = item_id
+    return rows
+
+async def owners_by_id(db: AsyncSession, ids: Sequence[int]) -> Dict[int, int]:
+    """Map each existing item id in ``ids`` to its owner.
+
+    ``db`` is asked first; when sharded, ids it does not hold are looked up
+    on every shard, which only happens for items the caller does not own.
+    """
+    if not ids:
+        return {}
+    result = await db.execute(select(Item.id, Item.owner_id).where(Item.id.in_(set(ids))))
+    owners = dict(result.all())
+    missing = set(ids) - set(owners)
+    if enabled() and missing:
+        async def lookup(shard_db: AsyncSession) -> Dict[int, int]:
+            found = await shard_db.execute(select(Item.id, Item.owner_id).where(Item.id.in_(missing)))
+            return dict(found.all())
+
+        for found in await scatter(lookup):
+            owners.update(found)
+    return owners
+
+async def get_item(item_id: int, *options: Any) -> Optional[Item]:
+    """Look an item up by id on every shard, with loader ``options``."""
+    found = await scatter(lambda db: db.get(Item, item_id, options=options))
+    return next((item for item in found if item is not None), None)
+
+async def list_items(
+    stmt: Select,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    scalars: bool
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of ``stmt`` across every shard, merged in id order."""
+    limit = max(limit, 0)
+    if cursor is not None:
+        last_id = decode_cursor(cursor)
+        if last_id is not None:
+            stmt = stmt.where(Item.id > last_id)
+        stmt = stmt.order_by(Item.id).limit(limit + 1)
+    else:
+        stmt = stmt.order_by(Item.id).limit(skip + limit)
+
+    async def fetch(db: AsyncSession) -> List[Any]:
+        result = await db.execute(stmt)
+        return list(result.scalars().all() if scalars else result.all())
+
+    merged = list(heapq.merge(*await scatter(fetch), key=lambda row: row.id))
+    if cursor is None:
+        return merged[skip:skip + limit], None
+    next_cursor = None
+    if limit and len(merged) > limit:
+        merged = merged[:limit]
+        next_cursor = encode_cursor(merged[-1].id)
+    return merged, next_cursor
+
+async def search_items(
+    q: str,
+    limit: int,
+    cursor: Optional[str]
+) -> Tuple[List[Item], Optional[str]]:
+    """Global search across every shard, merged by ``(score, id)``.
+
+    Relevance is scored per shard, so ranking across shards is approximate
+    where the index uses corpus statistics (SQLite ``bm25``).
+    """
+    ranked = await scatter(lambda db: search.search_ranked(db, q, limit, cursor))
+    merged = list(heapq.merge(*ranked, key=lambda row: (row[1], row[0].id)))
+    return search.ranked_page(merged, limit)
+
+async def count_items() -> int:
+    return sum(await scatter(counters.count_items))
+
+async def owner_counts(limit: int) -> List[Tuple[int, int]]:
+    # Each owner lives on one shard, so per-shard top lists merge exactly
+    per_shard = await scatter(lambda db: counters.owner_counts(db, limit))
+    return heapq.nsmallest(limit, (row for rows in per_shard for row in rows),
+                           key=lambda row: (-row[1], row[0]))
+
+async def created_per_day(days: int) -> List[Tuple[Any, int]]:
+    totals: Counter = Counter()
+    for rows in await scatter(lambda db: counters.created_per_day(db, days)):
+        totals.update(dict(rows))
+    return sorted(totals.items())
+
+def ensure_id_block(connection: Any, sequence: str, floor: int) -> None:
+    """Create ``sequence`` on the primary, or raise it above ids already in use."""
+    current = connection.execute(select(IdBlock.next_id).where(IdBlock.name == sequence)).scalar()
+    if current is None:
+        connection.execute(insert(IdBlock).values(name=sequence, next_id=floor + 1))
+    elif current <= floor:
+        connection.execute(update(IdBlock).where(IdBlock.name == sequence).values(next_id=floor + 1))
+
+def _max_item_id(db_engine: Engine) -> int:
+    with db_engine.connect() as connection:
+        return connection.execute(select(func.coalesce(func.max(Item.id), 0))).scalar()
+
+def init_shards(primary: Engine, urls: Sequence[str]) -> None:
+    """Create the item tables, search index and counters on every shard, and migrate them."""
+    from .database import Base
+    from .migrations import upgrade
+    highest = _max_item_id(primary)
+    for url in urls:
+        shard = build_engine(url)
+        try:
+            Base.metadata.create_all(bind=shard, tables=SHARDED_TABLES)
+            with shard.begin() as connection:
+                upgrade(connection)
+            highest = max(highest, _max_item_id(shard))
+        finally:
+            shard.dispose()
+    with primary.begin() as connection:
+        ensure_id_block(connection, ITEM_ID_SEQUENCE, highest)
+
+def _creation_day(created_at: Optional[datetime]) -> date:
+    # The day the counter triggers record for a row: UTC on PostgreSQL
+    if created_at is None:
+        return datetime.now(timezone.utc).date()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+def _add_daily_counts(connection: Connection, owner_id: int, days: Dict[date, int]) -> None:
+    for day, created in days.items():
+        matched = connection.execute(
+            update(ItemDailyCount)
+            .where(ItemDailyCount.owner_id == owner_id, ItemDailyCount.day == day)
+            .values(created=ItemDailyCount.created + created)
+        ).rowcount
+        if not matched:
+            connection.execute(insert(ItemDailyCount).values(owner_id=owner_id, day=day, created=created))
+
+def _move_owner(source: Engine, target: Engine, owner_id: int, batch_size: int) -> int:
+    """Copy ``owner_id``'s items to ``target`` in batches, deleting each batch from ``source``.
+
+    The owner must be fenced (see ``rebalance``), so ``source`` is
+    authoritative: rows already on ``target`` from an interrupted run are
+    overwritten with the source version. Per-day creation counts are moved
+    first; each batch cancels the increments its copies fire on ``target``.
+    Per-owner counts are kept by the triggers on both sides.
+    """
+    items = Item.__table__
+    with source.connect() as connection:
+        days = dict(connection.execute(
+            select(ItemDailyCount.day, ItemDailyCount.created).where(ItemDailyCount.owner_id == owner_id)
+        ).all())
+    if days:
+        with target.begin() as connection:
+            _add_daily_counts(connection, owner_id, days)
+        with source.begin() as connection:
+            connection.execute(delete(ItemDailyCount).where(ItemDailyCount.owner_id == owner_id))
+
+    counted = target.dialect.name in counters.TRIGGER_DIALECTS
+    moved = 0
+    while True:
+        with source.connect() as connection:
+            rows = connection.execute(
+                select(items).where(items.c.owner_id == owner_id).order_by(items.c.id).limit(batch_size)
+            ).mappings().all()
+        if not rows:
+            break
+        ids = [row["id"] for row in rows]
+        with target.begin() as connection:
+            connection.execute(delete(items).where(items.c.id.in_(ids)))
+            connection.execute(insert(items), [dict(row) for row in rows])
+            if counted:
+                copies = Counter(_creation_day(row["created_at"]) for row in rows)
+                _add_daily_counts(connection, owner_id, {day: -n for day, n in copies.items()})
+        with source.begin() as connection:
+            connection.execute(delete(items).where(items.c.id.in_(ids)))
+        moved += len(rows)
+
+    with source.begin() as connection:
+        connection.execute(delete(ItemCount).where(ItemCount.owner_id == owner_id))
+    return moved
+
+def rebalance(
+    shard_urls: Sequence[str],
+    sources: Sequence[str] = (),
+    batch_size: int = 500,
+    dry_run: bool = False,
+    report: Callable[[str], None] = print,
+    fence_seconds: float = 5.0,
+    primary_url: Optional[str] = None,
+    owner_batch_size: int = 100
+) -> Dict[str, int]:
+    """Move every owner whose items are not on their shard under ``shard_urls``.
+
+    ``sources`` are extra databases to drain completely (the primary when
+    sharding an existing deployment, or shards being retired).
+
+    Owners move in batches of ``owner_batch_size``. Each batch is fenced with
+    ``shard_moves`` rows on the primary, which refuse the owners' writes and
+    owner-scoped reads, then ``fence_seconds`` passes once so requests already
+    past the check can finish. The rows are removed once the whole batch has
+    moved. If a run is interrupted, its owners stay fenced until the next run
+    completes.
+    """
+    primary = build_engine(primary_url or settings.DATABASE_URL)
+    shards = [build_engine(url) for url in shard_urls]
+    extra = [build_engine(url) for url in sources]
+    totals = {"owners": 0, "items": 0}
+    try:
+        with primary.connect() as connection:
+            # Fences left by an interrupted run; released once everything moved
+            stale = list(connection.execute(select(ShardMove.owner_id)).scalars())
+        for index, source in enumerate(shards + extra):
+            with source.connect() as connection:
+                owner_ids = connection.execute(
+                    select(Item.owner_id, func.count()).group_by(Item.owner_id)
+                ).all()
+            moves = []
+            for owner_id, count in owner_ids:
+                target = shard_index(owner_id, len(shards))
+                if target == index:
+                    continue
+                report(f"owner {owner_id}: {count} items from {source.url!r} to shard {target}")
+                totals["owners"] += 1
+                totals["items"] += count
+                moves.append((owner_id, target))
+            if dry_run:
+                continue
+            for start in range(0, len(moves), owner_batch_size):
+                batch = moves[start:start + owner_batch_size]
+                fenced = [owner_id for owner_id, _ in batch]
+                with primary.begin() as connection:
+                    already = set(connection.execute(
+                        select(ShardMove.owner_id).where(ShardMove.owner_id.in_(fenced))
+                    ).scalars())
+                    fresh = [{"owner_id": owner_id} for owner_id in fenced if owner_id not in already]
+                    if fresh:
+                        connection.execute(insert(ShardMove), fresh)
+                time.sleep(fence_seconds)
+                for owner_id, target in batch:
+                    _move_owner(source, shards[target], owner_id, batch_size)
+                with primary.begin() as connection:
+                    connection.execute(delete(ShardMove).where(ShardMove.owner_id.in_(fenced)))
+        if stale and not dry_run:
+            with primary.begin() as connection:
+                connection.execute(delete(ShardMove).where(ShardMove.owner_id.in_(stale)))
+    finally:
+        for db_engine in [primary] + shards + extra:
+            db_engine.dispose()
+    return totals
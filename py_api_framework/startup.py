@@ -0,0 +1,120 @@
+"""
+Application startup and shutdown.
+
+Nothing touches the database at import time. ``lifespan`` runs when the
+server starts:
+
+* it creates the schema only if ``AUTO_CREATE_SCHEMA`` is set (otherwise
+  schema creation is an explicit ``km-pyapi init-db`` step);
+* it starts a background task that opens ``DB_WARM_CONNECTIONS`` pooled
+  connections per engine and loads the bcrypt backend on the hash pool, so
+  the first requests do not pay for either;
+* it records a startup report, logged and served at ``/health/startup``;
+* it schedules the periodic purge of expired refresh tokens.
+
+The server accepts requests as soon as the report is recorded, without
+waiting for the warm-up.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
+from . import changefeed, database, refresh_tokens
+from .auth import pwd_context
+from .config import settings
+from .hashing import hash_pool
+
+logger = logging.getLogger("uvicorn.error")
+
+class StartupReport:
+    """Timings of one worker's startup phases, in seconds."""
+
+    def __init__(self, import_seconds: float = 0.0):
+        self.import_seconds = import_seconds
+        self.schema_seconds: Optional[float] = None
+        self.startup_seconds = 0.0
+        self.warmup_seconds: Optional[float] = None
+        self.warm_connections = 0
+        self.warmup_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "import_seconds": round(self.import_seconds, 4),
+            "schema_seconds": None if self.schema_seconds is None else round(self.schema_seconds, 4),
+            "startup_seconds": round(self.startup_seconds, 4),
+            "warmup_seconds": None if self.warmup_seconds is None else round(self.warmup_seconds, 4),
+            "warm_connections": self.warm_connections,
+            "warmup_error": self.warmup_error,
+        }
+
+async def warm_pool(db_engine: AsyncEngine, connections: int) -> int:
+    """Open ``connections`` connections at once and return them to the pool."""
+    if isinstance(db_engine.pool, StaticPool):
+        connections = 1
+    async with AsyncExitStack() as stack:
+        for _ in range(connections):
+            connection = await stack.enter_async_context(db_engine.connect())
+            await connection.exec_driver_sql("SELECT 1")
+    return connections
+
+async def warm_up(report: StartupReport) -> None:
+    """Fill the connection pools and load the bcrypt backend."""
+    start = time.perf_counter()
+    try:
+        engines = database.get_engines()
+        counts = await asyncio.gather(
+            *(warm_pool(db_engine, settings.DB_WARM_CONNECTIONS)
+              for db_engine in engines.named_async_engines().values()),
+            hash_pool.run(pwd_context.dummy_verify),
+        )
+        report.warm_connections = sum(counts[:-1])
+    except Exception as exc:  # warm-up is best effort; requests retry on their own
+        report.warmup_error = repr(exc)
+        logger.warning("Startup warm-up failed: %r", exc)
+    report.warmup_seconds = time.perf_counter() - start
+    logger.info(
+        "Warm-up finished in %.3fs (%s connections)", report.warmup_seconds, report.warm_connections
+    )
+
+def create_lifespan(import_started: float):
+    """Build the app lifespan; ``import_started`` is when the package began importing."""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        report = StartupReport(import_seconds=started - import_started)
+        app.state.startup_report = report
+        if settings.AUTO_CREATE_SCHEMA:
+            await run_in_threadpool(database.init_db)
+            report.schema_seconds = time.perf_counter() - started
+        warmup = asyncio.create_task(warm_up(report)) if settings.STARTUP_WARMUP else None
+        purge = None
+        if settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS > 0:
+            purge = asyncio.create_task(
+                refresh_tokens.purge_periodically(settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS)
+            )
+        report.startup_seconds = time.perf_counter() - started
+        logger.info(
+            "Started in %.3fs (imports %.3fs, startup %.3fs)",
+            report.import_seconds + report.startup_seconds,
+            report.import_seconds,
+            report.startup_seconds,
+        )
+        try:
+            yield
+        finally:
+            for task in (warmup, purge):
+                if task is not None:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+            hash_pool.shutdown()
+            await changefeed.broker.close()
+            await database.dispose_engines()
+
+    return lifespan
@@ -27,11 +27,13 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=[
-        "fastapi>=0.115.0",
+        "fastapi>=0.118.0",
         "uvicorn[standard]>=0.32.0",
         "pydantic[email]>=2.7.0",
         "pydantic-settings>=2.0.0",
-        "sqlalchemy>=2.0.25",
+        "sqlalchemy[asyncio]>=2.0.25",
+        "aiosqlite>=0.19.0",
+        "asyncpg>=0.29.0",
         "alembic>=1.13.1",
         "python-jose[cryptography]>=3.3.0",
         "passlib[bcrypt]>=1.7.4",
@@ -39,11 +41,19 @@ setup(
         "email-validator>=2.1.0",
         "httpx>=0.25.0",
     ],
+    extras_require={
+        "fast": ["orjson>=3.9.0"],
+        "redis": ["redis>=5.0.0"],
+        "compression": ["brotli>=1.1.0", "zstandard>=0.22.0"],
+        "argon2": ["argon2-cffi>=23.1.0"],
+        "mysql": ["aiomysql>=0.2.0"],
+    },
     entry_points={
         'console_scripts': [
             'km-pyapi=py_api_framework.cli:main',
         ],
     },
     include_package_data=True,
+    package_data={"py_api_framework": ["migrations/script.py.mako"]},
     zip_safe=False,
 ) 
\ No newline at end of file
@@ -1,23 +1,32 @@
+import asyncio
 import pytest
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from py_api_framework.database import Base, get_db
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from py_api_framework import refresh_tokens
+from py_api_framework.auth import token_cache, user_cache
+from py_api_framework.database import Base, get_db, get_read_db
 from py_api_framework.main import app
+from py_api_framework.hashing import build_crypt_context, pwd_context
+from py_api_framework.models import RefreshToken, User
+from py_api_framework.ratelimit import store as rate_limit_store
+from py_api_framework.routers.auth import _duplicate_user_detail
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 client = TestClient(app)
 
@@ -27,6 +36,9 @@ def setup_database():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    user_cache.clear()
+    token_cache.clear()
+    rate_limit_store.clear()
 
 def test_register_user():
     """Test user registration."""
@@ -83,6 +95,19 @@ def test_register_duplicate_email():
     assert response.status_code == 400
     assert "Email already registered" in response.json()["detail"]
 
+def test_register_duplicate_skips_password_hash(monkeypatch):
+    """Test that a known duplicate is rejected before any password hashing."""
+    user_data = {"username": "testuser", "email": "test@example.com", "password": "testpassword123"}
+    client.post("/api/v1/auth/register", json=user_data)
+
+    async def no_hashing(password):
+        raise AssertionError("duplicate registration hashed a password")
+
+    monkeypatch.setattr("py_api_framework.auth.get_password_hash_async", no_hashing)
+    for duplicate in ({"email": "other@example.com"}, {"username": "other"}):
+        response = client.post("/api/v1/auth/register", json={**user_data, **duplicate})
+        assert response.status_code == 400
+
 def test_login_success():
     """Test successful login."""
     # Register user first
@@ -143,4 +168,199 @@ def test_get_current_user_invalid_token():
     """Test getting current user with invalid token."""
     headers = {"Authorization": "Bearer invalid_token"}
     response = client.get("/api/v1/auth/me", headers=headers)
-    assert response.status_code == 401 
\ No newline at end of file
+    assert response.status_code == 401 
+
+def test_password_hash_pool_rejects_when_saturated():
+    """Test that the hashing pool returns 503 instead of queueing unboundedly."""
+    import threading
+    from fastapi import HTTPException
+    from py_api_framework.hashing import PasswordHashPool
+
+    pool = PasswordHashPool(workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def run():
+        busy = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc_info:
+            await pool.run(lambda: None)
+        release.set()
+        await busy
+        return exc_info
+
+    exc_info = asyncio.run(run())
+    pool.shutdown()
+    stats = pool.stats()
+    assert exc_info.value.status_code == 503
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 1
+    assert stats["pending"] == 0
+
+def test_current_user_cache_invalidated_on_update():
+    """Test that deactivating a user evicts the cached principal."""
+    user_data = {
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "testpassword123"
+    }
+    client.post("/api/v1/auth/register", json=user_data)
+    login_response = client.post(
+        "/api/v1/auth/token",
+        data={"username": "testuser", "password": "testpassword123"}
+    )
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+    assert user_cache.get("testuser") is not None
+
+    async def deactivate():
+        async with TestingSessionLocal() as db:
+            user = await db.get(User, 1)
+            user.is_active = False
+            await db.commit()
+
+    asyncio.run(deactivate())
+    assert user_cache.get("testuser") is None
+
+    response = client.get("/api/v1/auth/me", headers=headers)
+    assert response.status_code == 400
+    assert "Inactive user" in response.json()["detail"]
+
+def test_failed_login_lockout(monkeypatch):
+    """Test that repeated failures lock the account out before authentication runs."""
+    from py_api_framework import auth
+
+    client.post("/api/v1/auth/register", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "testpassword123"
+    })
+    for _ in range(5):
+        response = client.post(
+            "/api/v1/auth/token", data={"username": "testuser", "password": "wrong"}
+        )
+        assert response.status_code == 401
+
+    async def fail_if_called(*args):
+        raise AssertionError("authenticate_user ran for a locked-out client")
+
+    monkeypatch.setattr(auth, "authenticate_user", fail_if_called)
+    response = client.post(
+        "/api/v1/auth/token", data={"username": "testuser", "password": "testpassword123"}
+    )
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "900"
+
+def test_register_route_limit(monkeypatch):
+    """Test the per-client limit on registration."""
+    from py_api_framework import ratelimit
+
+    monkeypatch.setitem(ratelimit.ROUTE_LIMITS, "register", (2, 3600))
+    statuses = [
+        client.post("/api/v1/auth/register", json={
+            "username": f"user{i}", "email": f"user{i}@example.com", "password": "testpassword123"
+        }).status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+def test_duplicate_user_detail_postgres_message():
+    """Test that PostgreSQL index names map to the same 400 messages."""
+    def error(message):
+        return IntegrityError("INSERT", {}, Exception(message))
+
+    email = 'duplicate key value violates unique constraint "ix_users_email"\nDETAIL: Key (email)=(a@b.c)'
+    assert _duplicate_user_detail(error(email)) == "Email already registered"
+    # A username that merely contains "email" is still a username clash
+    username = 'duplicate key value violates unique constraint "ix_users_username"\nDETAIL: Key (username)=(users_email)'
+    assert _duplicate_user_detail(error(username)) == "Username already registered"
+
+def _login_pair():
+    client.post("/api/v1/auth/register", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "testpassword123"
+    })
+    response = client.post(
+        "/api/v1/auth/token", data={"username": "testuser", "password": "testpassword123"}
+    )
+    return response.json()
+
+def test_refresh_token_rotation():
+    """Test that a refresh token buys a new working pair exactly once."""
+    tokens = _login_pair()
+    assert tokens["refresh_token"]
+
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert client.get("/api/v1/auth/me", headers=headers).json()["username"] == "testuser"
+
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": "not-a-token"})
+    assert response.status_code == 401
+
+def test_refresh_token_reuse_revokes_family():
+    """Test that replaying a spent refresh token revokes its successors."""
+    tokens = _login_pair()
+    rotated = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    replay = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert replay.status_code == 401
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+
+def test_logout_revokes_refresh_token():
+    """Test that logging out invalidates the refresh token."""
+    tokens = _login_pair()
+    assert client.post("/api/v1/auth/logout", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+def test_purge_expired_refresh_tokens():
+    """Test batched deletion of expired refresh tokens only."""
+    _login_pair()
+    with engine.begin() as connection:
+        for i in range(5):
+            connection.execute(insert(RefreshToken).values(
+                token_hash=f"{i:064d}", family_id="expired", user_id=1,
+                expires_at=datetime.now(timezone.utc) - timedelta(days=1),
+            ))
+
+    async def purge():
+        async with TestingSessionLocal() as db:
+            return await refresh_tokens.purge_expired(db, batch_size=2)
+
+    assert asyncio.run(purge()) == 5
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(RefreshToken)).scalar() == 1
+
+def test_login_rehashes_outdated_password_hash():
+    """Test that a hash below the configured cost is upgraded on login."""
+    with engine.begin() as connection:
+        connection.execute(insert(User).values(
+            username="legacy", email="legacy@example.com", is_active=True,
+            hashed_password=build_crypt_context("bcrypt", bcrypt_rounds=4).hash("legacypassword"),
+        ))
+    response = client.post("/api/v1/auth/token", data={"username": "legacy", "password": "legacypassword"})
+    assert response.status_code == 200
+    with engine.connect() as connection:
+        stored = connection.execute(select(User.hashed_password)).scalar_one()
+    assert not pwd_context.needs_update(stored)
+    assert pwd_context.verify("legacypassword", stored)
+
+def test_read_users_sparse_fieldset():
+    """Test that ``fields`` narrows the user list and its pages."""
+    tokens = _login_pair()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.get("/api/v1/auth/users?fields=username,id", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{"username": "testuser", "id": 1}]
+    page = client.get("/api/v1/auth/users?cursor=&fields=email", headers=headers).json()
+    assert page == {"items": [{"email": "test@example.com"}], "next_cursor": None}
+
+    response = client.get("/api/v1/auth/users?fields=hashed_password", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: hashed_password"
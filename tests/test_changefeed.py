@@ -0,0 +1,137 @@
+import asyncio
+import json
+from py_api_framework import changefeed
+from py_api_framework.changefeed import (
+    ChangeBroker,
+    LocalChangeBackend,
+    RedisChangeBackend,
+    format_sse,
+    sse_events,
+)
+
+class FakePubSub:
+    """Minimal stand-in for a redis.asyncio pub/sub connection."""
+
+    def __init__(self):
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.channel = channel
+
+    async def unsubscribe(self, channel):
+        pass
+
+    async def listen(self):
+        while True:
+            yield await self.messages.get()
+
+class FakeRedis:
+    """Evaluates the publish script's INCR + PUBLISH in memory."""
+
+    def __init__(self):
+        self.seq = 0
+        self.pubsubs = []
+
+    def pubsub(self):
+        pubsub = FakePubSub()
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.scripts = []
+
+    def eval(self, script, numkeys, seq_key, channel, payload):
+        self.scripts.append(payload)
+
+    async def execute(self):
+        for payload in self.scripts:
+            self.redis.seq += 1
+            for pubsub in self.redis.pubsubs:
+                pubsub.messages.put_nowait({"type": "message", "data": f"{self.redis.seq} {payload}".encode()})
+        return list(range(len(self.scripts)))
+
+def test_subscribers_receive_only_their_owner_events():
+    """Test per-owner fan-out."""
+    async def scenario():
+        broker = ChangeBroker(LocalChangeBackend())
+        mine = await broker.subscribe(1)
+        await broker.publish(2, "created", [{"id": 10}])
+        await broker.publish(1, "created", [{"id": 11}])
+        event = await mine.get()
+        assert (event["seq"], event["type"], event["item"]) == (2, "created", {"id": 11})
+        broker.unsubscribe(mine)
+        assert broker.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+def test_resume_replays_missed_events():
+    """Test resuming from a sequence number inside the retained history."""
+    async def scenario():
+        broker = ChangeBroker(LocalChangeBackend(), history=10)
+        await broker.publish(1, "created", [{"id": 1}, {"id": 2}, {"id": 3}])
+        subscription = await broker.subscribe(1, since=1)
+        assert [(await subscription.get())["seq"] for _ in range(2)] == [2, 3]
+
+    asyncio.run(scenario())
+
+def test_resume_beyond_history_resets():
+    """Test that a gap in the retained history is reported as a reset."""
+    async def scenario():
+        broker = ChangeBroker(LocalChangeBackend(), history=2)
+        await broker.publish(1, "created", [{"id": i} for i in range(5)])
+        assert await (await broker.subscribe(1, since=1)).get() == {"seq": 5, "type": "reset"}
+        # A sequence number from before a restart is also unknown
+        assert (await (await broker.subscribe(1, since=99)).get())["type"] == "reset"
+
+    asyncio.run(scenario())
+
+def test_slow_consumer_gets_reset_instead_of_blocking():
+    """Test that a full buffer collapses into one reset at the latest sequence number."""
+    async def scenario():
+        broker = ChangeBroker(LocalChangeBackend(), buffer=3)
+        subscription = await broker.subscribe(1)
+        await broker.publish(1, "updated", [{"id": i} for i in range(10)])
+        assert await subscription.get() == {"seq": 10, "type": "reset"}
+        await broker.publish(1, "deleted", [{"id": 1}])
+        assert (await subscription.get())["seq"] == 11
+
+    asyncio.run(scenario())
+
+def test_redis_backend_fans_out_in_sequence():
+    """Test numbering and delivery through the Redis backend."""
+    async def scenario():
+        backend = RedisChangeBackend(FakeRedis())
+        broker = ChangeBroker(backend)
+        subscription = await broker.subscribe(7)
+        await broker.publish(7, "created", [{"id": 1}, {"id": 2}])
+        events = [await asyncio.wait_for(subscription.get(), 1) for _ in range(2)]
+        assert [(event["seq"], event["item"]["id"]) for event in events] == [(1, 1), (2, 2)]
+        await broker.close()
+
+    asyncio.run(scenario())
+
+def test_format_sse():
+    """Test the Server-Sent Events framing."""
+    frame = format_sse({"seq": 4, "type": "deleted", "owner_id": 1, "item": {"id": 9}}).decode()
+    lines = frame.splitlines()
+    assert lines[:2] == ["id: 4", "event: deleted"]
+    assert json.loads(lines[2][len("data: "):])["item"] == {"id": 9}
+    assert frame.endswith("\n\n")
+
+def test_sse_events_stream_heartbeats_and_changes():
+    """Test the SSE stream: retry hint, keep-alive comments, then events."""
+    async def scenario():
+        stream = sse_events(owner_id=42, since=None, heartbeat=0.01)
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert await stream.__anext__() == b": keep-alive\n\n"
+        await changefeed.broker.publish(42, "created", [{"id": 1}])
+        assert b"event: created" in await stream.__anext__()
+        await stream.aclose()
+        assert changefeed.broker.subscriber_count() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+import subprocess
+import sys
+from py_api_framework import cli, server
+from py_api_framework.cli import build_parser, main
+
+def test_serve_arguments_build_uvicorn_config():
+    """Test that serve options map onto the uvicorn configuration."""
+    args = build_parser().parse_args([
+        "serve", "--workers", "3", "--loop", "asyncio", "--http", "h11",
+        "--backlog", "512", "--keep-alive", "15", "--graceful-timeout", "20",
+        "--max-requests", "1000", "--max-requests-jitter", "50", "--preload",
+    ])
+    assert args.preload
+    config = server.build_config(
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        keep_alive=args.keep_alive,
+        graceful_timeout=args.graceful_timeout,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+    )
+    assert config.workers == 3
+    assert (config.loop, config.http) == ("asyncio", "h11")
+    assert config.backlog == 512
+    assert config.timeout_keep_alive == 15
+    assert config.timeout_graceful_shutdown == 20
+    assert config.limit_max_requests == 1000
+    assert config.limit_max_requests_jitter == 50
+
+def test_max_requests_jitter_skipped_on_older_uvicorn(monkeypatch):
+    """Test that a uvicorn without jitter support still gets a valid config."""
+    received = {}
+
+    def old_config(app, host, port, **kwargs):
+        received.update(kwargs)
+
+    monkeypatch.setattr(server.uvicorn, "Config", old_config)
+    server.build_config(max_requests=1000, max_requests_jitter=50)
+    assert received["limit_max_requests"] == 1000
+    assert "limit_max_requests_jitter" not in received
+
+def test_workers_default_to_web_concurrency(monkeypatch):
+    """Test that WEB_CONCURRENCY sets the default worker count."""
+    monkeypatch.setenv("WEB_CONCURRENCY", "5")
+    assert build_parser().parse_args(["serve"]).workers == 5
+
+def test_workers_default_respects_cpu_quota(tmp_path, monkeypatch):
+    """Test that the default worker count follows affinity and the cgroup CPU quota."""
+    monkeypatch.setattr(cli.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    assert cli.available_cpus(str(tmp_path)) == 8
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cli.available_cpus(str(tmp_path)) == 8
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert cli.available_cpus(str(tmp_path)) == 2
+
+def test_prefork_restart_backs_off_on_startup_crashes():
+    """Test that workers dying right after start are replaced with growing delays."""
+    supervisor = server.PreforkSupervisor(server.build_config(), workers=1)
+    delays = [supervisor._restart_delay(0.1) for _ in range(8)]
+    assert delays[:3] == [0.5, 1.0, 2.0]
+    assert delays[-1] == server.MAX_RESTART_DELAY_SECONDS
+    assert supervisor._restart_delay(server.MIN_UPTIME_SECONDS) == 0
+    assert supervisor._restart_delay(0.1) == 0.5
+
+def test_cli_import_does_not_import_app():
+    """Test that importing the CLI leaves the application unimported."""
+    code = "import sys, py_api_framework.cli; print('py_api_framework.main' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+def test_calibrate_hash_writes_policy(tmp_path, capsys):
+    """Test that calibration picks bcrypt rounds within budget and updates an env file."""
+    env_file = tmp_path / ".env"
+    env_file.write_text("DEBUG=false\nBCRYPT_ROUNDS=14\n")
+    main(["calibrate-hash", "--scheme", "bcrypt", "--target-ms", "1", "--samples", "1",
+          "--env-file", str(env_file)])
+    assert "BCRYPT_ROUNDS=4" in capsys.readouterr().out
+    assert env_file.read_text() == "DEBUG=false\nBCRYPT_ROUNDS=4\nPASSWORD_HASH_SCHEME=bcrypt\n"
@@ -0,0 +1,107 @@
+import zlib
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from py_api_framework.compression import COMPRESSION_BYTES_IN, CompressionMiddleware, negotiate
+from py_api_framework.config import settings
+
+app = FastAPI()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=500,
+    encodings=["zstd", "br", "gzip"],
+    content_types=["application/json", "application/x-ndjson"],
+)
+PAYLOAD = [{"id": i, "title": f"Item {i}", "description": "compressible " * 5} for i in range(100)]
+
+@app.get("/large")
+async def large():
+    return PAYLOAD
+
+@app.get("/small")
+async def small():
+    return {"ok": True}
+
+@app.get("/tagged")
+async def tagged():
+    return Response(b'{"data": "' + b"x" * 2000 + b'"}', media_type="application/json",
+                    headers={"ETag": '"abc"'})
+
+@app.get("/revalidated")
+async def revalidated():
+    return Response(status_code=304, headers={"ETag": '"abc"'})
+
+@app.get("/events")
+async def events():
+    async def stream():
+        for i in range(50):
+            yield f"id: {i}\ndata: {'x' * 100}\n\n".encode()
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/binary")
+async def binary():
+    return Response(b"\x00" * 5000, media_type="image/png")
+
+@app.get("/stream")
+async def stream():
+    async def lines():
+        for i in range(50):
+            yield f'{{"line": {i}}}\n'.encode()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+client = TestClient(app)
+
+default_app = FastAPI()
+default_app.add_middleware(CompressionMiddleware, minimum_size=0,
+                           content_types=settings.COMPRESSION_CONTENT_TYPES)
+default_app.get("/events")(events)
+
+def test_negotiate():
+    """Test Accept-Encoding negotiation with q-values and server preference."""
+    assert negotiate("gzip, br", ["br", "gzip"]) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate("*", ["gzip"]) == "gzip"
+    assert negotiate("gzip;q=0, identity", ["gzip"]) is None
+    assert negotiate("", ["gzip"]) is None
+
+def test_large_json_is_gzipped():
+    """Test that large JSON responses are compressed and counted."""
+    before = COMPRESSION_BYTES_IN.value("gzip")
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == PAYLOAD
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert COMPRESSION_BYTES_IN.value("gzip") - before == len(response.content)
+
+def test_small_binary_and_identity_are_not_compressed():
+    """Test the size threshold, content-type allowlist and identity requests."""
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/binary", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+
+def test_compressed_etag_is_weak():
+    """Test that the compressed representation gets a weak validator."""
+    response = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["etag"] == 'W/"abc"'
+    revalidated = client.get("/revalidated", headers={"Accept-Encoding": "gzip"})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == 'W/"abc"'
+    identity = client.get("/revalidated", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["etag"] == '"abc"'
+
+def test_event_stream_is_not_compressed():
+    """Test that Server-Sent Events are sent uncompressed under the default allowlist."""
+    for app_client in (client, TestClient(default_app)):
+        with app_client.stream("GET", "/events", headers={"Accept-Encoding": "gzip"}) as response:
+            assert "content-encoding" not in response.headers
+            assert b"".join(response.iter_raw()).startswith(b"id: 0\n")
+
+def test_streaming_response_is_compressed_incrementally():
+    """Test that streamed bodies are compressed without buffering."""
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    lines = zlib.decompress(raw, 31).decode().splitlines()
+    assert lines[0] == '{"line": 0}' and len(lines) == 50
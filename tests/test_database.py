@@ -0,0 +1,117 @@
+import asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect, text
+from py_api_framework import database
+from py_api_framework.config import settings
+from py_api_framework.database import (
+    TimedAsyncAdaptedQueuePool,
+    build_async_engine,
+    build_engine,
+    get_async_url,
+    get_sync_url,
+    pool_stats,
+)
+from py_api_framework.main import app
+
+client = TestClient(app)
+
+def test_driver_urls():
+    """Test that async and sync driver URLs are derived from DATABASE_URL."""
+    assert get_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert get_async_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert get_sync_url("postgresql+asyncpg://u:p@db/app") == "postgresql://u:p@db/app"
+
+def test_file_sqlite_uses_queue_pool_with_wal(tmp_path):
+    """Test that file-backed SQLite gets a real pool and WAL pragmas."""
+    db_engine = build_async_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+
+    async def pragmas():
+        async with db_engine.connect() as conn:
+            journal_mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+            synchronous = (await conn.execute(text("PRAGMA synchronous"))).scalar()
+            busy_timeout = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+            stats = pool_stats(db_engine)
+        await db_engine.dispose()
+        return journal_mode, synchronous, busy_timeout, stats
+
+    journal_mode, synchronous, busy_timeout, stats = asyncio.run(pragmas())
+    assert isinstance(db_engine.pool, TimedAsyncAdaptedQueuePool)
+    assert journal_mode == "wal"
+    assert synchronous == 1  # NORMAL
+    assert busy_timeout == 5000
+    assert stats["checked_out"] == 1
+    assert stats["checkouts"] == 1
+
+def test_pool_health_endpoint():
+    """Test the pool statistics endpoint."""
+    response = client.get("/health/pool")
+    assert response.status_code == 200
+    data = response.json()["primary"]
+    assert {"pool", "checked_out", "overflow", "wait_avg_ms"} <= set(data)
+
+def test_replica_router_round_robin_and_read_your_writes(tmp_path):
+    """Test replica routing with SQLite files standing in for the cluster."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from py_api_framework.database import ReplicaRouter
+
+    engines = {
+        name: build_async_engine(f"sqlite:///{tmp_path / name}.db")
+        for name in ("primary", "r1", "r2")
+    }
+    factories = {name: async_sessionmaker(bind=db_engine) for name, db_engine in engines.items()}
+
+    async def label(factory):
+        async with factory() as db:
+            return (await db.execute(text("SELECT name FROM node"))).scalar()
+
+    async def run():
+        for name, factory in factories.items():
+            async with factory() as db:
+                await db.execute(text("CREATE TABLE node (name TEXT)"))
+                await db.execute(text("INSERT INTO node VALUES (:name)"), {"name": name})
+                await db.commit()
+
+        router = ReplicaRouter(factories["primary"], [factories["r1"], factories["r2"]], sticky_seconds=60)
+        reads = [await label(router.for_read("user:alice")) for _ in range(4)]
+        router.mark_write("user:alice")
+        sticky = await label(router.for_read("user:alice"))
+        other = await label(router.for_read("user:bob"))
+        for db_engine in engines.values():
+            await db_engine.dispose()
+        return reads, sticky, other
+
+    reads, sticky, other = asyncio.run(run())
+    assert reads == ["r1", "r2", "r1", "r2"]
+    assert sticky == "primary"
+    assert other in ("r1", "r2")
+
+def test_init_db_migrates_items_table_from_an_earlier_release(tmp_path, monkeypatch):
+    """Test that init_db adds the version column, search index and counters by migration."""
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    db_engine = build_engine(url)
+    with db_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, "
+            "description VARCHAR, owner_id INTEGER NOT NULL, created_at DATETIME, updated_at DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO items (title, owner_id, created_at) "
+            "VALUES ('Red bicycle', 1, '2026-01-01 10:00:00'), ('Blue kettle', 1, '2026-01-02 10:00:00')"
+        ))
+    asyncio.run(database.dispose_engines())
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    try:
+        database.init_db()
+        database.init_db()
+    finally:
+        asyncio.run(database.dispose_engines())
+
+    with db_engine.connect() as connection:
+        assert "version" in {column["name"] for column in inspect(connection).get_columns("items")}
+        assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar() == "0003"
+        matches = connection.execute(text("SELECT rowid FROM items_fts WHERE items_fts MATCH 'bicycle'")).all()
+        assert len(matches) == 1
+        assert connection.execute(text("SELECT item_count FROM item_counts WHERE owner_id = 1")).scalar() == 2
+        created = connection.execute(text("SELECT sum(created) FROM item_daily_counts")).scalar()
+        assert created == 2
+    db_engine.dispose()
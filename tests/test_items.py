@@ -1,23 +1,28 @@
 import pytest
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from py_api_framework.database import Base, get_db
+from starlette.websockets import WebSocketDisconnect
+from sqlalchemy import Engine, create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from py_api_framework.auth import token_cache, user_cache
+from py_api_framework.database import Base, get_db, get_read_db
+from py_api_framework.http_cache import item_etag
 from py_api_framework.main import app
+from py_api_framework.ratelimit import store as rate_limit_store
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 client = TestClient(app)
 
@@ -27,6 +32,9 @@ def setup_database():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    user_cache.clear()
+    token_cache.clear()
+    rate_limit_store.clear()
 
 @pytest.fixture
 def auth_headers():
@@ -205,4 +213,429 @@ def test_root_endpoint():
     data = response.json()
     assert "message" in data
     assert "version" in data
-    assert "docs" in data 
\ No newline at end of file
+    assert "docs" in data
+
+
+def test_get_my_items_cursor_pagination(auth_headers):
+    """Test keyset pagination with opaque cursors."""
+    for i in range(5):
+        client.post("/api/v1/items/", json={"title": f"Item {i}"}, headers=auth_headers)
+
+    titles = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(
+            "/api/v1/items/my-items",
+            params={"cursor": cursor, "limit": 2},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        titles.extend(item["title"] for item in page["items"])
+        cursor = page["next_cursor"]
+
+    assert titles == [f"Item {i}" for i in range(5)]
+
+def test_get_items_invalid_cursor(auth_headers):
+    """Test that a malformed cursor is rejected."""
+    response = client.get("/api/v1/items/", params={"cursor": "not-a-cursor"}, headers=auth_headers)
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
+
+def test_bulk_create_update_delete(auth_headers):
+    """Test the bulk item endpoints with per-record results."""
+    payload = {"items": [{"title": f"Bulk {i}", "description": "imported"} for i in range(3)]}
+    response = client.post("/api/v1/items/bulk", json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [201, 201, 201]
+    assert [r["item"]["title"] for r in results] == ["Bulk 0", "Bulk 1", "Bulk 2"]
+    ids = [r["id"] for r in results]
+
+    update_payload = {"items": [
+        {"id": ids[0], "title": "Renamed"},
+        {"id": 999, "title": "Missing"},
+    ]}
+    response = client.patch("/api/v1/items/bulk", json=update_payload, headers=auth_headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == 200
+    assert results[0]["item"]["title"] == "Renamed"
+    assert results[0]["item"]["description"] == "imported"
+    assert results[1]["status"] == 404
+
+    response = client.request(
+        "DELETE", "/api/v1/items/bulk", json={"ids": [ids[1], ids[2], 999]}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == [200, 200, 404]
+
+    response = client.get("/api/v1/items/my-items", headers=auth_headers)
+    assert [item["title"] for item in response.json()] == ["Renamed"]
+
+def test_bulk_update_forbidden_for_other_owner(auth_headers):
+    """Test that bulk updates report 403 for items owned by someone else."""
+    response = client.post("/api/v1/items/bulk", json={"items": [{"title": "Mine"}]}, headers=auth_headers)
+    item_id = response.json()["results"][0]["id"]
+
+    client.post("/api/v1/auth/register", json={
+        "username": "otheruser",
+        "email": "other@example.com",
+        "password": "otherpassword123"
+    })
+    login_response = client.post(
+        "/api/v1/auth/token", data={"username": "otheruser", "password": "otherpassword123"}
+    )
+    other_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    response = client.patch(
+        "/api/v1/items/bulk", json={"items": [{"id": item_id, "title": "Stolen"}]}, headers=other_headers
+    )
+    assert response.json()["results"][0]["status"] == 403
+
+def test_export_my_items(auth_headers):
+    """Test streaming export in NDJSON, CSV and gzip-compressed form."""
+    import csv
+    import io
+    import json
+
+    client.post("/api/v1/items/bulk", json={"items": [
+        {"title": "First", "description": "a"},
+        {"title": "Second, with comma"},
+    ]}, headers=auth_headers)
+
+    response = client.get("/api/v1/items/export", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["title"] for row in rows] == ["First", "Second, with comma"]
+    assert rows[1]["description"] is None
+
+    response = client.get("/api/v1/items/export", params={"format": "csv"}, headers=auth_headers)
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["title"] for row in rows] == ["First", "Second, with comma"]
+
+    response = client.get("/api/v1/items/export", params={"gzip": "true"}, headers=auth_headers)
+    assert response.headers["content-encoding"] == "gzip"
+    # httpx transparently decodes the gzip body
+    assert len(response.text.splitlines()) == 2
+
+def test_fast_json_list_matches_default(auth_headers, monkeypatch):
+    """Test that the column-tuple fast path serializes like the ORM path."""
+    from py_api_framework.config import settings
+
+    client.post("/api/v1/items/bulk", json={"items": [
+        {"title": "One", "description": "first"},
+        {"title": "Two"},
+    ]}, headers=auth_headers)
+    client.put("/api/v1/items/1", json={"title": "One updated"}, headers=auth_headers)
+
+    for params in ({}, {"cursor": "", "limit": 1}):
+        for path in ("/api/v1/items/", "/api/v1/items/my-items"):
+            expected = client.get(path, params=params, headers=auth_headers).json()
+            monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", True)
+            response = client.get(path, params=params, headers=auth_headers)
+            monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", False)
+            assert response.status_code == 200
+            assert response.json() == expected
+
+def test_sparse_fieldsets(auth_headers, monkeypatch):
+    """Test that ``fields`` narrows both the SELECT and the body on either path."""
+    from py_api_framework.config import settings
+
+    client.post("/api/v1/items/bulk", json={"items": [
+        {"title": "One", "description": "first"},
+        {"title": "Two", "description": "second"},
+    ]}, headers=auth_headers)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        for fast in (False, True):
+            monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", fast)
+            statements.clear()
+            response = client.get("/api/v1/items/?fields=title,id", headers=auth_headers)
+            assert response.json() == [{"title": "One", "id": 1}, {"title": "Two", "id": 2}]
+            selects = [sql for sql in statements if "FROM items" in sql]
+            assert selects and all("description" not in sql for sql in selects)
+
+            page = client.get(
+                "/api/v1/items/my-items?cursor=&limit=1&fields=description", headers=auth_headers
+            ).json()
+            assert page["items"] == [{"description": "first"}]
+            assert page["next_cursor"]
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    response = client.get("/api/v1/items/2?fields=owner_id", headers=auth_headers)
+    assert response.json() == {"owner_id": 1}
+    assert client.get(
+        "/api/v1/items/2?fields=owner_id",
+        headers={**auth_headers, "If-None-Match": response.headers["etag"]}
+    ).status_code == 304
+
+    response = client.get("/api/v1/items/?fields=title,secret", headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: secret"
+
+def test_sparse_fieldset_cursor_pages_keep_cursor_and_etag(auth_headers, monkeypatch):
+    """Test that ``fields=title`` pages still get id cursors and version-based ETags."""
+    from py_api_framework.config import settings
+    from py_api_framework.pagination import decode_cursor
+
+    ids = [result["id"] for result in client.post("/api/v1/items/bulk", json={"items": [
+        {"title": f"Item {i}"} for i in range(3)
+    ]}, headers=auth_headers).json()["results"]]
+    for fast in (False, True):
+        monkeypatch.setattr(settings, "FAST_JSON_RESPONSES", fast)
+        url = "/api/v1/items/my-items?fields=title&limit=2&cursor="
+        first = client.get(url, headers=auth_headers)
+        body = first.json()
+        assert body["items"] == [{"title": "Item 0"}, {"title": "Item 1"}]
+        assert decode_cursor(body["next_cursor"]) == ids[1]
+        second = client.get(url + body["next_cursor"], headers=auth_headers).json()
+        assert second == {"items": [{"title": "Item 2"}], "next_cursor": None}
+
+        etag = first.headers["etag"]
+        assert client.get(url, headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+        # A description change bumps the version, which the ETag covers
+        client.put(f"/api/v1/items/{ids[0]}", json={"title": "Item 0", "description": f"{fast}"},
+                   headers=auth_headers)
+        assert client.get(url, headers={**auth_headers, "If-None-Match": etag}).status_code == 200
+
+def test_item_etag_conditional_get(auth_headers):
+    """Test ETag validation and 304 responses for item reads."""
+    create_response = client.post("/api/v1/items/", json={"title": "Cached"}, headers=auth_headers)
+    item_id = create_response.json()["id"]
+
+    response = client.get(f"/api/v1/items/{item_id}", headers=auth_headers)
+    etag = response.headers["etag"]
+    assert "must-revalidate" in response.headers["cache-control"]
+
+    response = client.get(f"/api/v1/items/{item_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    list_response = client.get("/api/v1/items/my-items", headers=auth_headers)
+    list_etag = list_response.headers["etag"]
+    response = client.get(
+        "/api/v1/items/my-items", headers={**auth_headers, "If-None-Match": list_etag}
+    )
+    assert response.status_code == 304
+
+    client.post("/api/v1/items/", json={"title": "Another"}, headers=auth_headers)
+    response = client.get(
+        "/api/v1/items/my-items", headers={**auth_headers, "If-None-Match": list_etag}
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+def test_item_etag_not_reused_after_delete(auth_headers):
+    """Test that deleting the newest item and creating another yields a new ETag."""
+    item_id = client.post("/api/v1/items/", json={"title": "Old"}, headers=auth_headers).json()["id"]
+    etag = client.get(f"/api/v1/items/{item_id}", headers=auth_headers).headers["etag"]
+    client.delete(f"/api/v1/items/{item_id}", headers=auth_headers)
+    new_id = client.post("/api/v1/items/", json={"title": "New"}, headers=auth_headers).json()["id"]
+    assert new_id != item_id
+    response = client.get(f"/api/v1/items/{new_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    # Tables created before AUTOINCREMENT may reuse the id; created_at still differs
+    old = SimpleNamespace(id=1, version=1, created_at="2026-01-01 10:00:00")
+    assert item_etag(old) != item_etag(SimpleNamespace(id=1, version=1, created_at="2026-01-01 10:00:05"))
+
+def test_item_etag_changes_on_updates_within_one_second(auth_headers):
+    """Test that an update in the same second as the previous one changes the ETag."""
+    item_id = client.post("/api/v1/items/", json={"title": "v0"}, headers=auth_headers).json()["id"]
+
+    def pin_updated_at():
+        # Same timestamp after every write, as two writes in one second get on SQLite
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE items SET updated_at = '2026-01-01 00:00:00'"))
+
+    client.put(f"/api/v1/items/{item_id}", json={"title": "v1"}, headers=auth_headers)
+    pin_updated_at()
+    etag = client.get(f"/api/v1/items/{item_id}", headers=auth_headers).headers["etag"]
+    list_etag = client.get("/api/v1/items/my-items", headers=auth_headers).headers["etag"]
+
+    client.patch("/api/v1/items/bulk", json={"items": [{"id": item_id, "title": "v2"}]}, headers=auth_headers)
+    pin_updated_at()
+    response = client.get(f"/api/v1/items/{item_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "v2"
+    etag = response.headers["etag"]
+    response = client.get("/api/v1/items/my-items", headers={**auth_headers, "If-None-Match": list_etag})
+    assert response.status_code == 200
+
+    client.put(f"/api/v1/items/{item_id}", json={"title": "v3"}, headers=auth_headers)
+    pin_updated_at()
+    response = client.get(f"/api/v1/items/{item_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "v3"
+
+def test_server_side_response_cache_invalidated_on_update(auth_headers, monkeypatch):
+    """Test that cached item bodies are evicted when the item changes."""
+    from py_api_framework.http_cache import response_cache
+
+    monkeypatch.setattr(response_cache, "enabled", True)
+    item_id = client.post("/api/v1/items/", json={"title": "Before"}, headers=auth_headers).json()["id"]
+
+    # Uncompressed, so the header carries the strong ETag the cache is keyed by
+    first = client.get(f"/api/v1/items/{item_id}", headers={**auth_headers, "Accept-Encoding": "identity"})
+    assert response_cache.get(str(first.url), first.headers["etag"]) == first.content
+
+    client.put(f"/api/v1/items/{item_id}", json={"title": "After"}, headers=auth_headers)
+    assert response_cache.get(str(first.url), first.headers["etag"]) is None
+    response = client.get(f"/api/v1/items/{item_id}", headers=auth_headers)
+    assert response.json()["title"] == "After"
+    response_cache.clear()
+
+def test_search_items(auth_headers):
+    """Test ranked prefix search with cursor pagination."""
+    client.post("/api/v1/items/bulk", json={"items": [
+        {"title": "Red bicycle", "description": "A fast road bike"},
+        {"title": "Blue kettle", "description": "Boils water"},
+        {"title": "Bike helmet", "description": "Red and sturdy"},
+        {"title": "Bicycle pump"},
+    ]}, headers=auth_headers)
+
+    response = client.get("/api/v1/items/search", params={"q": "bicyc"}, headers=auth_headers)
+    assert response.status_code == 200
+    titles = {item["title"] for item in response.json()["items"]}
+    assert titles == {"Red bicycle", "Bicycle pump"}
+
+    response = client.get("/api/v1/items/search", params={"q": "red bi"}, headers=auth_headers)
+    titles = {item["title"] for item in response.json()["items"]}
+    assert titles == {"Red bicycle", "Bike helmet"}
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        page = client.get(
+            "/api/v1/items/search",
+            params={"q": "b", "limit": 1, "cursor": cursor},
+            headers=auth_headers
+        ).json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+    assert sorted(seen) == [1, 2, 3, 4]
+
+    client.put("/api/v1/items/2", json={"title": "Green teapot"}, headers=auth_headers)
+    client.delete("/api/v1/items/1", headers=auth_headers)
+    response = client.get("/api/v1/items/search", params={"q": "teapot"}, headers=auth_headers)
+    assert [item["id"] for item in response.json()["items"]] == [2]
+    response = client.get("/api/v1/items/search", params={"q": "bicycle"}, headers=auth_headers)
+    assert [item["id"] for item in response.json()["items"]] == [4]
+
+def test_metrics_endpoint(auth_headers):
+    """Test Prometheus metrics with templated routes and per-request DB counts."""
+    from py_api_framework.metrics import DB_QUERIES_PER_REQUEST, REQUESTS, instrument_engine
+
+    route = "/api/v1/items/{item_id}"
+    instrument_engine(async_engine.sync_engine)
+    ok_before = REQUESTS.value("GET", route, "200")
+    missing_before = REQUESTS.value("GET", route, "404")
+    db_before = DB_QUERIES_PER_REQUEST.count(route)
+
+    item_id = client.post("/api/v1/items/", json={"title": "Metered"}, headers=auth_headers).json()["id"]
+    client.get(f"/api/v1/items/{item_id}", headers=auth_headers)
+    client.get("/api/v1/items/999", headers=auth_headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert REQUESTS.value("GET", route, "200") == ok_before + 1
+    assert REQUESTS.value("GET", route, "404") == missing_before + 1
+    assert f'http_requests_total{{method="GET",route="{route}",status="200"}}' in body
+    assert f'http_request_duration_seconds_bucket{{method="GET",route="{route}",le="+Inf"}}' in body
+    assert f'/api/v1/items/{item_id}"' not in body
+    assert 'auth_operation_duration_seconds_count{operation="verify_password"}' in body
+    assert "password_hash_queued 0" in body
+    assert DB_QUERIES_PER_REQUEST.count(route) == db_before + 2
+
+def test_item_count_and_stats(auth_headers):
+    """Test that the maintained counters track single and bulk writes."""
+    client.post("/api/v1/items/", json={"title": "One"}, headers=auth_headers)
+    client.post(
+        "/api/v1/items/bulk",
+        json={"items": [{"title": f"Bulk {i}"} for i in range(3)]},
+        headers=auth_headers
+    )
+    response = client.get("/api/v1/items/count", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == {"count": 4}
+
+    item_id = client.get("/api/v1/items/my-items", headers=auth_headers).json()[0]["id"]
+    client.delete(f"/api/v1/items/{item_id}", headers=auth_headers)
+    assert client.get("/api/v1/items/count?mine=false", headers=auth_headers).json() == {"count": 3}
+
+    stats = client.get("/api/v1/items/stats", headers=auth_headers).json()
+    assert stats["total"] == 3
+    assert stats["owners"] == [{"owner_id": 1, "item_count": 3}]
+    assert sum(day["created"] for day in stats["created_per_day"]) == 4
+
+def test_list_include_total(auth_headers):
+    """Test the X-Total-Count header on list endpoints."""
+    for i in range(3):
+        client.post("/api/v1/items/", json={"title": f"Item {i}"}, headers=auth_headers)
+    response = client.get("/api/v1/items/my-items?limit=1&include_total=true", headers=auth_headers)
+    assert len(response.json()) == 1
+    assert response.headers["x-total-count"] == "3"
+    assert "x-total-count" not in client.get("/api/v1/items/", headers=auth_headers).headers
+
+def test_update_and_delete_forbidden_for_other_owner(auth_headers):
+    """Test that owner-scoped writes report 403 and leave the item untouched."""
+    item = client.post("/api/v1/items/", json={"title": "Mine"}, headers=auth_headers).json()
+    client.post("/api/v1/auth/register", json={
+        "username": "otheruser",
+        "email": "other@example.com",
+        "password": "otherpassword123"
+    })
+    login_response = client.post(
+        "/api/v1/auth/token", data={"username": "otheruser", "password": "otherpassword123"}
+    )
+    other_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    response = client.put(f"/api/v1/items/{item['id']}", json={"title": "Stolen"}, headers=other_headers)
+    assert response.status_code == 403
+    assert client.delete(f"/api/v1/items/{item['id']}", headers=other_headers).status_code == 403
+    response = client.get(f"/api/v1/items/{item['id']}", headers=auth_headers)
+    assert response.json()["title"] == "Mine"
+
+def test_update_item_sets_updated_at(auth_headers):
+    """Test that the single-statement update still stamps updated_at."""
+    item = client.post("/api/v1/items/", json={"title": "Original"}, headers=auth_headers).json()
+    assert item["updated_at"] is None
+    response = client.put(f"/api/v1/items/{item['id']}", json={"title": "Changed"}, headers=auth_headers)
+    assert response.json()["updated_at"] is not None
+    response = client.put(f"/api/v1/items/{item['id']}", json={}, headers=auth_headers)
+    assert response.json()["title"] == "Changed"
+
+def test_websocket_change_feed(auth_headers):
+    """Test that item writes reach a WebSocket subscriber, with resume."""
+    token = auth_headers["Authorization"].split()[1]
+    with client.websocket_connect(f"/api/v1/items/changes/ws?token={token}") as websocket:
+        item = client.post("/api/v1/items/", json={"title": "Live"}, headers=auth_headers).json()
+        created = websocket.receive_json()
+        assert created["type"] == "created" and created["item"]["id"] == item["id"]
+        client.put(f"/api/v1/items/{item['id']}", json={"title": "Edited"}, headers=auth_headers)
+        assert websocket.receive_json()["item"]["title"] == "Edited"
+        client.delete(f"/api/v1/items/{item['id']}", headers=auth_headers)
+        deleted = websocket.receive_json()
+        assert deleted["type"] == "deleted" and deleted["item"] == {"id": item["id"]}
+
+    resume = f"/api/v1/items/changes/ws?since={created['seq']}"
+    with client.websocket_connect(resume, headers=auth_headers) as websocket:
+        assert websocket.receive_json()["type"] == "updated"
+        assert websocket.receive_json()["type"] == "deleted"
+
+def test_websocket_change_feed_requires_auth():
+    """Test that unauthenticated WebSocket handshakes are rejected."""
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/api/v1/items/changes/ws?token=invalid"):
+            pass
+    assert exc_info.value.code == 1008
@@ -0,0 +1,68 @@
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from py_api_framework.database import build_async_engine
+from py_api_framework.profiling import (
+    ProfilingMiddleware,
+    RequestProfiler,
+    get_profiler,
+    instrument_engine,
+    router,
+)
+
+def make_client(tmp_path, profiler):
+    db_engine = build_async_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    instrument_engine(db_engine.sync_engine)
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        async with db_engine.connect() as conn:
+            value = (await conn.execute(text("SELECT 42"))).scalar()
+        deadline = time.perf_counter() + 0.02
+        while time.perf_counter() < deadline:
+            pass
+        return {"value": value}
+
+    app.include_router(router)
+    app.dependency_overrides[get_profiler] = lambda: profiler
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    return TestClient(app)
+
+def test_debug_header_captures_profile(tmp_path):
+    """Test that an authorized debug header captures stacks and SQL."""
+    profiler = RequestProfiler(token="secret", output_dir=str(tmp_path / "profiles"))
+    client = make_client(tmp_path, profiler)
+
+    assert "x-profile-id" not in client.get("/slow").headers
+    assert "x-profile-id" not in client.get("/slow", headers={"X-Debug-Profile": "wrong"}).headers
+
+    response = client.get("/slow", headers={"X-Debug-Profile": "secret"})
+    assert response.json() == {"value": 42}
+    profile_id = response.headers["x-profile-id"]
+    assert len(profiler.profiles) == 1
+
+    detail = client.get(f"/debug/profiles/{profile_id}", headers={"X-Debug-Profile": "secret"}).json()
+    assert detail["path"] == "/slow"
+    assert detail["status"] == 200
+    assert detail["samples"] > 0
+    assert [s["statement"] for s in detail["sql"]] == ["SELECT 42"]
+
+    collapsed = client.get(
+        f"/debug/profiles/{profile_id}/collapsed", headers={"X-Debug-Profile": "secret"}
+    ).text
+    assert "slow (test_profiling.py:" in collapsed
+    speedscope = client.get(
+        f"/debug/profiles/{profile_id}/speedscope", headers={"X-Debug-Profile": "secret"}
+    ).json()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+    assert sorted(p.suffix for p in (tmp_path / "profiles").iterdir()) == [".collapsed", ".json", ".json"]
+
+def test_profile_endpoints_require_token(tmp_path):
+    """Test that profiles are only served with the debug token."""
+    client = make_client(tmp_path, RequestProfiler(sample_rate=1.0))
+
+    assert "x-profile-id" in client.get("/slow").headers
+    assert client.get("/debug/profiles").status_code == 403
+    assert client.get("/debug/profiles", headers={"X-Debug-Profile": ""}).status_code == 403
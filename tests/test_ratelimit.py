@@ -0,0 +1,139 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+from py_api_framework import server
+from py_api_framework.config import settings
+from py_api_framework.ratelimit import (
+    MemoryCounterStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    RedisCounterStore,
+    parse_limit,
+)
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis.asyncio commands the store uses."""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        value = self.values.get(key)
+        return None if value is None else str(value).encode()
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+        self.ttls.pop(key, None)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+
+    def set(self, key, value, ex=None, nx=False):
+        self.commands.append(("set", key, value, ex, nx))
+
+    async def execute(self):
+        results = []
+        for command in self.commands:
+            if command[0] == "incr":
+                self.redis.values[command[1]] = self.redis.values.get(command[1], 0) + 1
+                results.append(self.redis.values[command[1]])
+            else:
+                _, key, value, ttl, nx = command
+                if nx and key in self.redis.values:
+                    results.append(None)
+                    continue
+                self.redis.values[key] = value
+                self.redis.ttls[key] = ttl
+                results.append(True)
+        return results
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_parse_limit():
+    """Test rate limit strings."""
+    assert parse_limit("5/minute") == (5, 60)
+    assert parse_limit("100/hours") == (100, 3600)
+    assert parse_limit("") is None
+
+def run_hits(store, clock, times):
+    limiter = RateLimiter(store, clock=clock)
+    results = []
+    for at in times:
+        clock.now = at
+        results.append(asyncio.run(limiter.hit("client", (3, 60))))
+    return results
+
+def test_sliding_window_memory_store():
+    """Test that the previous window's weight carries over and decays."""
+    clock = Clock(600.0)
+    # Three requests late in one window, then the next window starts
+    results = run_hits(MemoryCounterStore(), clock, [650, 655, 659, 661, 690, 719])
+    assert results[:3] == [None, None, None]
+    # At 661 the previous window still weighs 3 * 59/60, so one more is over
+    assert results[3] is not None
+    # At 690 it weighs 1.5; with 2 in the current window that is 3.5 > 3
+    assert results[4] is not None
+    # Near the end of the window the previous count has all but expired
+    assert results[5] is not None and results[5] <= 1
+
+def test_redis_store_matches_memory_store():
+    """Test that the Redis-protocol store enforces the same limits."""
+    times = [650, 655, 659, 661, 690, 719, 725]
+    redis = FakeRedis()
+    assert run_hits(RedisCounterStore(redis), Clock(0), times) == run_hits(
+        MemoryCounterStore(), Clock(0), times
+    )
+    assert set(redis.ttls.values()) == {120}
+
+def test_middleware_per_ip_limit(monkeypatch):
+    """Test the global per-IP limit with Retry-After."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_IP", "2/minute")
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_USER", "")
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(MemoryCounterStore()))
+    client = TestClient(app)
+    statuses = [client.get("/ping").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert int(client.get("/ping").headers["retry-after"]) >= 1
+
+def test_middleware_keys_on_forwarded_client_behind_trusted_proxy(monkeypatch):
+    """Test that clients behind a trusted proxy get their own per-IP buckets."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_IP", "1/minute")
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_USER", "")
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(MemoryCounterStore()))
+    config = server.build_config(forwarded_allow_ips="10.0.0.1")
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts=config.forwarded_allow_ips)
+
+    def statuses(proxy, clients):
+        client = TestClient(proxied, client=(proxy, 50000))
+        return [client.get("/ping", headers={"X-Forwarded-For": ip}).status_code for ip in clients]
+
+    assert statuses("10.0.0.1", ["203.0.113.1", "203.0.113.2", "203.0.113.1"]) == [200, 200, 429]
+    # An untrusted peer's header is ignored, so its clients share one bucket
+    assert statuses("10.0.0.2", ["203.0.113.3", "203.0.113.4"]) == [200, 429]
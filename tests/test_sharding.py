@@ -0,0 +1,206 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, func, insert, select
+from py_api_framework import database, sharding
+from py_api_framework.auth import token_cache, user_cache
+from py_api_framework.config import settings
+from py_api_framework.main import app
+from py_api_framework.models import Item, ItemDailyCount, ShardMove
+from py_api_framework.ratelimit import store as rate_limit_store
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    """A primary and two item shards as SQLite files, served without test overrides."""
+    asyncio.run(database.dispose_engines())
+    shards = [f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(2)]
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setattr(settings, "ITEM_SHARD_URLS", shards)
+    monkeypatch.setattr(settings, "AUTO_CREATE_SCHEMA", True)
+    monkeypatch.setattr(app, "dependency_overrides", {})
+    sharding.item_ids.reset()
+    with TestClient(app) as client:
+        yield client, shards
+    sharding.item_ids.reset()
+    user_cache.clear()
+    token_cache.clear()
+    rate_limit_store.clear()
+
+def signup(client, username):
+    password = "testpassword123"
+    client.post("/api/v1/auth/register", json={
+        "username": username, "email": f"{username}@example.com", "password": password
+    })
+    token = client.post("/api/v1/auth/token", data={"username": username, "password": password})
+    return {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+def owners_on(url):
+    db_engine = create_engine(url)
+    with db_engine.connect() as connection:
+        owners = set(connection.execute(select(Item.owner_id).distinct()).scalars())
+    db_engine.dispose()
+    return owners
+
+def test_jump_hash_is_consistent():
+    """Test that growing the cluster only moves keys onto the new bucket."""
+    before = [sharding.jump_hash(key, 4) for key in range(1000)]
+    after = [sharding.jump_hash(key, 5) for key in range(1000)]
+    assert set(before) == {0, 1, 2, 3}
+    moved = [key for key in range(1000) if before[key] != after[key]]
+    assert all(after[key] == 4 for key in moved)
+    assert 100 < len(moved) < 300
+
+def test_id_allocator_reserves_blocks():
+    """Test that ids come from blocks and a large request spans a fresh one."""
+    async def scenario():
+        allocator = sharding.IdAllocator("items", block_size=3)
+        reserved = []
+
+        async def reserve(count):
+            reserved.append(count)
+            allocator._next, allocator._end = sum(reserved[:-1]) + 1, sum(reserved) + 1
+
+        allocator._reserve = reserve
+        assert await allocator.allocate(2) == [1, 2]
+        assert await allocator.allocate(2) == [3, 4]
+        assert await allocator.allocate(5) == [5, 6, 7, 8, 9]
+        assert reserved == [3, 3, 3]
+        return allocator
+
+    allocator = asyncio.run(scenario())
+    # A later event loop (another worker or TestClient) gets its own lock
+    assert asyncio.run(allocator.allocate(1)) == [10]
+
+def test_items_live_on_owner_shard(cluster):
+    """Test placement, global reads merged across shards, and ownership checks."""
+    client, shards = cluster
+    users = {name: signup(client, name) for name in ("alice", "bob", "carol", "dave")}
+    ids = {}
+    for name, headers in users.items():
+        response = client.post("/api/v1/items/bulk", headers=headers, json={
+            "items": [{"title": f"{name} {index}"} for index in range(3)]
+        })
+        ids[name] = [result["id"] for result in response.json()["results"]]
+    owner_ids = {
+        name: client.get("/api/v1/auth/me", headers=headers).json()["id"]
+        for name, headers in users.items()
+    }
+
+    for index, url in enumerate(shards):
+        expected = {owner for owner in owner_ids.values() if sharding.shard_index(owner) == index}
+        assert owners_on(url) == expected
+    all_ids = sorted(item_id for item_ids in ids.values() for item_id in item_ids)
+    assert len(set(all_ids)) == 12
+
+    alice = users["alice"]
+    mine = client.get("/api/v1/items/my-items", headers=alice).json()
+    assert [item["id"] for item in mine] == ids["alice"]
+
+    first = client.get("/api/v1/items/?cursor=&limit=5", headers=alice).json()
+    second = client.get(
+        f"/api/v1/items/?cursor={first['next_cursor']}&limit=10", headers=alice
+    ).json()
+    assert [item["id"] for item in first["items"] + second["items"]] == all_ids
+    assert second["next_cursor"] is None
+    offset = client.get("/api/v1/items/?skip=4&limit=4&include_total=true", headers=alice)
+    assert [item["id"] for item in offset.json()] == all_ids[4:8]
+    assert offset.headers["X-Total-Count"] == "12"
+
+    bobs = ids["bob"][0]
+    assert client.get(f"/api/v1/items/{bobs}", headers=alice).json()["title"] == "bob 0"
+    response = client.put(f"/api/v1/items/{bobs}", headers=alice, json={"title": "mine"})
+    assert response.status_code == 403
+    response = client.request("DELETE", "/api/v1/items/bulk", headers=alice, json={
+        "ids": [ids["alice"][0], bobs, 999999]
+    })
+    assert [result["status"] for result in response.json()["results"]] == [200, 403, 404]
+
+    found = client.get("/api/v1/items/search?q=carol", headers=alice).json()
+    assert sorted(item["id"] for item in found["items"]) == ids["carol"]
+    stats = client.get("/api/v1/items/stats", headers=alice).json()
+    assert stats["total"] == 11
+    assert sum(day["created"] for day in stats["created_per_day"]) == 12
+
+def test_owner_refused_while_moving(cluster):
+    """Test that a fenced owner gets 503 on writes and own-item reads, not global reads."""
+    client, _ = cluster
+    headers = signup(client, "alice")
+    owner_id = client.get("/api/v1/auth/me", headers=headers).json()["id"]
+    assert client.post("/api/v1/items/", headers=headers, json={"title": "moving"}).status_code == 200
+    with database.get_engines().engine.begin() as connection:
+        connection.execute(insert(ShardMove).values(owner_id=owner_id))
+
+    response = client.post("/api/v1/items/", headers=headers, json={"title": "blocked"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(sharding.MOVE_RETRY_AFTER_SECONDS)
+    for path in ("my-items", "search?q=moving&mine=true", "export", "count"):
+        response = client.get(f"/api/v1/items/{path}", headers=headers)
+        assert response.status_code == 503, path
+    assert len(client.get("/api/v1/items/", headers=headers).json()) == 1
+
+def test_rebalance_moves_owners_to_new_shard(cluster, tmp_path):
+    """Test that adding a shard and rebalancing keeps every item reachable."""
+    client, shards = cluster
+    users = {f"user{index}": signup(client, f"user{index}") for index in range(8)}
+    created = {
+        client.get("/api/v1/auth/me", headers=headers).json()["id"]:
+        client.post("/api/v1/items/", headers=headers, json={"title": "thing"}).json()
+        for headers in users.values()
+    }
+
+    grown = shards + [f"sqlite:///{tmp_path / 'shard2.db'}"]
+    sharding.init_shards(database.get_engines().engine, grown)
+    # Leftovers of an interrupted run: a fenced owner with an outdated copy on the target
+    mover = next(owner for owner in created if sharding.shard_index(owner, 3) == 2)
+    stale = {**created[mover], "title": "stale", "created_at": None, "updated_at": None}
+    db_engine = create_engine(grown[2])
+    with db_engine.begin() as connection:
+        connection.execute(insert(Item), [stale])
+        # A batch cancels the creation its copies count on the target
+        connection.execute(delete(ItemDailyCount))
+    db_engine.dispose()
+    with database.get_engines().engine.begin() as connection:
+        connection.execute(insert(ShardMove).values(owner_id=mover))
+
+    totals = sharding.rebalance(grown, report=lambda line: None, fence_seconds=0)
+    assert totals["owners"] == len(owners_on(grown[2])) > 0
+    for index, url in enumerate(grown):
+        assert all(sharding.shard_index(owner, 3) == index for owner in owners_on(url))
+    with database.get_engines().engine.connect() as connection:
+        assert connection.execute(select(ShardMove.owner_id)).first() is None
+    db_engine = create_engine(grown[2])
+    with db_engine.connect() as connection:
+        title = connection.execute(select(Item.title).where(Item.id == created[mover]["id"])).scalar()
+    db_engine.dispose()
+    assert title == "thing"
+
+    db_engine = create_engine(grown[2])
+    with db_engine.connect() as connection:
+        created = connection.execute(select(func.sum(ItemDailyCount.created))).scalar()
+    db_engine.dispose()
+    assert created == totals["items"]
+
+def test_rebalance_fences_owners_in_batches(cluster, tmp_path, monkeypatch):
+    """Test that the fence wait happens once per batch of owners, not per owner."""
+    client, shards = cluster
+    for index in range(6):
+        headers = signup(client, f"user{index}")
+        client.post("/api/v1/items/", headers=headers, json={"title": "thing"})
+    moving = [len(owners_on(url)) for url in shards]
+    fenced = []
+
+    def sleep(seconds):
+        with database.get_engines().engine.connect() as connection:
+            fenced.append(connection.execute(select(func.count()).select_from(ShardMove)).scalar())
+
+    monkeypatch.setattr(sharding.time, "sleep", sleep)
+    # Drain both shards into a new one, so every owner moves
+    target = [f"sqlite:///{tmp_path / 'merged.db'}"]
+    sharding.init_shards(database.get_engines().engine, target)
+    totals = sharding.rebalance(target, shards, report=lambda line: None, owner_batch_size=2)
+    assert totals["owners"] == 6
+    assert len(fenced) == sum((count + 1) // 2 for count in moving) < 6
+    assert all(1 <= count <= 2 for count in fenced)
+    assert len(owners_on(target[0])) == 6
+    with database.get_engines().engine.connect() as connection:
+        assert connection.execute(select(ShardMove.owner_id)).first() is None
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+from py_api_framework import database
+from py_api_framework.config import settings
+from py_api_framework.main import app
+
+def test_import_does_not_touch_database(tmp_path):
+    """Test that importing the app builds no engines and creates no tables."""
+    code = (
+        "import py_api_framework.main, py_api_framework.database as d; "
+        "print(d._engines is None)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True, cwd=tmp_path,
+        env={
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp_path / 'lazy.db'}",
+            "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        },
+    )
+    assert result.stdout.strip() == "True"
+    assert not (tmp_path / "lazy.db").exists()
+
+def test_lifespan_creates_schema_warms_up_and_reports(tmp_path, monkeypatch):
+    """Test the lifespan with schema auto-creation and background warm-up."""
+    asyncio.run(database.dispose_engines())
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{tmp_path / 'startup.db'}")
+    monkeypatch.setattr(settings, "AUTO_CREATE_SCHEMA", True)
+
+    with TestClient(app) as client:
+        assert {"users", "items"} <= set(inspect(database.engine).get_table_names())
+        deadline = time.monotonic() + 10
+        report = client.get("/health/startup").json()
+        while report["warmup_seconds"] is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            report = client.get("/health/startup").json()
+        assert report["schema_seconds"] is not None
+        assert report["startup_seconds"] < 1
+        assert report["warm_connections"] == settings.DB_WARM_CONNECTIONS
+        assert report["warmup_error"] is None
+
+    assert database._engines is None